@@ -30,7 +30,7 @@ from django.utils.safestring import mark_safe
 
 # Django REST Framework
 from rest_framework.authentication import get_authorization_header
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import ParseError, PermissionDenied
 from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework.request import clone_request
@@ -39,6 +39,8 @@ from rest_framework import views
 
 # local
 from galaxy.api.access import check_user_access
+from galaxy.api.filters import FieldLookupBackend
+from galaxy.api.pagination import CountingPaginator, CursorPaginator
 from galaxy.api.utils import get_object_or_400, camelcase_to_underscore
 
 # FIXME: machinery for auto-adding audit trail logs to all CREATE/EDITS
@@ -132,6 +134,14 @@ class GenericAPIView(generics.GenericAPIView, APIView):
     #   model = ModelClass
     #   serializer_class = SerializerClass
 
+    # Ordering used when a client asks for cursor pagination by passing
+    # ?cursor= (empty for the first page). The primary key is appended
+    # unless a unique field or unique_together covers it. Cursor pages
+    # can not be combined with ?order_by=.
+    cursor_ordering = ('id',)
+
+    paginator_class = CountingPaginator
+
     def get_queryset(self):
         qs = self.model.objects.all().distinct()
         if hasattr(self.model, "is_active"):
@@ -139,6 +149,17 @@ class GenericAPIView(generics.GenericAPIView, APIView):
         else:
             return qs.filter(active=True)
 
+    def filter_queryset(self, queryset):
+        queryset = super(GenericAPIView, self).filter_queryset(queryset)
+        return self.setup_queryset(queryset)
+
+    def setup_queryset(self, queryset):
+        # load what the serializer reads, see BaseSerializer.setup_queryset
+        serializer_class = self.get_serializer_class()
+        if hasattr(queryset, 'model') and hasattr(serializer_class, 'setup_queryset'):
+            queryset = serializer_class.setup_queryset(queryset, request=self.request)
+        return queryset
+
     def get_description_context(self):
         # Set instance attributes needed to get serializer metadata.
         if not hasattr(self, 'request'):
@@ -196,6 +217,9 @@ class GenericAPIView(generics.GenericAPIView, APIView):
             ret['search_fields'] = self.search_fields
         return ret
 
+    def is_filtered(self):
+        return any(key not in FieldLookupBackend.RESERVED_NAMES for key in self.request.QUERY_PARAMS)
+
     def paginate_queryset(self, queryset, page_size=None):
         """
         Paginate a queryset if required, either returning a page object,
@@ -224,8 +248,25 @@ class GenericAPIView(generics.GenericAPIView, APIView):
         #          PendingDeprecationWarning, stacklevel=2
         #      )
 
+        cursor = self.request.QUERY_PARAMS.get('cursor')
+        if cursor is not None and self.cursor_ordering:
+            if any(key in self.request.QUERY_PARAMS for key in ('order', 'order_by')):
+                # the cursor holds a key of cursor_ordering, not of the requested order
+                raise ParseError('order_by can not be combined with cursor')
+            # keyset pagination, the total count is only run on request
+            with_count = self.request.QUERY_PARAMS.get('count', '').lower() in ('1', 'true')
+            paginator = CursorPaginator(queryset, page_size, self.cursor_ordering, with_count=with_count)
+            try:
+                page = paginator.page(cursor)
+            except InvalidPage as e:
+                raise Http404('Invalid cursor: %s' % str(e))
+            if deprecated_style:
+                return (paginator, page, page.object_list, page.has_other_pages())
+            return page
+
         paginator = self.paginator_class(queryset, page_size,
-                                         allow_empty_first_page=True)
+                                         allow_empty_first_page=True,
+                                         cache_count=not self.is_filtered())
         page_kwarg = self.kwargs.get(self.page_kwarg)
         page_query_param = self.request.QUERY_PARAMS.get(self.page_kwarg)
         page = page_kwarg or page_query_param or 1
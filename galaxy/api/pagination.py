@@ -15,22 +15,262 @@
 # You should have received a copy of the Apache License
 # along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
 
+import base64
+import hashlib
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.functional import cached_property
+
 # Django REST Framework
 from rest_framework import serializers, pagination
 from rest_framework.templatetags.rest_framework import replace_query_param
 
 
+class CountingPaginator(Paginator):
+    '''
+    Paginator that avoids an exact COUNT(*) where it can. Counts of
+    unfiltered lists are cached for API_COUNT_CACHE_TIMEOUT seconds. Other
+    lists take the Postgres planner's row estimate once it reaches
+    API_COUNT_ESTIMATE_THRESHOLD, and set count_is_approximate. Small
+    filtered lists are counted exactly.
+    '''
+
+    def __init__(self, object_list, per_page, cache_count=False, **kwargs):
+        super(CountingPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.cache_count = cache_count
+        self.count_is_approximate = False
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = self._compute_count()
+        return self._count
+    count = property(_get_count)
+
+    def _compute_count(self):
+        if not hasattr(self.object_list, 'query'):
+            return len(self.object_list)
+        queryset = self.object_list.order_by()
+        if self.cache_count:
+            key = 'api_count_%s' % hashlib.sha1(unicode(queryset.query).encode('utf-8')).hexdigest()
+            count = django_cache.get(key)
+            if count is None:
+                count = queryset.count()
+                django_cache.set(key, count, settings.API_COUNT_CACHE_TIMEOUT)
+            return count
+        estimate = self.estimate_count(queryset)
+        if estimate is not None and estimate >= settings.API_COUNT_ESTIMATE_THRESHOLD:
+            self.count_is_approximate = True
+            return estimate
+        return queryset.count()
+
+    @staticmethod
+    def estimate_count(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, basestring):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def validate_number(self, number):
+        # counting decides count_is_approximate
+        self.count
+        if not self.count_is_approximate:
+            return super(CountingPaginator, self).validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage('That page number is not an integer')
+        if number < 1:
+            raise InvalidPage('That page number is less than 1')
+        # the estimate may be short, so pages past it can still exist
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_approximate:
+            return super(CountingPaginator, self).page(number)
+        bottom = (number - 1) * self.per_page
+        # one extra row tells whether there is a next page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        return ApproximatePage(object_list[:self.per_page], number, self,
+                               len(object_list) > self.per_page)
+
+
+class ApproximatePage(Page):
+    '''A page of CountingPaginator whose neighbours do not depend on the count.'''
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super(ApproximatePage, self).__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CursorPaginator(object):
+    '''
+    Keyset paginator. A page starts right after the ordering key of the last
+    object of the previous page instead of at an OFFSET, so every page costs
+    the same however deep into the list it is. Pages are addressed by
+    opaque cursors rather than numbers, and the total count is only run
+    when asked for.
+    '''
+
+    count_is_approximate = False
+
+    def __init__(self, queryset, per_page, ordering, with_count=False):
+        ordering = tuple(ordering)
+        if not self.is_unique(queryset.model, ordering):
+            # make the key unique so no object falls between two pages
+            ordering += ('pk',)
+        if queryset.query.distinct and len(queryset.query.alias_map) <= 1:
+            # without joins no row can repeat, and DISTINCT would keep the
+            # database from walking the ordering index
+            queryset = queryset._clone()
+            queryset.query.distinct = False
+        self.ordering = ordering
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = per_page
+        self.with_count = with_count
+
+    @staticmethod
+    def is_unique(model, ordering):
+        names = set(field.lstrip('-') for field in ordering)
+        if names & set(['pk', model._meta.pk.name]):
+            return True
+        for name in names:
+            try:
+                if model._meta.get_field(name).unique:
+                    return True
+            except FieldDoesNotExist:
+                pass
+        return any(names.issuperset(fields) for fields in model._meta.unique_together)
+
+    @cached_property
+    def count(self):
+        return self.queryset.count() if self.with_count else None
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return int(math.ceil(max(1, self.count) / float(self.per_page)))
+
+    def encode_cursor(self, obj, reverse=False):
+        key = [getattr(obj, field.lstrip('-')) for field in self.ordering]
+        return base64.urlsafe_b64encode(json.dumps({'key': key, 'reverse': reverse}, cls=DjangoJSONEncoder))
+
+    def decode_cursor(self, cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            key, reverse = data['key'], data['reverse']
+        except (TypeError, ValueError, KeyError):
+            raise InvalidPage('Invalid cursor')
+        if not isinstance(key, list) or len(key) != len(self.ordering) \
+                or not all(isinstance(value, (basestring, int, long, float)) for value in key):
+            raise InvalidPage('Invalid cursor')
+        return key, bool(reverse)
+
+    def after(self, key, reverse=False):
+        '''
+        Filter matching the objects that sort after key: greater on the first
+        field, or equal on it and greater on the next, and so on. With
+        reverse, the objects that sort before key.
+        '''
+        query = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = '%s__%s' % (name, 'lt' if field.startswith('-') != reverse else 'gt')
+            term = Q(**{lookup: key[i]})
+            for previous, value in zip(self.ordering[:i], key[:i]):
+                term &= Q(**{previous.lstrip('-'): value})
+            query |= term
+        return query
+
+    def page(self, cursor=None):
+        if not cursor:
+            key, reverse = None, False
+        else:
+            key, reverse = self.decode_cursor(cursor)
+        queryset = self.queryset
+        if reverse:
+            queryset = queryset.reverse()
+        if key is not None:
+            queryset = queryset.filter(self.after(key, reverse))
+        # one extra row tells whether there is a page beyond this one
+        object_list = list(queryset[:self.per_page + 1])
+        more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if reverse:
+            object_list.reverse()
+            # walking back, the page the cursor came from follows
+            has_next, has_previous = True, more
+        else:
+            # a cursor starts after an object, so there is one before
+            has_next, has_previous = more, key is not None
+        next_cursor = previous_cursor = None
+        if object_list:
+            if has_next:
+                next_cursor = self.encode_cursor(object_list[-1])
+            if has_previous:
+                previous_cursor = self.encode_cursor(object_list[0], reverse=True)
+        return CursorPage(object_list, self, next_cursor, previous_cursor)
+
+
+class CursorPage(object):
+    '''A page of CursorPaginator, read by PaginationSerializer like a Django Page.'''
+
+    number = None
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def cursor_link(url, cursor):
+    return replace_query_param(url, 'cursor', cursor)
+
+
 class NextPageField(pagination.NextPageField):
     '''Pagination field to output URL path.'''
 
     def to_representation(self, value):
         if not value.has_next():
             return None
-        page = value.next_page_number()
         request = self.context.get('request')
         url = request and request.get_full_path() or ''
         # remove /api/v1 so ansible-galaxy pagination works
         url = url.replace('/api/v1', '')
+        if isinstance(value, CursorPage):
+            return cursor_link(url, value.next_cursor)
+        page = value.next_page_number()
         return replace_query_param(url, self.page_field, page)
 
 
@@ -40,11 +280,13 @@ class PreviousPageField(pagination.NextPageField):
     def to_representation(self, value):
         if not value.has_previous():
             return None
-        page = value.previous_page_number()
         request = self.context.get('request')
         url = request and request.get_full_path() or ''
         # remove /api/v1 so ansible-galaxy pagination works
         url = url.replace('/api/v1', '')
+        if isinstance(value, CursorPage):
+            return cursor_link(url, value.previous_cursor)
+        page = value.previous_page_number()
         return replace_query_param(url, self.page_field, page)
 
 
@@ -54,9 +296,11 @@ class NextLinkField(pagination.NextPageField):
     def to_representation(self, value):
         if not value.has_next():
             return None
-        page = value.next_page_number()
         request = self.context.get('request')
         url = request and request.get_full_path() or ''
+        if isinstance(value, CursorPage):
+            return cursor_link(url, value.next_cursor)
+        page = value.next_page_number()
         return replace_query_param(url, self.page_field, page)
 
 
@@ -66,9 +310,11 @@ class PreviousLinkField(pagination.NextPageField):
     def to_representation(self, value):
         if not value.has_previous():
             return None
-        page = value.previous_page_number()
         request = self.context.get('request')
         url = request and request.get_full_path() or ''
+        if isinstance(value, CursorPage):
+            return cursor_link(url, value.previous_cursor)
+        page = value.previous_page_number()
         return replace_query_param(url, self.page_field, page)
 
 
@@ -76,9 +322,13 @@ class PaginationSerializer(pagination.BasePaginationSerializer):
     '''Custom pagination serializer to output only URL path (without host/port).'''
 
     count = serializers.ReadOnlyField(source='paginator.count')
+    count_is_approximate = serializers.SerializerMethodField()
     cur_page = serializers.ReadOnlyField(source='number')
     num_pages = serializers.ReadOnlyField(source='paginator.num_pages')
     next_link = NextLinkField(source='*')
     previous_link = PreviousLinkField(source='*')
     next = NextPageField(source='*')
     previous = PreviousPageField(source='*')
+
+    def get_count_is_approximate(self, page):
+        return getattr(page.paginator, 'count_is_approximate', False)
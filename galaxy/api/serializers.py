@@ -23,7 +23,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.urlresolvers import reverse
+from django.db.models.fields import FieldDoesNotExist
 from collections import OrderedDict
 
 
@@ -32,7 +32,7 @@ from drf_haystack.serializers import HaystackSerializer
 
 # galaxy
 from galaxy.main.search_indexes import RoleIndex
-from galaxy.api.utils import html_decode
+from galaxy.api.utils import api_url, html_decode
 from galaxy.main.models import (Platform,
                                 CloudPlatform,
                                 Category,
@@ -127,10 +127,40 @@ class BaseSerializer(serializers.ModelSerializer):
     modified = serializers.SerializerMethodField()
     active = serializers.SerializerMethodField()
 
+    # relations read while serializing, loaded up front by setup_queryset()
+    select_related = ()
+    prefetch_related = ()
+
     def __init__(self, *args, **kwargs):
         super(BaseSerializer, self).__init__(*args, **kwargs)
         self.Meta.fields = ('url', 'related', 'summary_fields') + self.Meta.fields + ('created', 'modified', 'active')
 
+    @classmethod
+    def setup_queryset(cls, queryset, request=None):
+        '''
+        Load the relations the serializer reads with select_related and
+        prefetch_related, so a page costs the same number of queries
+        whatever its size. The foreign keys of SUMMARIZABLE_FK_FIELDS are
+        always included. Querysets of values() are returned as they are,
+        related columns would join their GROUP BY.
+        '''
+        if getattr(queryset, '_fields', None) is not None:
+            return queryset
+        opts = queryset.model._meta
+        select = list(cls.select_related)
+        for name in SUMMARIZABLE_FK_FIELDS:
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.many_to_one and name not in select:
+                select.append(name)
+        if select:
+            queryset = queryset.select_related(*select)
+        if cls.prefetch_related:
+            queryset = queryset.prefetch_related(*cls.prefetch_related)
+        return queryset
+
     def get_fields(self):
         # opts = get_concrete_model(self.Meta.model)._meta
         opts = self.Meta.model._meta.concrete_model._meta
@@ -159,7 +189,7 @@ class BaseSerializer(serializers.ModelSerializer):
         if obj is None or isinstance(obj, AnonymousUser):
             return ''
         elif isinstance(obj, User):
-            return reverse('api:user_detail', args=(obj.pk,))
+            return api_url('api:user_detail', obj.pk)
         else:
             try:
                 return obj.get_absolute_url()
@@ -169,7 +199,7 @@ class BaseSerializer(serializers.ModelSerializer):
     def get_related(self, obj):
         res = OrderedDict()
         if getattr(obj, 'owner', None):
-            res['owner'] = reverse('api:user_detail', args=(obj.owner.pk,))
+            res['owner'] = api_url('api:user_detail', obj.owner.pk)
         return res
 
     def get_summary_fields(self, obj):
@@ -267,10 +297,10 @@ class UserListSerializer(BaseSerializer):
             return {}
         res = super(UserListSerializer, self).get_related(obj)
         res.update(dict(
-            subscriptions=reverse('api:user_subscription_list', args=(obj.pk,)),
-            starred=reverse('api:user_starred_list', args=(obj.pk,)),
-            repositories=reverse('api:user_repositories_list', args=(obj.pk,)),
-            secrets=reverse('api:user_notification_secret_list', args=(obj.pk,)),
+            subscriptions=api_url('api:user_subscription_list', obj.pk),
+            starred=api_url('api:user_starred_list', obj.pk),
+            repositories=api_url('api:user_repositories_list', obj.pk),
+            secrets=api_url('api:user_notification_secret_list', obj.pk),
         ))
         return res
 
@@ -354,10 +384,10 @@ class UserDetailSerializer(BaseSerializer):
             return {}
         res = super(UserDetailSerializer, self).get_related(obj)
         res.update(dict(
-            repositories=reverse('api:user_repositories_list', args=(obj.pk,)),
-            subscriptions=reverse('api:user_subscription_list', args=(obj.pk,)),
-            starred=reverse('api:user_starred_list', args=(obj.pk,)),
-            secrets=reverse('api:user_notification_secret_list', args=(obj.pk,)),
+            repositories=api_url('api:user_repositories_list', obj.pk),
+            subscriptions=api_url('api:user_subscription_list', obj.pk),
+            starred=api_url('api:user_starred_list', obj.pk),
+            secrets=api_url('api:user_notification_secret_list', obj.pk),
         ))
         return res
 
@@ -397,7 +427,7 @@ class SubscriptionSerializer(BaseSerializer):
         if obj is None:
             return ''
         elif isinstance(obj, Subscription):
-            return reverse('api:subscription_detail', args=(obj.pk,))
+            return api_url('api:subscription_detail', obj.pk)
         else:
             return obj.get_absolute_url()
 
@@ -420,7 +450,7 @@ class StargazerSerializer(BaseSerializer):
         if obj is None:
             return ''
         elif isinstance(obj, Stargazer):
-            return reverse('api:stargazer_detail', args=(obj.pk,))
+            return api_url('api:stargazer_detail', obj.pk)
         else:
             return obj.get_absolute_url()
 
@@ -464,7 +494,7 @@ class RepositorySerializer(BaseSerializer):
         if obj is None:
             return ''
         elif isinstance(obj, Repository):
-            return reverse('api:repository_detail', args=(obj.pk,))
+            return api_url('api:repository_detail', obj.pk)
         else:
             return obj.get_absolute_url()
 
@@ -473,7 +503,7 @@ class RepositorySerializer(BaseSerializer):
             return {}
         res = super(RepositorySerializer, self).get_related(obj)
         res.update(dict(
-            owner=reverse('api:user_detail', args=(obj.owner.id,)),
+            owner=api_url('api:user_detail', obj.owner.id),
         ))
         return res
 
@@ -536,7 +566,7 @@ class NotificationSecretSerializer(BaseSerializer):
         if obj is None:
             return ''
         elif isinstance(obj, NotificationSecret):
-            return reverse('api:notification_secret_detail', args=(obj.pk,))
+            return api_url('api:notification_secret_detail', obj.pk)
         else:
             return obj.get_absolute_url()
 
@@ -572,7 +602,7 @@ class NotificationSerializer(BaseSerializer):
         if obj is None:
             return ''
         elif isinstance(obj, Notification):
-            return reverse('api:notification_detail', args=(obj.pk,))
+            return api_url('api:notification_detail', obj.pk)
         else:
             return obj.get_absolute_url()
 
@@ -599,9 +629,9 @@ class NotificationSerializer(BaseSerializer):
             return {}
         res = super(NotificationSerializer, self).get_related(obj)
         res.update(dict(
-            roles=reverse('api:notification_roles_list', args=(obj.pk,)),
-            imports=reverse('api:notification_imports_list', args=(obj.pk,)),
-            owner=reverse('api:user_detail', args=(obj.owner.id,)),
+            roles=api_url('api:notification_roles_list', obj.pk),
+            imports=api_url('api:notification_imports_list', obj.pk),
+            owner=api_url('api:user_detail', obj.owner.id),
         ))
         return res
 
@@ -633,7 +663,8 @@ class ImportTaskSerializer(BaseSerializer):
             'commit_message',
             'commit_url',
             'travis_status_url',
-            'travis_build_url'
+            'travis_build_url',
+            'force'
         )
 
     def to_native(self, obj):
@@ -644,7 +675,7 @@ class ImportTaskSerializer(BaseSerializer):
         if obj is None:
             return ''
         elif isinstance(obj, ImportTask):
-            return reverse('api:import_task_detail', args=(obj.pk,))
+            return api_url('api:import_task_detail', obj.pk)
         else:
             return obj.get_absolute_url()
 
@@ -653,8 +684,8 @@ class ImportTaskSerializer(BaseSerializer):
             return {}
         res = super(ImportTaskSerializer, self).get_related(obj)
         res.update(dict(
-            role=reverse('api:role_detail', args=(obj.role_id,)),
-            notifications=reverse('api:import_task_notification_list', args=(obj.pk,)),
+            role=api_url('api:role_detail', obj.role_id),
+            notifications=api_url('api:import_task_notification_list', obj.pk),
         ))
         return res
 
@@ -683,6 +714,13 @@ class ImportTaskSerializer(BaseSerializer):
             ('message_type', g.message_type),
             ('message_text', g.message_text)
         ]) for g in obj.messages.all().order_by('id')]
+
+        d['stages'] = [OrderedDict([
+            ('name', stage.name),
+            ('duration', stage.duration),
+            ('query_count', stage.query_count),
+            ('github_request_count', stage.github_request_count)
+        ]) for stage in obj.stages.all()]
         return d
 
 
@@ -733,7 +771,7 @@ class ImportTaskLatestSerializer(BaseSerializer):
         if obj is None:
             return ''
         else:
-            return reverse('api:import_task_detail', args=(obj['last_id'],))
+            return api_url('api:import_task_detail', obj['last_id'])
 
     def get_id(self, obj):
         return obj['last_id']
@@ -742,9 +780,53 @@ class ImportTaskLatestSerializer(BaseSerializer):
         return obj['owner_id']
 
 
-class RoleListSerializer(BaseSerializer):
+class FieldSelectionMixin(object):
+    '''
+    Serializer mixin sending only the fields named in the comma separated
+    fields= query parameter of a GET request, less those named in exclude=.
+    '''
+
+    # large columns, each mapped to the output fields that read it. They are
+    # deferred by setup_queryset() when none of those fields is sent.
+    deferrable_columns = {}
+
+    @classmethod
+    def select_fields(cls, names, request):
+        params = request.query_params if request is not None and request.method == 'GET' else {}
+        only = set(name for name in params.get('fields', '').split(',') if name)
+        exclude = set(name for name in params.get('exclude', '').split(',') if name)
+        return [name for name in names if (not only or name in only) and name not in exclude]
+
+    @classmethod
+    def setup_queryset(cls, queryset, request=None):
+        if cls.deferrable_columns:
+            sent = set(cls.select_fields(cls.Meta.fields, request))
+            deferred = [column for column, readers in cls.deferrable_columns.items() if not sent & set(readers)]
+            if deferred:
+                queryset = queryset.defer(*deferred)
+        return super(FieldSelectionMixin, cls).setup_queryset(queryset, request=request)
+
+    def get_fields(self):
+        ret = super(FieldSelectionMixin, self).get_fields()
+        selected = self.select_fields(ret.keys(), self.context.get('request'))
+        return OrderedDict((key, field) for key, field in ret.items() if key in selected)
+
+
+# Role text columns that can be hundreds of KB, and the fields reading them.
+# readme_html falls back to rendering readme when it is empty.
+ROLE_TEXT_COLUMNS = {
+    'readme': ('readme', 'readme_html'),
+    'readme_html': ('readme_html',),
+    'container_yml': (),
+}
+
+
+class RoleListSerializer(FieldSelectionMixin, BaseSerializer):
     readme_html = serializers.SerializerMethodField()
 
+    prefetch_related = ('dependencies', 'platforms', 'tags', 'versions', 'videos')
+    deferrable_columns = ROLE_TEXT_COLUMNS
+
     class Meta:
         model = Role
         fields = BASE_FIELDS + ('role_type', 'namespace', 'is_valid', 'github_user', 'github_repo',
@@ -763,10 +845,10 @@ class RoleListSerializer(BaseSerializer):
             return {}
         res = super(RoleListSerializer, self).get_related(obj)
         res.update(dict(
-            dependencies=reverse('api:role_dependencies_list', args=(obj.pk,)),
-            imports=reverse('api:role_import_task_list', args=(obj.pk,)),
-            versions=reverse('api:role_versions_list', args=(obj.pk,)),
-            notifications=reverse('api:role_notification_list', args=(obj.pk,)),
+            dependencies=api_url('api:role_dependencies_list', obj.pk),
+            imports=api_url('api:role_import_task_list', obj.pk),
+            versions=api_url('api:role_versions_list', obj.pk),
+            notifications=api_url('api:role_notification_list', obj.pk),
         ))
         return res
 
@@ -774,7 +856,7 @@ class RoleListSerializer(BaseSerializer):
         if obj is None:
             return ''
         elif isinstance(obj, Role):
-            return reverse('api:role_detail', args=(obj.pk,))
+            return api_url('api:role_detail', obj.pk)
         else:
             return obj.get_absolute_url()
 
@@ -815,9 +897,9 @@ class RoleTopSerializer(BaseSerializer):
             return {}
         res = super(RoleTopSerializer, self).get_related(obj)
         res.update(dict(
-            dependencies=reverse('api:role_dependencies_list', args=(obj.pk,)),
-            imports=reverse('api:role_import_task_list', args=(obj.pk,)),
-            versions=reverse('api:role_versions_list', args=(obj.pk,)),
+            dependencies=api_url('api:role_dependencies_list', obj.pk),
+            imports=api_url('api:role_import_task_list', obj.pk),
+            versions=api_url('api:role_versions_list', obj.pk),
         ))
         return res
 
@@ -825,15 +907,18 @@ class RoleTopSerializer(BaseSerializer):
         if obj is None:
             return ''
         elif isinstance(obj, Role):
-            return reverse('api:role_detail', args=(obj.pk,))
+            return api_url('api:role_detail', obj.pk)
         else:
             return obj.get_absolute_url()
 
 
-class RoleDetailSerializer(BaseSerializer):
+class RoleDetailSerializer(FieldSelectionMixin, BaseSerializer):
     readme_html = serializers.SerializerMethodField()
     tags = serializers.SerializerMethodField()
 
+    prefetch_related = ('dependencies', 'platforms', 'tags', 'versions', 'videos')
+    deferrable_columns = ROLE_TEXT_COLUMNS
+
     class Meta:
         model = Role
         fields = BASE_FIELDS + ('role_type', 'namespace', 'is_valid', 'github_user', 'github_repo', 'github_branch',
@@ -851,9 +936,9 @@ class RoleDetailSerializer(BaseSerializer):
             return {}
         res = super(RoleDetailSerializer, self).get_related(obj)
         res.update(dict(
-            dependencies=reverse('api:role_dependencies_list', args=(obj.pk,)),
-            imports=reverse('api:role_import_task_list', args=(obj.pk,)),
-            versions=reverse('api:role_versions_list', args=(obj.pk,)),
+            dependencies=api_url('api:role_dependencies_list', obj.pk),
+            imports=api_url('api:role_import_task_list', obj.pk),
+            versions=api_url('api:role_versions_list', obj.pk),
         ))
         return res
 
@@ -861,12 +946,13 @@ class RoleDetailSerializer(BaseSerializer):
         if obj is None:
             return ''
         elif isinstance(obj, Role):
-            return reverse('api:role_detail', args=(obj.pk,))
+            return api_url('api:role_detail', obj.pk)
         else:
             return obj.get_absolute_url()
 
     def get_tags(self, obj):
-        return [t for t in obj.get_tags()]
+        # read the prefetched tags, obj.get_tags() would query again
+        return [t.name for t in obj.tags.all() if t.active]
 
     def get_summary_fields(self, obj):
         if obj is None:
@@ -974,27 +1060,28 @@ class RoleSearchSerializer(HaystackSerializer):
 
     def get_user_is_subscriber(self, instance):
         # override user_is_subscriber found in ES
-        request = self.context.get('request', None)
-        if request is not None and request.user.is_authenticated():
-            try:
-                Subscription.objects.get(owner=request.user, github_user=instance.github_user, github_repo=instance.github_repo)
-                return True
-            except:
-                pass
-        return False
+        return (instance.github_user, instance.github_repo) in self.user_relations()[0]
 
     def get_user_is_stargazer(self, instance):
         # override user_is_stargazer found in ES
-        request = self.context.get('request', None)
-        if request is not None:
-            try:
-                Stargazer.objects.get(
-                    owner=request.user,
-                    role=instance)
-                return True
-            except:
-                pass
-        return False
+        return instance.role_id in self.user_relations()[1]
+
+    def user_relations(self):
+        '''
+        The requesting user's subscribed repositories and starred role IDs,
+        loaded with one query each the first time a result asks, and shared
+        by every result of the page.
+        '''
+        if getattr(self, '_user_relations', None) is None:
+            request = self.context.get('request', None)
+            if request is not None and request.user.is_authenticated():
+                self._user_relations = (
+                    set(Subscription.objects.filter(owner=request.user).values_list('github_user', 'github_repo')),
+                    set(Stargazer.objects.filter(owner=request.user).values_list('role_id', flat=True))
+                )
+            else:
+                self._user_relations = (set(), set())
+        return self._user_relations
 
 
 class ElasticSearchDSLSerializer(serializers.BaseSerializer):
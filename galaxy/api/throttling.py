@@ -19,6 +19,7 @@ import logging
 
 from django.core.cache import caches
 from rest_framework.throttling import ScopedRateThrottle
+from galaxy.main.downloads import record_download
 from galaxy.main.models import Role
 
 
@@ -43,15 +44,14 @@ class RoleDownloadCountThrottle(ScopedRateThrottle):
                 role_name = request.query_params['name']
                 try:
                     # attempt to lookup role first. if that fails, we don't want get_cache_key to be called.
-                    role = Role.objects.get(namespace=role_namespace, name=role_name)
-                    self.role_id = role.id
+                    self.role_id = Role.objects.values_list('id', flat=True).get(namespace=role_namespace,
+                                                                                 name=role_name)
                     allowed = super(RoleDownloadCountThrottle, self).allow_request(request, view)
                     if not allowed:
                         # user downloaded requested role already
                         self.logger.debug('user requested role %s.%s already.' % (role_namespace, role_name))
                         return True
-                    role.download_count += 1
-                    role.save()
+                    record_download(self.role_id)
                 except Exception as e:
                     self.logger.error('Error finding role %s.%s - %s' % (role_namespace,
                                                                          role_name,
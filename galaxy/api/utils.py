@@ -22,6 +22,10 @@ import re
 import subprocess
 import sys
 
+# Django
+from django.core.urlresolvers import NoReverseMatch, get_script_prefix, reverse
+from django.utils.encoding import force_text
+
 # Django REST Framework
 from rest_framework.exceptions import ParseError, PermissionDenied
 
@@ -29,7 +33,13 @@ from rest_framework.exceptions import ParseError, PermissionDenied
 # from Crypto.Cipher import AES
 
 __all__ = ['get_object_or_400', 'get_object_or_403', 'camelcase_to_underscore',
-           'get_ansible_version', 'get_version', 'html_decode']
+           'get_ansible_version', 'get_version', 'html_decode', 'api_url']
+
+# Stands in for the arguments when a route is reversed into a template.
+URL_ARG_MARKER = 7310000000
+URL_INT_ARG = re.compile(r'[0-9]+\Z')
+
+_url_templates = {}
 
 
 def get_object_or_400(klass, *args, **kwargs):
@@ -62,6 +72,30 @@ def get_object_or_403(klass, *args, **kwargs):
         raise PermissionDenied(*e.args)
 
 
+def api_url(name, *args):
+    '''
+    Same as reverse(name, args=args). Routes called with integer arguments,
+    such as primary keys, are reversed once into a format string that later
+    calls fill in. Other arguments, and routes that do not reverse with
+    integers, go through reverse().
+    '''
+    values = tuple(force_text(arg) for arg in args)
+    if not all(URL_INT_ARG.match(value) for value in values):
+        return reverse(name, args=args)
+    key = (get_script_prefix(), name, len(args))
+    template = _url_templates.get(key)
+    if template is None:
+        markers = [str(URL_ARG_MARKER + i) for i in range(len(args))]
+        try:
+            template = reverse(name, args=markers).replace('%', '%%')
+        except NoReverseMatch:
+            return reverse(name, args=args)
+        for marker in markers:
+            template = template.replace(marker, '%s', 1)
+        _url_templates[key] = template
+    return template % values
+
+
 def camelcase_to_underscore(s):
     '''
     Convert CamelCase names to lowercase_with_underscore.
@@ -53,7 +53,6 @@ from django.utils import timezone
 from django.core.urlresolvers import reverse
 from django.core.exceptions import PermissionDenied
 from django.conf import settings
-from django.shortcuts import get_object_or_404
 
 # allauth
 from allauth.socialaccount.models import SocialAccount
@@ -61,7 +60,7 @@ from allauth.socialaccount.models import SocialToken
 
 # haystack
 from drf_haystack.viewsets import HaystackViewSet
-from galaxy.api.filters import HaystackFilter
+from galaxy.api.filters import HaystackFilter, FieldLookupBackend
 from haystack.query import SearchQuerySet
 
 # elasticsearch dsl
@@ -121,8 +120,11 @@ from galaxy.main.models import (Platform,
 from galaxy.main.utils import camelcase_to_underscore
 from galaxy.api.permissions import ModelAccessPermission
 from galaxy.main.celerytasks.tasks import (
-    import_role, update_user_repos, refresh_existing_user_repos)
-from galaxy.main.celerytasks.elastic_tasks import update_custom_indexes
+    create_import_task, update_user_repos, refresh_existing_user_repos)
+from galaxy.main.celerytasks.elastic_tasks import queue_index_update
+from galaxy.main.downloads import record_download
+from galaxy.main.facets import role_facets
+from galaxy.main.search_models import TagDoc, PlatformDoc, CloudPlatformDoc, UserDoc
 
 
 logger = logging.getLogger(__name__)
@@ -148,23 +150,6 @@ def filter_rating_queryset(qs):
     )
 
 
-def create_import_task(
-        github_user, github_repo, github_branch, role, user,
-        travis_status_url='', travis_build_url='', alternate_role_name=None):
-    task = ImportTask.objects.create(
-        github_user=github_user,
-        github_repo=github_repo,
-        github_reference=github_branch,
-        alternate_role_name=alternate_role_name,
-        travis_status_url=travis_status_url,
-        travis_build_url=travis_build_url,
-        role=role,
-        owner=user,
-        state='PENDING'
-    )
-    import_role.delay(task.id)
-    return task
-
 # --------------------------------------------------------------------------------
 
 
@@ -345,9 +330,9 @@ class RoleVersionsList(SubListAPIView):
 class RoleDownloads(APIView):
 
     def post(self, request, pk):
-        obj = get_object_or_404(Role, pk=pk)
-        obj.download_count += 1
-        obj.save()
+        if not Role.objects.filter(pk=pk).exists():
+            raise Http404
+        record_download(int(pk))
         return Response(status=status.HTTP_201_CREATED)
 
 
@@ -355,17 +340,20 @@ class RoleList(ListAPIView):
     model = Role
     serializer_class = RoleListSerializer
     throttle_scope = 'download_count'
+    cursor_ordering = ('namespace', 'name')
 
     def list(self, request, *args, **kwargs):
         if request.query_params.get('owner__username'):
             params = {}
             for key, val in request.query_params.items():
+                if key in FieldLookupBackend.RESERVED_NAMES:
+                    continue
                 if key == 'owner__username':
                     params['namespace'] = val
                 else:
                     params[key] = val
             qs = self.get_queryset()
-            qs = qs.filter(**params)
+            qs = self.setup_queryset(qs.filter(**params))
             page = self.paginate_queryset(qs)
             if page is not None:
                 serializer = self.get_pagination_serializer(page)
@@ -376,7 +364,6 @@ class RoleList(ListAPIView):
 
     def get_queryset(self):
         qs = super(RoleList, self).get_queryset()
-        qs = qs.prefetch_related('platforms', 'tags', 'versions', 'dependencies')
         return filter_role_queryset(qs)
 
 
@@ -405,6 +392,7 @@ class ImportTaskList(ListCreateAPIView):
         github_repo = request.data.get('github_repo', None)
         github_reference = request.data.get('github_reference', '')
         alternate_role_name = request.data.get('alternate_role_name', None)
+        force = request.data.get('force', False) in (True, 'true', 'True', '1', 1)
 
         name = alternate_role_name if alternate_role_name else github_repo
 
@@ -423,8 +411,7 @@ class ImportTaskList(ListCreateAPIView):
                 task = create_import_task(
                     github_user, github_repo, github_reference, role,
                     request.user, travis_status_url='', travis_build_url='',
-                    alternate_role_name=alternate_role_name)
-                import_role.delay(task.id)
+                    alternate_role_name=alternate_role_name, force=force)
                 serializer = self.get_serializer(instance=task)
                 response['results'].append(serializer.data)
         else:
@@ -443,7 +430,7 @@ class ImportTaskList(ListCreateAPIView):
             task = create_import_task(
                 github_user, github_repo, github_reference, role, request.user,
                 travis_status_url='', travis_build_url='',
-                alternate_role_name=alternate_role_name)
+                alternate_role_name=alternate_role_name, force=force)
             serializer = self.get_serializer(instance=task)
             response['results'].append(serializer.data)
         return Response(response, status=status.HTTP_201_CREATED, headers=self.get_success_headers(response))
@@ -933,7 +920,8 @@ class NotificationList(ListCreateAPIView):
                     role,
                     owner,
                     travis_status_url,
-                    payload['build_url'])
+                    payload['build_url'],
+                    commit=payload['commit'])
                 notification.imports.add(task)
         else:
             regex = re.compile(r'^(ansible[-_.+]*)*(role[-_.+]*)*')
@@ -968,7 +956,8 @@ class NotificationList(ListCreateAPIView):
                 role,
                 owner,
                 travis_status_url,
-                payload['build_url'])
+                payload['build_url'],
+                commit=payload['commit'])
             notification.imports.add(task)
 
         notification.save()
@@ -1117,7 +1106,6 @@ class RoleSearchView(HaystackViewSet):
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
-        print(queryset)
         instance = self.filter_queryset(queryset)
         page = self.paginate_queryset(instance)
         if page is not None:
@@ -1163,7 +1151,7 @@ class UserSearchView(APIView):
                 order_fields = value.split(',')
         if page_size > 1000:
             page_size = 1000
-        s = Search(index='galaxy_users')
+        s = Search(index=UserDoc._doc_type.index)
         s = s.query(q) if q else s
         s = s.sort(*order_fields) if len(order_fields) > 0 else s
         s = s[page * page_size:page * page_size + page_size]
@@ -1195,7 +1183,7 @@ class PlatformsSearchView(APIView):
                 order_fields = value.split(',')
         if page_size > 1000:
             page_size = 1000
-        s = Search(index='galaxy_platforms')
+        s = Search(index=PlatformDoc._doc_type.index)
         s = s.query(q) if q else s
         s = s.sort(*order_fields) if len(order_fields) > 0 else s
         s = s[page * page_size:page * page_size + page_size]
@@ -1226,7 +1214,7 @@ class CloudPlatformsSearchView(APIView):
                 order_fields = value.split(',')
         if page_size > 1000:
             page_size = 1000
-        s = Search(index='galaxy_cloud_platforms')
+        s = Search(index=CloudPlatformDoc._doc_type.index)
         s = s.query(q) if q else s
         s = s.sort(*order_fields) if len(order_fields) > 0 else s
         s = s[page * page_size:page * page_size + page_size]
@@ -1255,7 +1243,7 @@ class TagsSearchView(APIView):
                 order_fields = value.split(',')
         if page_size > 1000:
             page_size = 1000
-        s = Search(index='galaxy_tags')
+        s = Search(index=TagDoc._doc_type.index)
         s = s.query(q) if q else s
         s = s.sort(*order_fields) if len(order_fields) > 0 else s
         s = s[page * page_size:page * page_size + page_size]
@@ -1341,9 +1329,7 @@ class RemoveRole(APIView):
                 notification.delete()
 
             # update ES indexes
-            update_custom_indexes.delay(username=role.namespace,
-                                        tags=role.get_tags(),
-                                        platforms=role.get_unique_platforms())
+            queue_index_update(username=role.namespace, **role_facets(role))
 
         # Update the repository cache
         for repo in Repository.objects.filter(github_user=gh_user, github_repo=gh_repo):
@@ -15,206 +15,322 @@
 # You should have received a copy of the Apache License
 # along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
 
+import datetime
+
+from collections import OrderedDict
+
 from celery import task
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from elasticsearch.helpers import bulk, BulkIndexError
+from elasticsearch_dsl import connections
+from haystack import connections as haystack_connections, connection_router
 
 # local
-from galaxy.main.models import Platform, Role, Tag
+from galaxy.main.facets import facet_counts
+from galaxy.main.models import Platform, Tag
 from galaxy.main.search_models import (
     TagDoc, PlatformDoc, CloudPlatformDoc, UserDoc)
-from galaxy.main.utils.memcache_lock import (
-    memcache_lock, MemcacheLockException)
-
-
-def update_tags(tags, logger):
-    for tag in tags:
-        logger.info(u"TAG: {}".format(tag))
-        try:
-            with memcache_lock("tag_%s" % tag):
-                pg_tag = Tag.objects.get(name=tag)
-                es_tags = TagDoc.search().query('match', tag=tag).execute()
-                cnt = pg_tag.get_num_roles() if pg_tag else 0
-                updated = False
-
-                for es_tag in es_tags:
-                    if es_tag.tag == tag:
-                        updated = True
-                        if cnt > 0:
-                            if es_tag.roles != cnt:
-                                logger.info(u"TAG: {0} update count {1}".format(tag, cnt))
-                                try:
-                                    es_tag.update(roles=cnt)
-                                except Exception as exc:
-                                    logger.error(u"TAG: {0} failed to update {1}"
-                                                 .format(tag, str(exc)).encode('utf-8').strip())
-                                    raise
-                            else:
-                                logger.info(u"TAG: {0} no update required".format(tag).encode('utf-8').strip())
-                        else:
-                            logger.info("TAG: {} delete".format(tag).encode('utf-8').strip())
-                            try:
-                                es_tag.delete()
-                            except Exception as exc:
-                                logger.error(u"TAG: {0} failed to delete {1}"
-                                             .format(tag, str(exc))
-                                             .encode('utf-8').strip())
-                                raise
-
-                if not updated:
-                    # new tag
-                    try:
-                        logger.info(u"TAG: {} add".format(tag).encode('utf-8').strip())
-                        doc = TagDoc(tag=pg_tag.name, roles=cnt)
-                        doc.meta.id = pg_tag.id
-                        doc.save()
-                    except Exception as exc:
-                        logger.error(u"TAG: {0} failed to add {1}".format(tag, str(exc)).encode('utf-8').strip())
-                        raise
-
-        except MemcacheLockException as exc:
-            logger.info(u"TAG: %s unable to get lock %s".format(tag, str(exc)).encode('utf-8').strip())
-
-
-def update_platforms(platforms, logger):
-    for platform in platforms:
-        logger.info(u"PLATFORM: {}".format(platform).encode('utf-8').strip())
-        platform_name = 'Enterprise_Linux' if platform == 'EL' else platform
-        try:
-            with memcache_lock("platform_%s" % platform):
-                cnt = Role.objects.filter(active=True, is_valid=True, platforms__name=platform) \
-                    .order_by('namespace', 'name') \
-                    .distinct('namespace', 'name').count()
-                es_platforms = PlatformDoc.search().query('match', name=platform_name).execute()
-                updated = False
-
-                for es_platform in es_platforms:
-                    if es_platform.name == platform_name:
-                        updated = True
-                        if es_platform.roles != cnt:
-                            logger.info(u"PLATFORM: {0} update count {1}".format(platform, cnt)
-                                        .encode('utf-8').strip())
-                            try:
-                                es_platform.update(roles=cnt)
-                            except Exception as exc:
-                                logger.error("PLATFORM: {0} failed to update {1}"
-                                             .format(platform, str(exc))
-                                             .encode('utf-8').strip())
-                                raise
-                        else:
-                            logger.info(u"PLATFORM: no update required {0}".format(platform).encode('utf-8').strip())
-
-                if not updated:
-                    # new platform
-                    try:
-                        logger.info(u"PLATFORM: {0} add".format(platform).encode('utf-8').strip())
-                        releases = [p.release for p in Platform.objects.filter(active=True, name=platform)
-                                    .order_by('release').distinct('release').all()]
-                        doc = PlatformDoc(
-                            name=platform_name,
-                            releases=releases,
-                            roles=cnt,
-                        )
-                        doc.save()
-                    except Exception as exc:
-                        logger.error(u"PLATFORM:{0} failed to add {1}".format(platform, str(exc)))
-                        raise
-        except MemcacheLockException as exc:
-            logger.info(u"PLATFORM: %s failed to get lock %s".format(platform, str(exc)).encode('utf-8').strip())
-
-
-def update_cloud_platforms(cloud_platforms, logger):
-    for platform in cloud_platforms:
-        logger.info(u"CLOUD_PLATFORM: {}"
-                    .format(platform).encode('utf-8').strip())
-        try:
-            with memcache_lock("cloud_platform_%s" % platform):
-                cnt = (
-                    Role.objects.filter(
-                        active=True, is_valid=True,
-                        cloud_platforms__name=platform)
-                    .order_by('namespace', 'name')
-                    .distinct('namespace', 'name')
-                    .count())
-                es_platforms = CloudPlatformDoc.search().query(
-                    'match', name=platform).execute()
-                updated = False
-
-                for es_platform in es_platforms:
-                    if es_platform.name == platform:
-                        updated = True
-                        if es_platform.roles != cnt:
-                            logger.info(u"CLOUD PLATFORM: {0} update count {1}"
-                                        .format(platform, cnt)
-                                        .encode('utf-8').strip())
-                            try:
-                                es_platform.update(roles=cnt)
-                            except Exception as exc:
-                                logger.error(
-                                    "PLATFORM: {0} failed to update {1}"
-                                    .format(platform, str(exc))
-                                    .encode('utf-8').strip())
-                                raise
-                        else:
-                            logger.info(
-                                u"CLOUD_PLATFORM: no update required {0}"
-                                .format(platform).encode('utf-8').strip())
-
-                if not updated:
-                    # new platform
-                    try:
-                        logger.info(u"CLOUD_PLATFORM: {0} add"
-                                    .format(platform).encode('utf-8').strip())
-                        doc = CloudPlatformDoc(name=platform, roles=cnt)
-                        doc.save()
-                    except Exception as exc:
-                        logger.error(u"CLOUD_PLATFORM:{0} failed to add {1}"
-                                     .format(platform, str(exc)))
-                        raise
-        except MemcacheLockException as exc:
-            logger.info(u"CLOUD_PLATFORM: %s failed to get lock %s"
-                        .format(platform, str(exc)).encode('utf-8').strip())
-
-
-def update_users(user, logger):
-    logger.info(u"USER: {0}".format(user).encode('utf-8').strip())
+from galaxy.main.utils.cache_queue import CacheQueue
+
+
+INDEX_QUEUE = CacheQueue('custom_indexes')
+FLUSH_SCHEDULED_KEY = 'custom_indexes_flush_scheduled'
+
+SEARCH_QUEUE = CacheQueue('search_index')
+SEARCH_SCHEDULED_KEY = 'search_index_update_scheduled'
+
+
+def platform_doc_name(platform):
+    return 'Enterprise_Linux' if platform == 'EL' else platform
+
+
+def find_docs(doc_class, field, names):
+    """
+    Look up the documents whose field matches each name exactly, using a
+    single multi-search request. Returns a dict of name to matching hits.
+    """
+    body = []
+    for name in names:
+        body.append({'index': doc_class._doc_type.index, 'type': doc_class._doc_type.name})
+        body.append({'query': {'match': {field: name}}, 'size': 50})
+    responses = connections.get_connection().msearch(body=body)['responses'] if body else []
+    found = {}
+    for name, response in zip(names, responses):
+        found[name] = [hit for hit in response.get('hits', {}).get('hits', [])
+                       if hit['_source'].get(field) == name]
+    return found
+
+
+def index_action(doc, doc_id, index=None):
+    return {
+        '_index': index or doc._doc_type.index,
+        '_type': doc._doc_type.name,
+        '_id': doc_id,
+        '_source': doc.to_dict(),
+    }
+
+
+def update_action(doc_class, hit, **fields):
+    return {
+        '_op_type': 'update',
+        '_index': doc_class._doc_type.index,
+        '_type': doc_class._doc_type.name,
+        '_id': hit['_id'],
+        'doc': dict(fields, last_modified_on=datetime.datetime.now()),
+    }
+
+
+def delete_action(doc_class, hit):
+    return {
+        '_op_type': 'delete',
+        '_index': doc_class._doc_type.index,
+        '_type': doc_class._doc_type.name,
+        '_id': hit['_id'],
+    }
+
+
+def count_actions(doc_class, field, counts, names, logger, new_doc, delete_empty=False):
+    """
+    Compare the role counts of names with the indexed documents and return
+    the bulk actions that bring the index up to date. new_doc(name, count)
+    returns the document and id to add when a name is not indexed yet.
+    """
+    label = doc_class.__name__[:-3].upper()
+    actions = []
+    for name, hits in find_docs(doc_class, field, names).items():
+        cnt = counts.get(name, 0)
+        if not hits:
+            if cnt > 0:
+                logger.info(u"{0}: {1} add".format(label, name).encode('utf-8').strip())
+                doc, doc_id = new_doc(name, cnt)
+                doc.created_on = doc.last_modified_on = datetime.datetime.now()
+                actions.append(index_action(doc, doc_id))
+            continue
+        for hit in hits:
+            if cnt == 0 and delete_empty:
+                logger.info(u"{0}: {1} delete".format(label, name).encode('utf-8').strip())
+                actions.append(delete_action(doc_class, hit))
+            elif hit['_source'].get('roles') != cnt:
+                logger.info(u"{0}: {1} update count {2}".format(label, name, cnt).encode('utf-8').strip())
+                actions.append(update_action(doc_class, hit, roles=cnt))
+    return actions
+
+
+def tag_actions(tags, logger):
+    tag_ids = dict(Tag.objects.filter(name__in=tags).values_list('name', 'id'))
+    counts = facet_counts('tags', tag_ids)
+
+    def new_doc(name, cnt):
+        return TagDoc(tag=name, roles=cnt), tag_ids[name]
+
+    return count_actions(TagDoc, 'tag', counts, list(tag_ids), logger, new_doc, delete_empty=True)
+
+
+def platform_actions(platforms, logger):
+    counts = dict((platform_doc_name(name), cnt) for name, cnt in facet_counts('platforms', platforms).items())
+    releases = {}
+    for name, release in Platform.objects.filter(active=True, name__in=platforms) \
+            .order_by('name', 'release').distinct('name', 'release').values_list('name', 'release'):
+        releases.setdefault(platform_doc_name(name), []).append(release)
+
+    def new_doc(name, cnt):
+        return PlatformDoc(name=name, releases=releases.get(name, []), roles=cnt), name
+
+    names = list(set(platform_doc_name(platform) for platform in platforms))
+    return count_actions(PlatformDoc, 'name', counts, names, logger, new_doc)
+
+
+def cloud_platform_actions(cloud_platforms, logger):
+    counts = facet_counts('cloud_platforms', cloud_platforms)
+
+    def new_doc(name, cnt):
+        return CloudPlatformDoc(name=name, roles=cnt), name
+
+    return count_actions(CloudPlatformDoc, 'name', counts, list(set(cloud_platforms)), logger, new_doc)
+
+
+def user_actions(usernames, logger):
+    actions = []
+    for username, hits in find_docs(UserDoc, 'username', list(set(usernames))).items():
+        if hits:
+            logger.info(u"USER: {0} already exists".format(username).encode('utf-8').strip())
+            continue
+        logger.info(u"USER: {} add".format(username).encode('utf-8').strip())
+        now = datetime.datetime.now()
+        actions.append(index_action(UserDoc(username=username, created_on=now, last_modified_on=now), username))
+    return actions
+
+
+def update_indexes(logger, usernames=None, tags=None, platforms=None, cloud_platforms=None):
+    """
+    Recount the given tags, platforms and cloud platforms with one grouped
+    query per facet and write every change with a single bulk request.
+    """
+    actions = []
+    if tags:
+        actions += tag_actions(tags, logger)
+    if platforms:
+        actions += platform_actions(platforms, logger)
+    if cloud_platforms:
+        actions += cloud_platform_actions(cloud_platforms, logger)
+    if usernames:
+        actions += user_actions(usernames, logger)
+    if not actions:
+        return 0
+
+    _, errors = bulk(connections.get_connection(), actions, raise_on_error=False)
+    # documents deleted by a concurrent update are already gone
+    errors = [error for error in errors if error.get('delete', {}).get('status') != 404]
+    if errors:
+        logger.error(u"Custom index update failed for {0} of {1} documents"
+                     .format(len(errors), len(actions)))
+        raise BulkIndexError(u"%d document(s) failed to update" % len(errors), errors)
+    return len(actions)
+
+
+def queue_index_update(username=None, tags=None, platforms=None, cloud_platforms=None):
+    """
+    Mark the search documents for a user's tags and platforms as dirty.
+    Updates queued close together are applied by one flush_custom_indexes
+    task, CUSTOM_INDEX_FLUSH_DELAY seconds after the first of them.
+    """
+    update = dict(username=username, tags=list(tags or []), platforms=list(platforms or []),
+                  cloud_platforms=list(cloud_platforms or []))
     try:
-        with memcache_lock("user_%s" % user):
-            es_users = UserDoc.search().query('match', username=user).execute()
-            updated = False
+        INDEX_QUEUE.push(update)
+    except ValueError:
+        # no cache to queue on, update right away
+        update_custom_indexes.delay(**update)
+        return
+    schedule_flush()
+
+
+def schedule_once(key, task, delay):
+    """
+    Run task in delay seconds, unless a run scheduled under key is already
+    waiting. The task deletes key when it starts.
+    """
+    # the key outlives a normal wait, so a lost task only delays the next run
+    if django_cache.add(key, 1, delay * 10):
+        task.apply_async(countdown=delay)
 
-            for es_user in es_users:
-                if es_user.username == user:
-                    logger.info(u"USER: {0} already exists".format(user).encode('utf-8').strip())
-                    updated = True
 
-            if not updated:
-                # new tag
+def schedule_flush():
+    schedule_once(FLUSH_SCHEDULED_KEY, flush_custom_indexes, settings.CUSTOM_INDEX_FLUSH_DELAY)
+
+
+@task(name="galaxy.main.celerytasks.elastic_tasks.flush_custom_indexes",
+      throws=(Exception,))
+def flush_custom_indexes(updates=None):
+    logger = flush_custom_indexes.get_logger()
+
+    # updates queued from here on schedule another flush
+    django_cache.delete(FLUSH_SCHEDULED_KEY)
+    updates = (updates or []) + INDEX_QUEUE.drain()
+    logger.info(u"Flushing {0} custom index update(s)".format(len(updates)))
+
+    merged = dict(usernames=set(), tags=set(), platforms=set(), cloud_platforms=set())
+    for update in updates:
+        if update.get('username') is not None:
+            merged['usernames'].add(update['username'])
+        for key in ('tags', 'platforms', 'cloud_platforms'):
+            merged[key].update(update.get(key, []))
+    merged = dict((key, list(value)) for key, value in merged.items())
+    try:
+        update_indexes(logger, **merged)
+    except Exception as exc:
+        # the drained updates only exist in this task now, keep them on retry
+        retry = [dict(username=username) for username in merged.pop('usernames')]
+        retry.append(merged)
+        if flush_custom_indexes.request.retries >= 3:
+            # out of retries, leave them to the next flush
+            logger.error(u"Custom index update failed, re-queueing: {0}".format(unicode(exc)))
+            for update in retry:
                 try:
-                    logger.info(u"USER: {} add".format(user).encode('utf-8').strip())
-                    doc = UserDoc(username=user)
-                    doc.save()
-                except Exception as exc:
-                    logger.error(u"USER: {0} failed to add {1}".format(user, str(exc)).encode('utf-8').strip())
-                    raise
-    except MemcacheLockException as exc:
-        logger.info(u"USER: {0} failed to get lock {1}".format(user, str(exc)).encode('utf-8').strip())
+                    INDEX_QUEUE.push(update)
+                except ValueError:
+                    logger.error(u"Dropped custom index update: {0}".format(update))
+            raise
+        raise flush_custom_indexes.retry(kwargs={'updates': retry}, exc=exc, max_retries=3,
+                                         countdown=settings.CUSTOM_INDEX_FLUSH_DELAY)
+    finally:
+        if INDEX_QUEUE.pending():
+            schedule_flush()
 
 
-# FIXME(cutwater): Mutalbe types usage as argument default values.
 @task(name="galaxy.main.celerytasks.elastic_tasks.update_custom_indexes",
       throws=(Exception,))
 def update_custom_indexes(username=None, tags=None,
                           platforms=None, cloud_platforms=None):
 
     logger = update_custom_indexes.get_logger()
+    update_indexes(logger, usernames=[username] if username is not None else None, tags=tags,
+                   platforms=platforms, cloud_platforms=cloud_platforms)
 
-    if tags:
-        update_tags(tags, logger)
 
-    if platforms:
-        update_platforms(platforms, logger)
+def queue_search_update(model_ct, pk, remove=False):
+    """
+    Mark a search-indexed object as changed, or deleted when remove is
+    set. Objects changed close together are indexed by one
+    update_search_indexes task, SEARCH_INDEX_FLUSH_DELAY seconds after the
+    first change.
+    """
+    update = (model_ct, pk, remove)
+    try:
+        SEARCH_QUEUE.push(update)
+    except ValueError:
+        # no cache to queue on, index from a task of its own
+        update_search_indexes.delay(updates=[update])
+        return
+    schedule_once(SEARCH_SCHEDULED_KEY, update_search_indexes, settings.SEARCH_INDEX_FLUSH_DELAY)
+
+
+@task(name="galaxy.main.celerytasks.elastic_tasks.update_search_indexes",
+      throws=(Exception,))
+def update_search_indexes(updates=None):
+    logger = update_search_indexes.get_logger()
+
+    # changes queued from here on schedule another run
+    django_cache.delete(SEARCH_SCHEDULED_KEY)
+    updates = (updates or []) + SEARCH_QUEUE.drain()
+
+    # the last change queued for an object wins
+    latest = OrderedDict()
+    for model_ct, pk, remove in updates:
+        latest[(model_ct, pk)] = remove
+    by_model = OrderedDict()
+    for (model_ct, pk), remove in latest.items():
+        by_model.setdefault(model_ct, ([], []))[1 if remove else 0].append(pk)
+
+    try:
+        for model_ct, (update_ids, remove_ids) in by_model.items():
+            model = apps.get_model(model_ct)
+            for using in connection_router.for_write():
+                index = haystack_connections[using].get_unified_index().get_index(model)
+                backend = haystack_connections[using].get_backend()
+                objects = list(index.index_queryset(using=using).filter(pk__in=update_ids))
+                if objects:
+                    backend.update(index, objects)
+                # objects that no longer belong in the index are dropped too
+                gone = set(update_ids) - set(obj.pk for obj in objects) | set(remove_ids)
+                for pk in gone:
+                    backend.remove('%s.%s' % (model_ct, pk))
+                logger.info(u"Search index {0}: {1} updated, {2} removed".format(model_ct, len(objects), len(gone)))
+    except Exception as exc:
+        retry = [(model_ct, pk, remove) for (model_ct, pk), remove in latest.items()]
+        raise update_search_indexes.retry(kwargs={'updates': retry}, exc=exc, max_retries=3,
+                                          countdown=settings.SEARCH_INDEX_FLUSH_DELAY)
+    finally:
+        if SEARCH_QUEUE.pending():
+            schedule_once(SEARCH_SCHEDULED_KEY, update_search_indexes, settings.SEARCH_INDEX_FLUSH_DELAY)
 
-    if cloud_platforms:
-        update_cloud_platforms(cloud_platforms, logger)
 
-    if username is not None:
-        update_users(username, logger)
+def update_search_fields(model, values):
+    """
+    Write values, a dict of primary key to field values, to the search
+    documents of model without re-indexing the objects.
+    """
+    for using in connection_router.for_write():
+        haystack_connections[using].get_backend().update_fields(model, values)
@@ -0,0 +1,736 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+"""
+GitHub fetch stage used by the role importer.
+
+All GitHub requests needed for an import are issued here, grouped into
+waves of independent requests that run concurrently over one pooled
+session. Responses carrying an ETag are cached, and later requests send
+If-None-Match, so unchanged resources come back as 304 Not Modified.
+The import logic only ever sees the resulting RepoSnapshot.
+
+Candidate files are resolved according to settings.GITHUB_IMPORT_MODE:
+
+  contents  one Contents API request per candidate path
+  tree      one recursive git tree request, then a blob request for each
+            candidate that actually exists
+  tarball   one tarball download of the commit, read locally
+"""
+
+import base64
+import hashlib
+import logging
+import tarfile
+import tempfile
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+
+from galaxy.main.celerytasks import token_pool
+
+
+logger = logging.getLogger(__name__)
+
+HTML_MEDIA_TYPE = 'application/vnd.github.VERSION.html'
+
+IMPORT_MODES = ('contents', 'tree', 'tarball')
+
+# Tag names with the author date of the tagged commit, 100 refs per page.
+# Annotated tags point at a Tag object whose target is the commit. Tags can
+# also point at trees and blobs, which have no date.
+TAGS_QUERY = '''
+query ($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    refs(refPrefix: "refs/tags/", first: 100, after: $cursor) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        name
+        target {
+          __typename
+          oid
+          ... on Commit { author { date } }
+          ... on Tag { target { __typename oid ... on Commit { author { date } } } }
+        }
+      }
+    }
+  }
+}
+'''
+
+
+# Fields of each repository in a batched metadata query
+REPO_FIELDS = '''
+fragment repoFields on Repository {
+  name
+  owner { login }
+  stargazers { totalCount }
+  watchers { totalCount }
+  forkCount
+  issues(states: OPEN) { totalCount }
+  defaultBranchRef { name target { oid } }
+}
+'''
+
+
+class GithubFetchError(Exception):
+    def __init__(self, message, status=None):
+        super(GithubFetchError, self).__init__(message)
+        self.message = message
+        self.status = status
+
+
+def is_not_found(exc):
+    '''
+    Whether a failed request only means the resource does not exist.
+    '''
+    return isinstance(exc, GithubFetchError) and exc.status == 404
+
+
+def read_tarball_files(fileobj, paths):
+    '''
+    Read the given repository paths from a GitHub tarball. GitHub wraps the
+    tree in a single top level directory, which is ignored. Returns a dict
+    mapping each path to its content, or None when the path is missing.
+    '''
+    files = dict((path, None) for path in paths)
+    with tarfile.open(fileobj=fileobj, mode='r:*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            parts = member.name.split('/', 1)
+            if len(parts) < 2 or parts[1] not in files:
+                continue
+            files[parts[1]] = archive.extractfile(member).read()
+    return files
+
+
+def build_repos_query(full_names):
+    '''
+    Build one GraphQL query that looks up all the given repositories,
+    aliased r0, r1, ... in order. Returns a (query, variables) tuple.
+    '''
+    params = []
+    fields = []
+    variables = {}
+    for i, full_name in enumerate(full_names):
+        owner, name = full_name.split('/', 1)
+        params.append(u'$o{0}: String!, $n{0}: String!'.format(i))
+        fields.append(u'  r{0}: repository(owner: $o{0}, name: $n{0}) {{ ...repoFields }}'.format(i))
+        variables[u'o{0}'.format(i)] = owner
+        variables[u'n{0}'.format(i)] = name
+    query = u'query ({0}) {{\n{1}\n}}\n{2}'.format(u', '.join(params), u'\n'.join(fields), REPO_FIELDS)
+    return query, variables
+
+
+def parse_repo(repo):
+    branch = repo.get('defaultBranchRef') or {}
+    return {
+        'name': repo['name'],
+        'owner': repo['owner']['login'],
+        'stargazers_count': repo['stargazers']['totalCount'],
+        'watchers_count': repo['watchers']['totalCount'],
+        'forks_count': repo['forkCount'],
+        'open_issues_count': repo['issues']['totalCount'],
+        'default_branch': branch.get('name'),
+        'commit': (branch.get('target') or {}).get('oid'),
+    }
+
+
+def fetch_repos(fetcher, full_names, batch_size=None):
+    '''
+    Look up repository metadata, batch_size repositories per GraphQL
+    request. Returns a dict mapping each full name to a dict of attributes,
+    to None when the repository does not exist, or leaves it out when
+    GitHub reported any other error for it.
+    '''
+    batch_size = batch_size or settings.GITHUB_GRAPHQL_BATCH_SIZE
+    results = {}
+    for start in range(0, len(full_names), batch_size):
+        batch = full_names[start:start + batch_size]
+        query, variables = build_repos_query(batch)
+        data, errors = fetcher.graphql_partial(query, variables)
+        failed = {}
+        for error in errors:
+            path = error.get('path') or [None]
+            failed[path[0]] = error.get('type')
+        for i, full_name in enumerate(batch):
+            alias = u'r{0}'.format(i)
+            if data.get(alias):
+                results[full_name] = parse_repo(data[alias])
+            elif failed.get(alias) == 'NOT_FOUND':
+                results[full_name] = None
+            else:
+                logger.warning(u"Unable to look up {0}: {1}".format(full_name, failed.get(alias)))
+    return results
+
+
+class GithubFetcher(object):
+    '''
+    Issues conditional GET requests against the GitHub API over a pooled
+    session, and runs batches of independent requests concurrently. With a
+    TokenPool, a token that runs out of quota is marked exhausted and the
+    request is retried with the healthiest token of the pool. REST requests
+    and GraphQL queries draw on separate quotas, so each keeps its own
+    current token.
+    '''
+
+    def __init__(self, token, concurrency=None, pool=None):
+        self.tokens = {'core': token, 'graphql': token}
+        self.token_pool = pool
+        self.concurrency = concurrency or settings.GITHUB_FETCH_CONCURRENCY
+        self.request_count = 0
+        self.not_modified_count = 0
+        self._pool = None
+        self._exhausted = set()
+        self._token_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/vnd.github.v3+json',
+            'User-Agent': 'Ansible-Galaxy',
+        })
+
+    @property
+    def token(self):
+        return self.tokens['core']
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self.session.close()
+
+    def _auth_headers(self, token):
+        return {'Authorization': 'token ' + token} if token else {}
+
+    def _cache_key(self, token, url, accept, params):
+        # Authorization and Accept are both listed in GitHub's Vary header,
+        # so they are part of the key.
+        parts = [hashlib.sha1(token or '').hexdigest(), url, accept or '']
+        for key in sorted(params or {}):
+            parts.append(u'{0}={1}'.format(key, params[key]))
+        return 'github_etag_' + hashlib.md5(u'|'.join(parts).encode('utf-8')).hexdigest()
+
+    def _check_rate_limit(self, token, response, resource='core', rate_limited=False):
+        '''
+        Record the quota of resource left on token. Returns True when token
+        ran out and the request should be retried with the token the
+        fetcher moved to.
+        '''
+        if token:
+            token_pool.record(token, response.headers, resource=resource)
+        if not (rate_limited or token_pool.is_rate_limited(response)):
+            return False
+        self._switch_token(token, token_pool.reset_in(response), resource)
+        return True
+
+    def _switch_token(self, token, reset_in, resource='core'):
+        '''
+        Mark token exhausted and move on to the healthiest token of the pool.
+        Raises RateLimitExhausted without a pool, or once the pool has no
+        token left with quota.
+        '''
+        if self.token_pool is None or not token:
+            raise token_pool.RateLimitExhausted(reset_in)
+        token_pool.mark_exhausted(token, reset_in, resource=resource)
+        with self._token_lock:
+            self._exhausted.add((resource, token))
+            if self.tokens[resource] == token:
+                new_token = self.token_pool.acquire(resource=resource)
+                if (resource, new_token) in self._exhausted:
+                    # the pool could not record the exhausted token
+                    raise token_pool.RateLimitExhausted(reset_in)
+                logger.info(u"GitHub {0} quota of a token exhausted for {1} seconds, switching tokens"
+                            .format(resource, reset_in))
+                self.tokens[resource] = new_token
+
+    def _graphql_token(self):
+        '''
+        The token for the next GraphQL query: the current one while it has
+        GraphQL quota to spare, otherwise the healthiest of the pool.
+        '''
+        if self.token_pool is None or not self.tokens['graphql']:
+            return self.tokens['graphql']
+        with self._token_lock:
+            self.tokens['graphql'] = self.token_pool.acquire(preferred=self.tokens['graphql'], resource='graphql')
+            return self.tokens['graphql']
+
+    def request(self, path, params=None, accept=None, allow_404=False):
+        '''
+        Conditional GET. Returns a (body, links) tuple, where body is the
+        decoded JSON document, or text when a non-JSON media type is
+        requested, and links holds the parsed Link header. Returns
+        (None, {}) for a 404 when allow_404 is set.
+        '''
+        url = path if path.startswith('http') else settings.GITHUB_SERVER + path
+        as_text = accept is not None and not accept.endswith('json')
+
+        while True:
+            token = self.token
+            headers = self._auth_headers(token)
+            if accept:
+                headers['Accept'] = accept
+            cache_key = self._cache_key(token, url, accept, params)
+            cached = cache.get(cache_key)
+            if cached:
+                headers['If-None-Match'] = cached['etag']
+
+            try:
+                response = self.session.get(url, params=params, headers=headers,
+                                            timeout=settings.GITHUB_FETCH_TIMEOUT)
+            except requests.RequestException as exc:
+                raise GithubFetchError(u"Failed to connect to GitHub API - {0}".format(exc))
+            self.request_count += 1
+            if not self._check_rate_limit(token, response):
+                break
+
+        if response.status_code == 304 and cached:
+            self.not_modified_count += 1
+            return cached['body'], cached['links']
+        if response.status_code == 404 and allow_404:
+            return None, {}
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('message', response.reason)
+            except ValueError:
+                message = response.reason
+            raise GithubFetchError(u"{0} {1} - {2}".format(response.status_code, url, message),
+                                   status=response.status_code)
+
+        body = response.text if as_text else response.json()
+        links = dict((rel, link['url']) for rel, link in response.links.items())
+        etag = response.headers.get('ETag')
+        if etag:
+            try:
+                cache.set(cache_key, {'etag': etag, 'body': body, 'links': links},
+                          settings.GITHUB_ETAG_CACHE_TIMEOUT)
+            except Exception as exc:
+                # Bodies larger than the cache item limit are simply not cached
+                logger.debug(u"Unable to cache response for {0} - {1}".format(url, exc))
+        return body, links
+
+    def download(self, path, fileobj):
+        '''
+        Stream a binary response, following redirects, into fileobj.
+        '''
+        url = path if path.startswith('http') else settings.GITHUB_SERVER + path
+        while True:
+            token = self.token
+            try:
+                response = self.session.get(url, stream=True, headers=self._auth_headers(token),
+                                            timeout=settings.GITHUB_FETCH_TIMEOUT)
+            except requests.RequestException as exc:
+                raise GithubFetchError(u"Failed to connect to GitHub API - {0}".format(exc))
+            self.request_count += 1
+            try:
+                retry = self._check_rate_limit(token, response)
+            except Exception:
+                response.close()
+                raise
+            if not retry:
+                break
+            response.close()
+        try:
+            if response.status_code >= 400:
+                raise GithubFetchError(u"{0} {1} - {2}".format(response.status_code, url, response.reason),
+                                       status=response.status_code)
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                fileobj.write(chunk)
+        except requests.RequestException as exc:
+            raise GithubFetchError(u"Failed to download {0} - {1}".format(url, exc))
+        finally:
+            response.close()
+        fileobj.seek(0)
+
+    def graphql(self, query, variables=None):
+        '''
+        Run a GraphQL query and return its data document.
+        '''
+        data, errors = self.graphql_partial(query, variables)
+        if errors:
+            raise GithubFetchError(u"GraphQL query failed - {0}".format(errors[0].get('message')))
+        return data
+
+    def graphql_partial(self, query, variables=None):
+        '''
+        Run a GraphQL query and return a (data, errors) tuple. Fields that
+        failed, such as missing repositories, are null in data and have an
+        entry in errors.
+        '''
+        while True:
+            token = self._graphql_token()
+            try:
+                response = self.session.post(settings.GITHUB_GRAPHQL_URL,
+                                             json={'query': query, 'variables': variables or {}},
+                                             headers=self._auth_headers(token),
+                                             timeout=settings.GITHUB_FETCH_TIMEOUT)
+            except requests.RequestException as exc:
+                raise GithubFetchError(u"Failed to connect to GitHub API - {0}".format(exc))
+            self.request_count += 1
+            body = None
+            if response.status_code < 400:
+                body = response.json()
+            errors = (body or {}).get('errors') or []
+            rate_limited = any(error.get('type') == 'RATE_LIMITED' for error in errors)
+            if not self._check_rate_limit(token, response, resource='graphql', rate_limited=rate_limited):
+                break
+        if response.status_code >= 400:
+            raise GithubFetchError(u"{0} {1} - {2}".format(response.status_code, settings.GITHUB_GRAPHQL_URL,
+                                                           response.reason),
+                                   status=response.status_code)
+        return body.get('data') or {}, errors
+
+    def get(self, path, params=None, accept=None, allow_404=False):
+        return self.request(path, params=params, accept=accept, allow_404=allow_404)[0]
+
+    def get_all(self, path, params=None):
+        '''
+        Follow Link: rel="next" headers and return the concatenated pages.
+        '''
+        params = dict(params or {})
+        params.setdefault('per_page', 100)
+        results = []
+        body, links = self.request(path, params=params)
+        results.extend(body or [])
+        while links.get('next'):
+            body, links = self.request(links['next'])
+            results.extend(body or [])
+        return results
+
+    def run(self, calls):
+        '''
+        Run a dict of independent calls concurrently. Each value is a
+        (callable, args) tuple. Returns a dict mapping the same keys to
+        (result, exception) tuples.
+        '''
+        if self._pool is None:
+            self._pool = ThreadPool(self.concurrency)
+
+        def _invoke(item):
+            key, (func, args) = item
+            try:
+                return key, (func(*args), None)
+            except Exception as exc:
+                return key, (None, exc)
+
+        return dict(self._pool.map(_invoke, calls.items()))
+
+
+class RepoSnapshot(object):
+    '''
+    Everything the importer needs from a GitHub repository at a given
+    branch, prefetched by fetch_head() and fetch_contents().
+    '''
+
+    def __init__(self, fetcher, full_name, mode=None):
+        self.fetcher = fetcher
+        self.full_name = full_name
+        self.mode = mode or settings.GITHUB_IMPORT_MODE
+        if self.mode not in IMPORT_MODES:
+            raise ValueError(u"Unknown import mode: {0}".format(self.mode))
+        self.repo = None
+        self.owner = None
+        self.branch = None
+        self.commit = None
+        self.files = {}
+        self.file_errors = {}
+        self.readme = None
+        self.readme_error = None
+        self.readme_html = None
+        self.readme_html_error = None
+        self.tags = []
+        self.tags_error = None
+
+    def _run(self, calls):
+        '''
+        Run calls through the fetcher. Running out of quota in any of them
+        is raised, so the import is deferred instead of treating the
+        resource as missing.
+        '''
+        results = self.fetcher.run(calls)
+        for result, exc in results.values():
+            if isinstance(exc, token_pool.RateLimitExhausted):
+                raise exc
+        return results
+
+    def _repo_path(self, suffix=''):
+        return u'/repos/{0}{1}'.format(self.full_name, suffix)
+
+    def _get_commit(self, branch):
+        return self.fetcher.get(self._repo_path(u'/commits/{0}'.format(branch)))
+
+    def _get_owner(self, login):
+        return self.fetcher.get(u'/users/{0}'.format(login))
+
+    def _get_file(self, path, branch):
+        return self.fetcher.get(self._repo_path(u'/contents/{0}'.format(path)),
+                                params={'ref': branch}, allow_404=True)
+
+    def _get_tree(self, sha):
+        return self.fetcher.get(self._repo_path(u'/git/trees/{0}'.format(sha)),
+                                params={'recursive': 1})
+
+    def _get_blob(self, sha):
+        return self.fetcher.get(self._repo_path(u'/git/blobs/{0}'.format(sha)))
+
+    def _get_tarball_files(self, sha, paths):
+        with tempfile.TemporaryFile() as fileobj:
+            self.fetcher.download(self._repo_path(u'/tarball/{0}'.format(sha)), fileobj)
+            try:
+                return read_tarball_files(fileobj, paths)
+            except tarfile.TarError as exc:
+                raise GithubFetchError(u"Failed to read tarball of {0} - {1}".format(self.full_name, exc))
+
+    def _read_file_results(self, results, paths, prefix):
+        for path in paths:
+            document, exc = results[prefix + path]
+            if exc is not None and not is_not_found(exc):
+                raise exc
+            if not document:
+                self.files[path] = None
+                continue
+            try:
+                self.files[path] = base64.b64decode(document['content'])
+            except Exception as exc:
+                self.files[path] = None
+                self.file_errors[path] = unicode(exc)
+
+    def _resolve_tree(self, tree, paths):
+        '''
+        Fetch the blobs of the candidate paths present in the tree. A
+        truncated tree cannot rule a path out, so anything not listed is
+        then probed through the Contents API instead.
+        '''
+        entries = dict((entry['path'], entry['sha']) for entry in tree.get('tree', [])
+                       if entry.get('type') == 'blob')
+        calls = {}
+        for path in paths:
+            if path in entries:
+                calls[u'blob:' + path] = (self._get_blob, (entries[path],))
+            elif tree.get('truncated'):
+                calls[u'file:' + path] = (self._get_file, (path, self.commit_sha))
+            else:
+                self.files[path] = None
+        if not calls:
+            return
+        results = self._run(calls)
+        self._read_file_results(results, [p for p in paths if u'blob:' + p in calls], u'blob:')
+        self._read_file_results(results, [p for p in paths if u'file:' + p in calls], u'file:')
+
+    def _get_readme(self, ref, accept=None):
+        params = {'ref': ref} if ref else None
+        return self.fetcher.get(self._repo_path(u'/readme'), params=params, accept=accept)
+
+    def _get_tags(self):
+        '''
+        Tag names and release dates in one paged GraphQL query. Falls back
+        to the REST tag list, without dates, when the query fails.
+        '''
+        try:
+            return self._get_tag_refs()
+        except GithubFetchError as exc:
+            logger.warning(u"Tag refs query failed for {0}, using REST - {1}".format(self.full_name, exc))
+        return [{'name': tag['name'], 'sha': tag['commit']['sha'], 'date': None}
+                for tag in self.fetcher.get_all(self._repo_path(u'/tags'))]
+
+    def _get_tag_refs(self):
+        owner, name = self.full_name.split('/', 1)
+        variables = {'owner': owner, 'name': name, 'cursor': None}
+        tags = []
+        while True:
+            refs = self.fetcher.graphql(TAGS_QUERY, variables)['repository']['refs']
+            for node in refs['nodes']:
+                target = node['target']
+                if target.get('__typename') == 'Tag':
+                    target = target.get('target') or {}
+                if target.get('__typename') != 'Commit':
+                    # a tree, a blob or a tag of a tag
+                    tags.append({'name': node['name'], 'sha': None, 'date': None})
+                    continue
+                date = (target.get('author') or {}).get('date')
+                tags.append({
+                    'name': node['name'],
+                    'sha': target['oid'],
+                    'date': parse_datetime(date) if date else None,
+                })
+            if not refs['pageInfo']['hasNextPage']:
+                return tags
+            variables['cursor'] = refs['pageInfo']['endCursor']
+
+    # Attributes of the repository document
+    # -------------------------------------------------------------------------
+
+    @property
+    def description(self):
+        return self.repo.get('description')
+
+    @property
+    def default_branch(self):
+        return self.repo.get('default_branch')
+
+    @property
+    def has_issues(self):
+        return self.repo.get('has_issues', False)
+
+    @property
+    def html_url(self):
+        return self.repo.get('html_url')
+
+    @property
+    def stargazers_count(self):
+        return self.repo.get('stargazers_count', 0)
+
+    @property
+    def watchers_count(self):
+        # /repos/:owner/:repo reports watchers as subscribers_count
+        return self.repo.get('subscribers_count', 0)
+
+    @property
+    def forks_count(self):
+        return self.repo.get('forks_count', 0)
+
+    @property
+    def open_issues_count(self):
+        return self.repo.get('open_issues_count', 0)
+
+    @property
+    def commit_sha(self):
+        return self.commit['sha']
+
+    @property
+    def commit_message(self):
+        return self.commit['commit']['message']
+
+    @property
+    def commit_url(self):
+        return self.commit['html_url']
+
+    @property
+    def commit_date(self):
+        return parse_datetime(self.commit['commit']['committer']['date'])
+
+    # Fetch waves
+    # -------------------------------------------------------------------------
+
+    def fetch_head(self, branch=None):
+        '''
+        First waves: the repository document, then the owner and the HEAD
+        commit of the branch. When branch is None the repository's default
+        branch is used.
+        '''
+        self.repo = self.fetcher.get(self._repo_path(), allow_404=True)
+        if not self.repo:
+            raise GithubFetchError(u"Failed to find repo: {0}".format(self.full_name), status=404)
+        self.full_name = self.repo['full_name']
+        self.branch = branch or self.default_branch
+
+        results = self._run({
+            'owner': (self._get_owner, (self.repo['owner']['login'],)),
+            'commit': (self._get_commit, (self.branch,)),
+        })
+        for key in ('owner', 'commit'):
+            result, exc = results[key]
+            if exc is not None:
+                raise exc
+            setattr(self, key, result)
+
+    def fetch_contents(self, files, readme_ref=None):
+        '''
+        Second wave: candidate files, README (raw and rendered) and tags
+        with their release dates. Missing files are recorded as None, any
+        other error fetching them is raised.
+        '''
+        calls = {
+            'readme': (self._get_readme, (readme_ref,)),
+            'readme_html': (self._get_readme, (readme_ref, HTML_MEDIA_TYPE)),
+            'tags': (self._get_tags, ()),
+        }
+        if self.mode == 'tree':
+            calls['tree'] = (self._get_tree, (self.commit_sha,))
+        elif self.mode == 'tarball':
+            calls['tarball'] = (self._get_tarball_files, (self.commit_sha, files))
+        else:
+            for path in files:
+                calls[u'file:' + path] = (self._get_file, (path, self.branch))
+        results = self._run(calls)
+
+        if self.mode == 'tree':
+            tree, exc = results['tree']
+            if exc is not None:
+                raise exc
+            self._resolve_tree(tree, files)
+        elif self.mode == 'tarball':
+            tarball_files, exc = results['tarball']
+            if exc is not None:
+                raise exc
+            self.files.update(tarball_files)
+        else:
+            self._read_file_results(results, files, u'file:')
+
+        self.readme, exc = results['readme']
+        if exc is not None and not is_not_found(exc):
+            logger.warning(u"Failed to get README of {0} - {1}".format(self.full_name, exc))
+            self.readme_error = unicode(exc)
+
+        self.readme_html, exc = results['readme_html']
+        if exc is not None:
+            self.readme_html = ''
+            self.readme_html_error = unicode(exc)
+
+        self.tags, exc = results['tags']
+        if exc is not None:
+            self.tags = []
+            self.tags_error = unicode(exc)
+
+    def fetch_tag_dates(self, names):
+        '''
+        Look up release dates of the named tags, one commit request each.
+        Only needed for tags that came back without a date. Tags that do not
+        point at a commit are skipped. Returns a dict mapping names to dates.
+        '''
+        shas = dict((tag['name'], tag['sha']) for tag in self.tags)
+        calls = dict((name, (self.fetcher.get, (self._repo_path(u'/commits/{0}'.format(shas[name])),)))
+                     for name in names if shas.get(name))
+        dates = {}
+        for name, (commit, exc) in self._run(calls).items():
+            if exc is not None:
+                self.tags_error = unicode(exc)
+                continue
+            dates[name] = parse_datetime(commit['commit']['author']['date'])
+        return dates
+
+    @property
+    def readme_name(self):
+        return self.readme.get('name') if self.readme else None
+
+    @property
+    def readme_content(self):
+        if not self.readme:
+            return ''
+        return base64.b64decode(self.readme.get('content', ''))
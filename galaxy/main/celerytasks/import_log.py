@@ -0,0 +1,83 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from galaxy.main.models import ImportTaskMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImportMessageBuffer(object):
+    '''
+    Collects the messages of an import run in memory and writes them with
+    one bulk_create per flush. Flushes happen when the caller reaches a
+    state transition, or on the next message once flush_interval seconds
+    have passed, so ImportTaskDetail still shows progress while the import
+    runs. Error and warning counts are kept as messages are added.
+    '''
+
+    def __init__(self, import_task, flush_interval=None):
+        self.import_task = import_task
+        self.flush_interval = (settings.IMPORT_MESSAGE_FLUSH_INTERVAL
+                               if flush_interval is None else flush_interval)
+        self.pending = []
+        self.error_count = 0
+        self.warning_count = 0
+        self.last_flush = time.time()
+
+    def add(self, msg_type, msg_text):
+        self.pending.append(ImportTaskMessage(task=self.import_task,
+                                              message_type=msg_type,
+                                              message_text=msg_text[:255]))
+        if msg_type == u"ERROR":
+            self.error_count += 1
+        elif msg_type == u"WARNING":
+            self.warning_count += 1
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        '''
+        Write pending messages and commit. Anything else saved in the
+        current transaction is committed along with them.
+        '''
+        self.last_flush = time.time()
+        messages, self.pending = self.pending, []
+        try:
+            if messages:
+                ImportTaskMessage.objects.bulk_create(messages)
+            transaction.commit()
+        except Exception as exc:
+            transaction.rollback()
+            logger.error(u"Error adding messages to import task %d: %s" % (self.import_task.id, unicode(exc)))
+
+
+def get_message_buffer(import_task):
+    '''
+    Return the message buffer attached to an import task, creating it on
+    first use.
+    '''
+    buffer = getattr(import_task, '_message_buffer', None)
+    if buffer is None:
+        buffer = import_task._message_buffer = ImportMessageBuffer(import_task)
+    return buffer
@@ -0,0 +1,100 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import logging
+import time
+
+from django.db import connection, transaction
+
+from galaxy.main.models import ImportTaskStage
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImportProfiler(object):
+    '''
+    Splits an import run into consecutive named stages and records the wall
+    time, database query count and GitHub request count of each. Starting a
+    stage ends the previous one. Queries are counted through the debug
+    cursor, which is forced on inside a with block over the profiler:
+
+        with get_import_profiler(import_task) as profiler:
+            profiler.start('setup')
+    '''
+
+    def __init__(self, import_task):
+        self.import_task = import_task
+        self.fetcher = None
+        self.stages = []
+        self._current = None
+        self._force_debug_cursor = None
+
+    def __enter__(self):
+        self._force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        connection.force_debug_cursor = self._force_debug_cursor
+        connection.queries_log.clear()
+
+    def _github_request_count(self):
+        return self.fetcher.request_count if self.fetcher is not None else 0
+
+    def start(self, name):
+        self.finish()
+        connection.queries_log.clear()
+        self._current = (name, time.time(), self._github_request_count())
+
+    def finish(self):
+        if self._current is None:
+            return
+        name, started, github_requests = self._current
+        self._current = None
+        self.stages.append(ImportTaskStage(
+            task=self.import_task,
+            name=name,
+            position=len(self.stages),
+            duration=time.time() - started,
+            query_count=len(connection.queries_log),
+            github_request_count=self._github_request_count() - github_requests,
+        ))
+
+    def save(self):
+        '''
+        End the current stage, write all stages and commit.
+        '''
+        self.finish()
+        stages, self.stages = self.stages, []
+        try:
+            ImportTaskStage.objects.bulk_create(stages)
+            transaction.commit()
+        except Exception as exc:
+            transaction.rollback()
+            logger.error(u"Error saving stages of import task %d: %s" % (self.import_task.id, unicode(exc)))
+
+
+def get_import_profiler(import_task):
+    '''
+    Return the profiler attached to an import task, creating it on first
+    use.
+    '''
+    profiler = getattr(import_task, '_profiler', None)
+    if profiler is None:
+        profiler = import_task._profiler = ImportProfiler(import_task)
+    return profiler
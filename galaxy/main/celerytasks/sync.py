@@ -0,0 +1,96 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+"""
+Set based synchronization of import results with existing rows.
+"""
+
+from django.utils import timezone
+
+from galaxy.main.models import RoleVersion
+from galaxy.main.utils.db import bulk_update
+
+
+def sync_role_versions(role, tags, resolve_dates=None):
+    '''
+    Make the role's RoleVersion rows match the list of git tags, each a
+    dict with 'name' and 'date' keys. New versions are bulk created,
+    versions whose release date changed are bulk updated, and versions
+    without a matching tag are removed with one DELETE. Removal is skipped
+    when tags is empty.
+
+    resolve_dates is called with the names of new tags that have no date,
+    and returns a dict mapping names to dates.
+
+    Returns an (added, updated, removed) tuple of sets of version names.
+    '''
+    existing = dict((version.name, version) for version in RoleVersion.objects.filter(role=role))
+    tag_dates = dict((tag['name'], tag['date']) for tag in tags)
+
+    added = set(tag_dates) - set(existing)
+    removed = set(existing) - set(tag_dates) if tag_dates else set()
+
+    undated = [name for name in added if tag_dates[name] is None]
+    if undated and resolve_dates is not None:
+        tag_dates.update(resolve_dates(undated))
+
+    if added:
+        RoleVersion.objects.bulk_create([
+            RoleVersion(role=role, name=name, loose_version=name, release_date=tag_dates[name])
+            for name in sorted(added)
+        ])
+
+    changed = []
+    modified = timezone.now()
+    for name in set(tag_dates) & set(existing):
+        version = existing[name]
+        if tag_dates[name] is not None and version.release_date != tag_dates[name]:
+            version.release_date = tag_dates[name]
+            version.modified = modified
+            changed.append(version)
+    bulk_update(changed, ['release_date', 'modified'])
+
+    if removed:
+        RoleVersion.objects.filter(role=role, name__in=removed).delete()
+
+    return added, set(version.name for version in changed), removed
+
+
+def sync_relation(instance, field_name, objects):
+    '''
+    Make the many-to-many relation field_name of instance hold exactly the
+    given objects. Missing links are inserted into the through table with
+    one bulk_create and stale links are removed with one DELETE.
+
+    Returns an (added, removed) tuple of sets of related objects.
+    '''
+    field = instance._meta.get_field(field_name)
+    through = field.rel.through
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+
+    wanted = dict((obj.pk, obj) for obj in objects)
+    current = dict((obj.pk, obj) for obj in getattr(instance, field_name).all())
+    add_ids = set(wanted) - set(current)
+    remove_ids = set(current) - set(wanted)
+
+    if add_ids:
+        through.objects.bulk_create([through(**{source: instance.pk, target: pk}) for pk in add_ids])
+    if remove_ids:
+        through.objects.filter(**{source: instance.pk, target + '__in': remove_ids}).delete()
+
+    return set(wanted[pk] for pk in add_ids), set(current[pk] for pk in remove_ids)
@@ -20,7 +20,6 @@ import yaml
 import datetime
 import requests
 import logging
-import pytz
 
 from celery import task
 from github import Github
@@ -28,7 +27,9 @@ from github import GithubException, UnknownObjectException
 from urlparse import urlparse
 from requests import HTTPError
 from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
 from allauth.socialaccount.models import SocialToken
 
@@ -40,15 +41,27 @@ from galaxy.main.models import (Platform,
                                 Tag,
                                 Role,
                                 ImportTask,
-                                RoleVersion,
+                                RefreshRoleCount,
                                 Namespace)
-from galaxy.main.celerytasks.elastic_tasks import update_custom_indexes
+from galaxy.main.celerytasks.elastic_tasks import queue_index_update, update_search_fields
+from galaxy.main.downloads import take_downloads
+from galaxy.main.facets import facet_deltas, role_facets
+from galaxy.main.celerytasks.sync import sync_relation, sync_role_versions
+from galaxy.main.celerytasks.import_log import get_message_buffer
+from galaxy.main.celerytasks.profiling import get_import_profiler
+from galaxy.main.utils.memcache_lock import memcache_lock, MemcacheLockException
+from galaxy.main.celerytasks.github_fetch import GithubFetcher, GithubFetchError, RepoSnapshot, fetch_repos
+from galaxy.main.utils.db import bulk_increment, bulk_update
+from galaxy.main.celerytasks.token_pool import TokenPool, RateLimitExhausted
+from galaxy.main.celerytasks import token_pool
 
 
 logger = logging.getLogger(__name__)
 
 META_FILES = ["meta/main.yml", "meta/main.yaml", "meta.yml", "meta.yaml"]
 
+CONTAINER_FILES = ["meta/container.yml", "container.yml"]
+
 
 def get_repo_raw(token, repo_name):
     '''
@@ -61,9 +74,15 @@ def get_repo_raw(token, repo_name):
     :return: dict of repository attributes
     '''
     auth_header = {u'Authorization': u'token ' + token}
+    url = u"{0}/repos/{1}".format(settings.GITHUB_SERVER, repo_name)
     try:
-        url = u"{0}/repos/{1}".format(settings.GITHUB_SERVER, repo_name)
         response = requests.get(url, headers=auth_header)
+    except Exception as exc:
+        raise Exception(u"Failed to access GitHub API - {0}".format(exc.message))
+    token_pool.record(token, response.headers)
+    if token_pool.is_rate_limited(response):
+        raise RateLimitExhausted(token_pool.reset_in(response))
+    try:
         response.raise_for_status()
         repo = response.json()
         if repo.get('message'):
@@ -145,81 +164,227 @@ def refresh_existing_user_repos(token, github_user):
     """
     logger.info("Starting refresh_existing_user_repos for GitHub user {0}"
                 .format(github_user.login))
-    remove_roles = []
+    fetcher = GithubFetcher(token)
+    try:
+        refresh_repo_metadata(Role.objects.filter(github_user=github_user.login), fetcher)
+    except Exception as exc:
+        logger.error(u"Error: refresh_existing_user_repos - {0}".format(unicode(exc)))
+    finally:
+        fetcher.close()
 
-    for role in Role.objects.filter(github_user=github_user.login):
-        full_name = "{0}/{1}".format(role.github_user, role.github_repo)
-        try:
-            repo = get_repo_raw(token, full_name)
-            if not repo or not repo.get('name') or not repo.get('owner'):
-                continue
-            repo_name = repo['name']
-            repo_owner = repo['owner']['login']
-            if (role.github_repo.lower() != repo_name.lower()
-                    or role.github_user.lower() != repo_owner.lower()):
-                logger.info(u'UPDATED: {0} to {1}/{2}'.format(
-                    full_name, repo_owner, repo_name))
-                role.github_user = repo_owner
-                role.github_repo = repo_name
-                role.save()
-        except UnknownObjectException:
-            logger.error(u"NOT FOUND: {0}".format(full_name))
-            remove_roles.append(role.id)
-        except Exception as exc:
-            logger.error(u"Error: refresh_existing_user_repos {0} - {1}"
-                         .format(full_name, exc.message))
+    logger.info("Finished refresh_existing_user_repos for GitHub user {0}"
+                .format(github_user.login))
 
-    for role_id in remove_roles:
-        try:
-            role = Role.objects.get(id=role_id)
-            logger.info(u'DELETING: {0}/{1}'.format(role.namespace, role.name))
+
+def refresh_repo_metadata(roles, fetcher):
+    """
+    Refresh the GitHub counts, owner and name of the given roles with batched
+    GraphQL lookups, and write them back with one bulk update. Roles whose
+    repo no longer exists are deleted. Returns a dict counting the roles that
+    passed, were updated (renamed), deleted or failed.
+    """
+    roles = list(roles)
+    full_names = [u"%s/%s" % (role.github_user, role.github_repo) for role in roles]
+    repos = fetch_repos(fetcher, full_names)
+    counts = dict(passed=0, failed=0, deleted=0, updated=0)
+    changed = []
+    modified = timezone.now()
+    for role, full_name in zip(roles, full_names):
+        if full_name not in repos:
+            logger.error(u"FAILED: {0}".format(full_name))
+            counts['failed'] += 1
+            continue
+        repo = repos[full_name]
+        if repo is None:
+            logger.error(u"NOT FOUND: {0}".format(full_name))
             role.delete()
-        except Exception as exc:
-            logger.error(u"Error: refresh_existing_user_repos - {0}"
-                         .format(exc.message))
+            counts['deleted'] += 1
+            continue
+        role.stargazers_count = repo['stargazers_count']
+        role.watchers_count = repo['watchers_count']
+        role.forks_count = repo['forks_count']
+        role.open_issues_count = repo['open_issues_count']
+        if role.github_repo.lower() != repo['name'].lower() or role.github_user.lower() != repo['owner'].lower():
+            logger.info(u'UPDATED: {0} to {1}/{2}'.format(full_name, repo['owner'], repo['name']))
+            role.github_user = repo['owner']
+            role.github_repo = repo['name']
+            # renames are rare, save them individually so the search index follows
+            role.save()
+            counts['updated'] += 1
+            continue
+        role.modified = modified
+        changed.append(role)
+        counts['passed'] += 1
+    bulk_update(changed, ['stargazers_count', 'watchers_count', 'forks_count', 'open_issues_count', 'modified'])
+    return counts
+
+
+def update_namespace(snapshot):
+    # Use the GitHub owner, either a user or an organization, to update namespace attributes
+    owner = snapshot.owner
+    attributes = {
+        'name': owner.get('name'),
+        'avatar_url': owner.get('avatar_url'),
+        'location': owner.get('location'),
+        'company': owner.get('company'),
+        'email': owner.get('email'),
+        'html_url': owner.get('html_url'),
+        'followers': owner.get('followers'),
+    }
+    namespace, created = Namespace.objects.get_or_create(namespace=owner['login'], defaults=attributes)
+    if not created:
+        attributes.pop('name')
+        for key, value in attributes.items():
+            setattr(namespace, key, value)
+        namespace.save()
+    return True
 
-    logger.info("Finished refresh_existing_user_repos for GitHub user {0}"
-                .format(github_user.login))
 
+def import_lock_key(role_id, reference):
+    """
+    Lock serializing the creation and hand-off of imports of one role and
+    reference.
+    """
+    return u"import_%d_%s" % (role_id, reference or '')
 
-def update_namespace(repo):
-    # Use GitHub repo to update namespace attributes
-    if repo.owner.type == 'Organization':
-        namespace, created = Namespace.objects.get_or_create(namespace=repo.organization.login, defaults={
-                                                             'name': repo.organization.name,
-                                                             'avatar_url': repo.organization.avatar_url,
-                                                             'location': repo.organization.location,
-                                                             'company': repo.organization.company,
-                                                             'email': repo.organization.email,
-                                                             'html_url': repo.organization.html_url,
-                                                             'followers': repo.organization.followers})
-        if not created:
-            namespace.avatar_url = repo.organization.avatar_url
-            namespace.location = repo.organization.location
-            namespace.company = repo.organization.company
-            namespace.email = repo.organization.email
-            namespace.html_url = repo.organization.html_url
-            namespace.followers = repo.organization.followers
-            namespace.save()
 
-    else:
-        namespace, created = Namespace.objects.get_or_create(namespace=repo.owner.login, defaults={
-                                                             'name': repo.owner.name,
-                                                             'avatar_url': repo.owner.avatar_url,
-                                                             'location': repo.owner.location,
-                                                             'company': repo.owner.company,
-                                                             'email': repo.owner.email,
-                                                             'html_url': repo.owner.html_url,
-                                                             'followers': repo.owner.followers})
-        if not created:
-            namespace.avatar_url = repo.owner.avatar_url
-            namespace.location = repo.owner.location
-            namespace.company = repo.owner.company
-            namespace.email = repo.owner.email
-            namespace.html_url = repo.owner.html_url
-            namespace.followers = repo.owner.followers
-            namespace.save()
-    return True
+def filter_reference(queryset, reference):
+    """
+    Filter import tasks by reference, treating None and '' alike.
+    """
+    if reference:
+        return queryset.filter(github_reference=reference)
+    return queryset.filter(Q(github_reference__isnull=True) | Q(github_reference=''))
+
+
+def create_import_task(
+        github_user, github_repo, github_branch, role, user,
+        travis_status_url='', travis_build_url='', alternate_role_name=None,
+        commit=None, force=False, bulk_reimport=None):
+    """
+    Request an import of role at github_branch. At most one import per role
+    and reference is pending or running at a time:
+
+    - a pending import is returned, taking the alternate role name of this
+      request, as it has not read the repo yet
+    - a running import of the same commit and role name is returned as is
+    - otherwise a single follow-up import is queued, which is started when
+      the running import ends
+
+    force requests a full import even when the commit has not changed.
+    bulk_reimport is the BulkReimport run requesting the import, if any.
+    """
+    try:
+        with memcache_lock(import_lock_key(role.id, github_branch), attempts=5):
+            return _coalesce_import_task(
+                github_user, github_repo, github_branch, role, user,
+                travis_status_url, travis_build_url, alternate_role_name,
+                commit, force, bulk_reimport)
+    except MemcacheLockException as exc:
+        logger.warning(u"Unable to coalesce import of role %d: %s" % (role.id, unicode(exc)))
+    return _new_import_task(
+        github_user, github_repo, github_branch, role, user,
+        travis_status_url, travis_build_url, alternate_role_name, force, bulk_reimport)
+
+
+def _new_import_task(
+        github_user, github_repo, github_branch, role, user,
+        travis_status_url, travis_build_url, alternate_role_name, force,
+        bulk_reimport, start=True):
+    task = ImportTask.objects.create(
+        github_user=github_user,
+        github_repo=github_repo,
+        github_reference=github_branch,
+        alternate_role_name=alternate_role_name,
+        travis_status_url=travis_status_url,
+        travis_build_url=travis_build_url,
+        role=role,
+        owner=user,
+        state='PENDING',
+        force=force,
+        bulk_reimport=bulk_reimport
+    )
+    if start:
+        task.celery_task_id = import_role.delay(task.id).id
+        task.save()
+    return task
+
+
+def _coalesce_import_task(
+        github_user, github_repo, github_branch, role, user,
+        travis_status_url, travis_build_url, alternate_role_name, commit,
+        force, bulk_reimport):
+    in_flight = filter_reference(ImportTask.objects.filter(
+        role=role, state__in=['PENDING', 'RUNNING'], active=True), github_branch)
+
+    pending = in_flight.filter(state='PENDING').order_by('-id').first()
+    if pending is not None:
+        if travis_build_url:
+            pending.travis_status_url = travis_status_url
+            pending.travis_build_url = travis_build_url
+        pending.force = pending.force or force
+        pending.alternate_role_name = alternate_role_name
+        if pending.bulk_reimport_id is None:
+            pending.bulk_reimport = bulk_reimport
+        pending.save()
+        return pending
+
+    running = in_flight.filter(state='RUNNING').order_by('-id').first()
+    if (running is not None and commit and running.commit == commit and (running.force or not force)
+            and running.alternate_role_name == alternate_role_name):
+        return running
+
+    # the follow-up waits for the running import to hand it to Celery
+    return _new_import_task(
+        github_user, github_repo, github_branch, role, user,
+        travis_status_url, travis_build_url, alternate_role_name, force,
+        bulk_reimport, start=running is None)
+
+
+def start_follow_up_import(import_task):
+    """
+    Enqueue the follow-up import that was queued behind import_task while it
+    was running, if any. Call once import_task has ended.
+    """
+    return start_queued_import(import_task.role_id, import_task.github_reference)
+
+
+def start_queued_import(role_id, reference):
+    """
+    Enqueue the oldest follow-up import of a role and reference unless an
+    import of them is still in flight. Follow-ups are PENDING tasks not yet
+    handed to Celery.
+    """
+    try:
+        with memcache_lock(import_lock_key(role_id, reference), attempts=5):
+            queued = filter_reference(ImportTask.objects.filter(role_id=role_id, state__in=['PENDING', 'RUNNING']),
+                                      reference)
+            if queued.filter(celery_task_id__isnull=False).exists():
+                return None
+            follow_up = queued.filter(state='PENDING').order_by('id').first()
+            if follow_up is None:
+                return None
+            follow_up.celery_task_id = import_role.delay(follow_up.id).id
+            follow_up.save()
+            transaction.commit()
+            return follow_up
+    except MemcacheLockException as exc:
+        logger.error(u"Unable to start follow-up import of role %d: %s" % (role_id, unicode(exc)))
+
+
+def defer_import_task(import_task, exc):
+    """
+    Put the import back in the queue until the GitHub quota resets, and
+    raise celery's Retry exception.
+    """
+    transaction.rollback()
+    import_task.state = "PENDING"
+    import_task.deferred_until = timezone.now() + datetime.timedelta(seconds=exc.reset_in)
+    import_task.save()
+    add_message(import_task, u"INFO", u"GitHub API rate limit reached, the import will resume in %d "
+                                      u"seconds" % exc.reset_in)
+    flush_messages(import_task)
+    raise import_role.retry(countdown=exc.reset_in, max_retries=None)
 
 
 def fail_import_task(import_task, msg):
@@ -230,10 +395,13 @@ def fail_import_task(import_task, msg):
     try:
         if import_task:
             import_task.state = "FAILED"
-            import_task.messages.create(message_type="ERROR", message_text=msg[:255])
             import_task.finished = timezone.now()
             import_task.save()
-            transaction.commit()
+            buffer = get_message_buffer(import_task)
+            buffer.add(u"ERROR", msg)
+            buffer.flush()
+            get_import_profiler(import_task).save()
+            start_follow_up_import(import_task)
     except Exception as e:
         transaction.rollback()
         logger.error(u"Error updating import task state %s: %s" % (import_task.role.name, str(e)))
@@ -255,54 +423,36 @@ def strip_input(input):
 
 
 def add_message(import_task, msg_type, msg_text):
-    try:
-        import_task.messages.create(message_type=msg_type, message_text=msg_text[:255])
-        import_task.save()
-        transaction.commit()
-    except Exception as e:
-        transaction.rollback()
-        logger.error(u"Error adding message to import task for role %s: %s" % (import_task.role.name, e.message))
-    logger.info(u"Role %d: %s - %s" % (import_task.role.id, msg_type, msg_text))
+    get_message_buffer(import_task).add(msg_type, msg_text)
+    logger.info(u"Role %d: %s - %s" % (import_task.role_id, msg_type, msg_text))
+
 
+def flush_messages(import_task):
+    get_message_buffer(import_task).flush()
 
-def get_readme(import_task, repo, branch, token):
+
+def get_readme(import_task, snapshot):
     """
-    Retrieve README from the repo and sanitize by removing all markup. Should preserve unicode characters.
+    Retrieve README from the repo snapshot and sanitize by removing all markup. Should preserve unicode characters.
     """
     add_message(import_task, "INFO", "Parsing and validating README")
     file_type = None
-    readme_html = ''
+    readme_html = snapshot.readme_html or ''
     readme_raw = ''
-    headers = {'Authorization': 'token %s' % token, 'Accept': 'application/vnd.github.VERSION.html'}
-    url = "https://api.github.com/repos/%s/readme" % repo.full_name
-    data = None
-    if import_task.github_reference:
-        data = {'ref': branch}
-    try:
-        response = requests.get(url, headers=headers, data=data)
-        response.raise_for_status()
-        readme_html = response.text
-    except Exception as exc:
-        add_message(import_task, u"ERROR", u"Failed to get HTML version of README: %s" % unicode(exc))
+    if snapshot.readme_error:
+        add_message(import_task, u"ERROR", u"Failed to get README: %s" % snapshot.readme_error)
+    if snapshot.readme_html_error:
+        add_message(import_task, u"ERROR", u"Failed to get HTML version of README: %s" % snapshot.readme_html_error)
 
-    readme = ''
-    try:
-        if import_task.github_reference:
-            readme = repo.get_readme(ref=branch)
-        else:
-            readme = repo.get_readme()
-    except:
-        pass
-
-    if readme:
-        if readme.name == 'README.md':
+    if snapshot.readme:
+        if snapshot.readme_name == 'README.md':
             file_type = 'md'
-        elif readme.name == 'README.rst':
+        elif snapshot.readme_name == 'README.rst':
             file_type = 'rst'
         else:
             add_message(import_task, u"ERROR", u"Unable to determine README file type. Expecting file "
                                                u"extension to be one of: .md, .rst")
-        readme_raw = readme.decoded_content
+        readme_raw = snapshot.readme_content
     return readme_raw, readme_html, file_type
 
 
@@ -316,17 +466,13 @@ def parse_yaml(import_task, file_name, file_contents):
     return contents
 
 
-def decode_file(import_task, repo, branch, file_name, return_yaml=False):
-    try:
-        contents = repo.get_file_contents(file_name, ref=branch)
-    except Exception:
-        return None
-
-    try:
-        contents = contents.content.decode('base64')
-    except Exception as exc:
-        fail_import_task(import_task, u"Failed to decode %s - %s" % (file_name, unicode(exc)))
+def decode_file(import_task, snapshot, file_name, return_yaml=False):
+    if file_name in snapshot.file_errors:
+        fail_import_task(import_task, u"Failed to decode %s - %s" % (file_name, snapshot.file_errors[file_name]))
 
+    contents = snapshot.files.get(file_name)
+    if contents is None:
+        return None
     if not return_yaml:
         return contents
     return parse_yaml(import_task, file_name, contents)
@@ -338,44 +484,40 @@ def add_platforms(import_task, galaxy_info, role):
     if isinstance(meta_platforms, basestring) or not hasattr(meta_platforms, '__iter__'):
         add_message(import_task, u"ERROR", u"Expected platforms in meta data to be a list.")
         return
-    platform_list = []
+    requested = []
     for platform in meta_platforms:
         if not isinstance(platform, dict):
             add_message(import_task, u"ERROR", u"The platform '%s' does not appear to be a dictionary, "
                                                u"skipping" % str(platform))
             continue
-        try:
-            if not platform.get("name"):
-                add_message(import_task, u"ERROR", u"No name specified for platform, skipping")
-                continue
-            name = platform.get("name")
-            versions = platform.get("versions", ["all"])
-            if 'all' in versions:
-                # grab all of the objects that start with the platform name
-                try:
-                    platform_objs = Platform.objects.filter(name=name)
-                    for p in platform_objs:
-                        role.platforms.add(p)
-                        platform_list.append("%s-%s" % (name, p.release))
-                except:
-                    add_message(import_task, u"ERROR", u"Invalid platform: %s-all (skipping)" % name)
+        if not platform.get("name"):
+            add_message(import_task, u"ERROR", u"No name specified for platform, skipping")
+            continue
+        versions = platform.get("versions", ["all"])
+        if isinstance(versions, basestring) or not hasattr(versions, '__iter__'):
+            versions = [versions]
+        requested.append((platform.get("name"), versions))
+
+    # resolve every requested platform with a single query
+    by_name = {}
+    for p in Platform.objects.filter(name__in=[name for name, _ in requested]):
+        by_name.setdefault(p.name, []).append(p)
+    by_release = dict(((p.name, p.release), p) for name in by_name for p in by_name[name])
+
+    platforms = []
+    for name, versions in requested:
+        if 'all' in versions:
+            # grab all of the objects that start with the platform name
+            platforms.extend(by_name.get(name, []))
+            continue
+        for version in versions:
+            p = by_release.get((name, unicode(version)))
+            if p is None:
+                add_message(import_task, u"ERROR", u"Invalid platform: %s-%s (skipping)" % (name, version))
                 continue
-            for version in versions:
-                try:
-                    p = Platform.objects.get(name=name, release=version)
-                    role.platforms.add(p)
-                    platform_list.append(u"%s-%s" % (name, p.release))
-                except:
-                    add_message(import_task, u"ERROR", u"Invalid platform: %s-%s (skipping)" %
-                                (name, version))
-        except Exception as exc:
-            add_message(import_task, u"ERROR", u"An unknown error occurred while adding platform: %s" % unicode(exc))
-
-    # Remove platforms/versions that are no longer listed in the metadata
-    for platform in role.platforms.all():
-        platform_key = "%s-%s" % (platform.name, platform.release)
-        if platform_key not in platform_list:
-            role.platforms.remove(platform)
+            platforms.append(p)
+
+    sync_relation(role, 'platforms', platforms)
 
 
 def _add_cloud_platforms(import_task, galaxy_info, role):
@@ -389,21 +531,12 @@ def _add_cloud_platforms(import_task, galaxy_info, role):
                     u'No cloud platforms found in meta data')
 
     cloud_platforms = set(cloud_platforms)
+    platforms = list(CloudPlatform.objects.filter(name__in=cloud_platforms))
+    for name in cloud_platforms - set(p.name for p in platforms):
+        add_message(import_task, u'ERROR',
+                    u'Invalid cloud platform: {0}, skipping'.format(name))
 
-    # Remove cloud platforms that are no longer listed in the metadata
-    for platform in role.cloud_platforms.all():
-        if platform.name not in cloud_platforms:
-            role.cloud_platforms.remove(platform)
-
-    # Add new cloud platforms
-    for name in cloud_platforms:
-        try:
-            platform = CloudPlatform.objects.get(name=name)
-        except CloudPlatform.DoesNotExist:
-            add_message(import_task, u'ERROR',
-                        u'Invalid cloud platform: {0}, skipping'.format(name))
-            continue
-        role.cloud_platforms.add(platform)
+    sync_relation(role, 'cloud_platforms', platforms)
 
 
 def add_dependencies(import_task, dependencies, role):
@@ -414,7 +547,7 @@ def add_dependencies(import_task, dependencies, role):
         add_message(import_task, "ERROR", "Expected dependencies to be a list, "
                                           "instead got %s" % type(dependencies).__name__)
         return
-    dep_names = []
+    dep_keys = []
     for dep in dependencies:
         try:
             dep_parsed = RoleRequirement.role_yaml_parse(dep)
@@ -431,21 +564,24 @@ def add_dependencies(import_task, dependencies, role):
             else:
                 namespace = names[0]
                 name = names[1]
-            try:
-                dep_role = Role.objects.get(namespace=namespace, name=name)
-                role.dependencies.add(dep_role)
-                dep_names.append(dep_parsed['name'])
-            except Exception as exc:
-                logger.error("Error loading dependencies %s" % unicode(exc))
-                raise Exception(u"Role dependency not found: %s.%s" % (namespace, name))
+            dep_keys.append((namespace, name))
         except (AnsibleError, Exception) as exc:
             add_message(import_task, u'ERROR', u'Error parsing dependency %s' % unicode(exc))
 
-    # Remove deps that are no longer listed in the metadata
-    for dep in role.dependencies.all():
-        dep_name = dep.__unicode__()
-        if dep_name not in dep_names:
-            role.dependencies.remove(dep)
+    # resolve every dependency with a single query
+    dep_roles = []
+    if dep_keys:
+        query = Q()
+        for namespace, name in dep_keys:
+            query |= Q(namespace=namespace, name=name)
+        dep_roles = list(Role.objects.filter(query))
+    found = set((dep_role.namespace, dep_role.name) for dep_role in dep_roles)
+    for namespace, name in dep_keys:
+        if (namespace, name) not in found:
+            add_message(import_task, u'ERROR',
+                        u'Error parsing dependency Role dependency not found: %s.%s' % (namespace, name))
+
+    sync_relation(role, 'dependencies', dep_roles)
 
 
 def add_tags(import_task, galaxy_info, role):
@@ -486,22 +622,15 @@ def add_tags(import_task, galaxy_info, role):
                                              u"Only the first 20 will be used.")
         meta_tags = meta_tags[0:20]
 
-    meta_tags = list(set(meta_tags))
+    meta_tags = set(meta_tags)
 
-    for tag in meta_tags:
-        pg_tags = Tag.objects.filter(name=tag).all()
-        if len(pg_tags) == 0:
-            pg_tag = Tag(name=tag, description=tag, active=True)
-            pg_tag.save()
-        else:
-            pg_tag = pg_tags[0]
-        if not role.tags.filter(name=tag).exists():
-            role.tags.add(pg_tag)
+    pg_tags = list(Tag.objects.filter(name__in=meta_tags))
+    new_tags = meta_tags - set(tag.name for tag in pg_tags)
+    if new_tags:
+        Tag.objects.bulk_create([Tag(name=tag, description=tag, active=True) for tag in new_tags])
+        pg_tags.extend(Tag.objects.filter(name__in=new_tags))
 
-    # Remove tags no longer listed in the metadata
-    for tag in role.tags.all():
-        if tag.name not in meta_tags:
-            role.tags.remove(tag)
+    sync_relation(role, 'tags', pg_tags)
 
 
 def update_role_videos(import_task, role, videos=None):
@@ -581,6 +710,52 @@ def update_role_videos(import_task, role, videos=None):
                 role.videos.create(url=video['embed_url'], description=video['description'])
 
 
+def is_unchanged(import_task, role, snapshot):
+    """
+    True when the HEAD commit is the one the role was last successfully
+    imported from, and the import does not change the role name, so the
+    import can skip everything but the repo counters.
+    """
+    if import_task.force or not role.is_valid or not role.commit or role.commit != snapshot.commit_sha:
+        return False
+    if import_task.alternate_role_name and import_task.alternate_role_name != role.name:
+        return False
+    last_task = ImportTask.objects.filter(role=role, state__in=['SUCCESS', 'FAILED']) \
+        .exclude(pk=import_task.pk).order_by('-id').first()
+    return last_task is not None and last_task.state == 'SUCCESS'
+
+
+def import_unchanged_role(import_task, role, snapshot):
+    """
+    Fast path of import_role for an unchanged commit: refresh the repo
+    counters and the owner, and finish the task.
+    """
+    update_namespace(snapshot)
+    for obj in (role, import_task):
+        obj.stargazers_count = snapshot.stargazers_count
+        obj.watchers_count = snapshot.watchers_count
+        obj.forks_count = snapshot.forks_count
+        obj.open_issues_count = snapshot.open_issues_count
+    import_task.commit = snapshot.commit_sha
+    import_task.commit_message = snapshot.commit_message[:255]
+    import_task.commit_url = snapshot.commit_url
+    import_task.github_branch = snapshot.branch
+
+    add_message(import_task, u"INFO", u"Commit %s has not changed since the last successful import, "
+                                      u"only updating repo counts." % snapshot.commit_sha)
+    add_message(import_task, u"SUCCESS", u"Status SUCCESS : warnings=0 errors=0")
+    try:
+        import_task.state = u"SUCCESS"
+        import_task.finished = timezone.now()
+        import_task.save()
+        role.imported = timezone.now()
+        role.save()
+        transaction.commit()
+        flush_messages(import_task)
+    except Exception as e:
+        fail_import_task(import_task, u"Error saving role: %s" % e.message)
+
+
 @task(name="galaxy.main.celerytasks.tasks.import_role", throws=(Exception,))
 def import_role(task_id):
     try:
@@ -593,53 +768,87 @@ def import_role(task_id):
     except:
         fail_import_task(None, u"Failed to get task id: %d" % int(task_id))
 
+    with get_import_profiler(import_task) as profiler:
+        return run_import(import_task, profiler)
+
+
+def run_import(import_task, profiler):
+    """
+    Import the role of a RUNNING import task, recording its stages with
+    profiler.
+    """
+    profiler.start('setup')
     try:
         role = Role.objects.get(id=import_task.role.id)
     except:
-        fail_import_task(import_task, u"Failed to get role for task id: %d" % int(task_id))
+        fail_import_task(import_task, u"Failed to get role for task id: %d" % import_task.id)
+    # index counts only change for the tags and platforms the role gains or
+    # loses in this import
+    facets_before = role_facets(role)
 
     repo_full_name = role.github_user + "/" + role.github_repo
     add_message(import_task, u"INFO", u"Starting import %d: role_name=%s repo=%s" % (import_task.id,
                                                                                      role.name,
                                                                                      repo_full_name))
+    flush_messages(import_task)
     user = import_task.owner
     try:
         token = SocialToken.objects.get(account__user=user, account__provider='github')
     except:
         fail_import_task(import_task, (u"Failed to get GitHub account for Galaxy user %s. You must first "
                                        u"authenticate with GitHub." % user.username))
-    # create an API object and get the repo
+    # fetch everything the import needs from GitHub up front, with the
+    # owner's token while it has quota and the task users' tokens after
+    profiler.start('github_fetch')
+    pool = TokenPool.for_task_users(preferred=token.token)
     try:
-        gh_api = Github(token.token)
-        gh_api.get_api_status()
-    except:
-        fail_import_task(import_task, (u'Failed to connect to the GitHub API. This is most likely a temporary error, '
-                                       u'please retry your import in a few minutes.'))
-
+        github_token = pool.acquire(preferred=token.token)
+    except RateLimitExhausted as exc:
+        defer_import_task(import_task, exc)
+    fetcher = GithubFetcher(github_token, pool=pool)
+    profiler.fetcher = fetcher
+    snapshot = RepoSnapshot(fetcher, repo_full_name)
     try:
-        repo = gh_api.get_repo(repo_full_name)
-    except Exception as exc:
+        # determine which branch to use, None selects the repo's default branch
+        snapshot.fetch_head(import_task.github_reference or role.github_branch or None)
+        unchanged = is_unchanged(import_task, role, snapshot)
+        if not unchanged:
+            snapshot.fetch_contents(META_FILES + CONTAINER_FILES, readme_ref=import_task.github_reference or None)
+    except RateLimitExhausted as exc:
+        fetcher.close()
+        defer_import_task(import_task, exc)
+    except GithubFetchError as exc:
+        fetcher.close()
+        if exc.status is None:
+            fail_import_task(import_task, (u'Failed to connect to the GitHub API. This is most likely a temporary '
+                                           u'error, please retry your import in a few minutes.'))
+        elif snapshot.repo is None:
+            fail_import_task(import_task, u"Failed to find repo: %s" % repo_full_name)
         fail_import_task(import_task, u"Failed to get repo: %s - %s" % (repo_full_name, exc.message))
+    fetcher.close()
 
-    if not repo:
-        fail_import_task(import_task, u"Failed to find repo: %s" % repo_full_name)
+    # lets requests for the same commit attach to this run
+    ImportTask.objects.filter(pk=import_task.pk).update(commit=snapshot.commit_sha)
+    transaction.commit()
 
-    update_namespace(repo)
+    if unchanged:
+        profiler.start('save')
+        import_unchanged_role(import_task, role, snapshot)
+        profiler.save()
+        start_follow_up_import(import_task)
+        return True
 
-    # determine which branch to use
-    if import_task.github_reference:
-        branch = import_task.github_reference
-    elif role.github_branch:
-        branch = role.github_branch
-    else:
-        branch = repo.default_branch
+    profiler.start('metadata')
+    update_namespace(snapshot)
 
+    branch = snapshot.branch
     add_message(import_task, u"INFO", u"Accessing branch: %s" % branch)
+    flush_messages(import_task)
 
     # parse meta data
     add_message(import_task, u"INFO", u"Parsing and validating meta data.")
     for meta_file in META_FILES:
-        meta_data = decode_file(import_task, repo, branch, meta_file, return_yaml=True)
+        meta_data = decode_file(import_task, snapshot, meta_file, return_yaml=True)
         if meta_data:
             break
     if not meta_data:
@@ -656,7 +865,7 @@ def import_role(task_id):
         add_message(import_task, u"INFO", u"Setting role name to %s" % import_task.alternate_role_name)
         role.name = import_task.alternate_role_name
 
-    role.description = strip_input(galaxy_info.get("description", repo.description))
+    role.description = strip_input(galaxy_info.get("description", snapshot.description))
     role.author = strip_input(galaxy_info.get("author", ""))
     role.company = strip_input(galaxy_info.get("company", ""))
     role.license = strip_input(galaxy_info.get("license", ""))
@@ -669,13 +878,13 @@ def import_role(task_id):
 
     role.issue_tracker_url = strip_input(galaxy_info.get("issue_tracker_url", ""))
     role.github_branch = strip_input(galaxy_info.get("github_branch", ""))
-    role.github_default_branch = repo.default_branch
+    role.github_default_branch = snapshot.default_branch
 
     update_role_videos(import_task, role, videos=galaxy_info.get('video_links'))
 
     # check if meta/container.yml exists
-    container_yml = decode_file(import_task, repo, branch, 'meta/container.yml', return_yaml=False)
-    ansible_container_yml = decode_file(import_task, repo, branch, 'container.yml', return_yaml=False)
+    container_yml = decode_file(import_task, snapshot, 'meta/container.yml', return_yaml=False)
+    ansible_container_yml = decode_file(import_task, snapshot, 'container.yml', return_yaml=False)
     if container_yml and ansible_container_yml:
         add_message(import_task, u"ERROR", (u"Found container.yml and meta/container.yml. "
                                             u"A role can only have only one container.yml file."))
@@ -696,8 +905,8 @@ def import_role(task_id):
         role.role_type = role.ANSIBLE
         role.container_yml = None
 
-    if role.issue_tracker_url == "" and repo.has_issues:
-        role.issue_tracker_url = repo.html_url + '/issues'
+    if role.issue_tracker_url == "" and snapshot.has_issues:
+        role.issue_tracker_url = snapshot.html_url + '/issues'
 
     if role.company != "" and len(role.company) > 50:
         add_message(import_task, u"WARNING", u"galaxy_info.company exceeds max length of 50 in meta data")
@@ -734,31 +943,28 @@ def import_role(task_id):
             role.issue_tracker_url = ""
 
     # Update role attributes from repo
-    sub_count = 0
-    for sub in repo.get_subscribers():
-        sub_count += 1   # only way to get subscriber count via pygithub
-    role.stargazers_count = repo.stargazers_count
-    role.watchers_count = sub_count
-    role.forks_count = repo.forks_count
-    role.open_issues_count = repo.open_issues_count
-
-    last_commit = repo.get_commits(sha=branch)[0].commit
-    role.commit = last_commit.sha
-    role.commit_message = last_commit.message[:255]
-    role.commit_url = last_commit.html_url
-    role.commit_created = last_commit.committer.date.replace(tzinfo=pytz.UTC)
+    role.stargazers_count = snapshot.stargazers_count
+    role.watchers_count = snapshot.watchers_count
+    role.forks_count = snapshot.forks_count
+    role.open_issues_count = snapshot.open_issues_count
+
+    role.commit = snapshot.commit_sha
+    role.commit_message = snapshot.commit_message[:255]
+    role.commit_url = snapshot.commit_url
+    role.commit_created = snapshot.commit_date
 
     # Update the import task in the event the role is left in an invalid state.
-    import_task.stargazers_count = repo.stargazers_count
-    import_task.watchers_count = sub_count
-    import_task.forks_count = repo.forks_count
-    import_task.open_issues_count = repo.open_issues_count
-
-    import_task.commit = last_commit.sha
-    import_task.commit_message = last_commit.message[:255]
-    import_task.commit_url = last_commit.html_url
+    import_task.stargazers_count = snapshot.stargazers_count
+    import_task.watchers_count = snapshot.watchers_count
+    import_task.forks_count = snapshot.forks_count
+    import_task.open_issues_count = snapshot.open_issues_count
+
+    import_task.commit = snapshot.commit_sha
+    import_task.commit_message = snapshot.commit_message[:255]
+    import_task.commit_url = snapshot.commit_url
     import_task.github_branch = branch
 
+    profiler.start('relations')
     add_tags(import_task, galaxy_info, role)
 
     if role.role_type in (role.CONTAINER, role.ANSIBLE):
@@ -772,7 +978,8 @@ def import_role(task_id):
     if role.role_type in (role.CONTAINER, role.ANSIBLE) and meta_data.get('dependencies'):
         add_dependencies(import_task, meta_data['dependencies'], role)
 
-    readme, readme_html, readme_type = get_readme(import_task, repo, branch, token)
+    profiler.start('readme')
+    readme, readme_html, readme_type = get_readme(import_task, snapshot)
     if readme:
         role.readme = readme
         role.readme_html = readme_html
@@ -780,39 +987,24 @@ def import_role(task_id):
     else:
         fail_import_task(import_task, u"Failed to get README. All roles must include a README.")
 
-    # iterate over repo tags and create version objects
+    flush_messages(import_task)
+
+    # sync role versions with the repo tags
+    profiler.start('versions')
     add_message(import_task, u"INFO", u"Adding repo tags as role versions")
-    git_tag_list = []
     try:
-        git_tag_list = repo.get_tags()
-        for tag in git_tag_list:
-            rv, created = RoleVersion.objects.get_or_create(name=tag.name, role=role)
-            rv.release_date = tag.commit.commit.author.date.replace(tzinfo=pytz.UTC)
-            rv.save()
+        added, updated, removed = sync_role_versions(role, snapshot.tags, resolve_dates=snapshot.fetch_tag_dates)
+    except RateLimitExhausted as exc:
+        defer_import_task(import_task, exc)
     except Exception as exc:
-        add_message(import_task, u"ERROR", u"An error occurred while importing repo tags: %s" % unicode(exc))
-
-    add_message(import_task, u"INFO", u"Removing old tags")
-    if git_tag_list:
-        remove_versions = []
-        try:
-            for version in role.versions.all():
-                found = False
-                for tag in git_tag_list:
-                    if tag.name == version.name:
-                        found = True
-                        break
-                if not found:
-                    remove_versions.append(version.name)
-        except Exception as exc:
-            fail_import_task(import_task, u"Error identifying tags to remove: %s" % unicode(exc))
-
-        if remove_versions:
-            try:
-                for version_name in remove_versions:
-                    RoleVersion.objects.filter(name=version_name, role=role).delete()
-            except Exception as exc:
-                fail_import_task(import_task, u"Error removing tags from role: %s" % unicode(exc))
+        fail_import_task(import_task, u"Error syncing role versions with repo tags: %s" % unicode(exc))
+    # set by the tags request, or by the date lookups during the sync
+    if snapshot.tags_error:
+        add_message(import_task, u"ERROR", u"An error occurred while importing repo tags: %s" % snapshot.tags_error)
+    if removed:
+        add_message(import_task, u"INFO", u"Removed old tags: %s" % u', '.join(sorted(removed)))
+
+    profiler.start('save')
     try:
         role.validate_char_lengths()
     except Exception as exc:
@@ -824,8 +1016,9 @@ def import_role(task_id):
         add_message(import_task, u"ERROR", unicode(exc))
 
     # determine state of import task
-    error_count = import_task.messages.filter(message_type="ERROR").count()
-    warning_count = import_task.messages.filter(message_type="WARNING").count()
+    buffer = get_message_buffer(import_task)
+    error_count = buffer.error_count
+    warning_count = buffer.warning_count
     import_state = u"SUCCESS" if error_count == 0 else u"FAILED"
     add_message(import_task, u"INFO", u"Import completed")
     add_message(import_task, import_state,
@@ -840,17 +1033,27 @@ def import_role(task_id):
         role.is_valid = True
         role.save()
         transaction.commit()
+        flush_messages(import_task)
     except Exception as e:
         fail_import_task(import_task, u"Error saving role: %s" % e.message)
 
     # Update ES indexes
-    update_custom_indexes.delay(username=role.namespace,
-                                tags=role.get_tags(),
-                                platforms=role.get_unique_platforms(),
-                                cloud_platforms=role.get_cloud_platforms())
+    profiler.start('index')
+    deltas = facet_deltas(facets_before, role_facets(role))
+    queue_index_update(username=role.namespace, **dict((facet, list(changed)) for facet, changed in deltas.items()))
+    profiler.save()
+    start_follow_up_import(import_task)
     return True
 
 
+def record_rate_limit(token, gh_api):
+    """
+    Share the quota PyGithub saw on its last response with the token pool.
+    """
+    remaining = gh_api.rate_limiting[0]
+    token_pool.record_values(token, remaining, gh_api.rate_limiting_resettime)
+
+
 @task(name="galaxy.main.celerytasks.tasks.refresh_user_repos",
       throws=(Exception,))
 @transaction.atomic
@@ -891,6 +1094,7 @@ def refresh_user_repos(user, token):
     user.github_user = ghu.login
     user.cache_refreshed = True
     user.save()
+    record_rate_limit(token, gh_api)
 
 
 @task(name="galaxy.main.celerytasks.tasks.refresh_user_stars", throws=(Exception,))
@@ -958,54 +1162,65 @@ def refresh_user_stars(user, token):
             continue
         user.starred.create(role=role)
 
+    record_rate_limit(token, gh_api)
+
 
 @task(name="galaxy.main.celerytasks.tasks.refresh_role_counts")
-def refresh_role_counts(start, end, token, tracker):
+def refresh_role_counts(role_ids, tracker_id, token=None, batch=None):
     '''
-    Update each role with latest counts from GitHub
+    Update a batch of roles with latest counts from GitHub, and add the
+    results to the counters of the RefreshRoleCount tracker. Batches are
+    small and queued all at once, so idle workers keep pulling the next one.
+    The batch is looked up with GraphQL using the token of the task users'
+    pool with the most GraphQL quota, preferring token. When every token is exhausted the
+    batch is retried once the quota resets. Any other error fails the whole
+    batch, which still counts as finished so the tracker can finish.
+    batch numbers the batch for refresh_batch_key().
     '''
-    tracker.state = 'RUNNING'
-    tracker.save()
-    passed = 0
-    failed = 0
-    deleted = 0
-    updated = 0
-    for role in Role.objects.filter(is_valid=True, active=True, id__gt=start, id__lte=end):
-        full_name = "%s/%s" % (role.github_user, role.github_repo)
-        try:
-            repo = get_repo_raw(token, full_name)
-            if not repo:
-                raise Exception("Object is empty or NoneType")
-            if not repo.get('name') or not repo.get('owner'):
-                raise Exception("Object missing name and/or owner attributes")
-            repo_name = repo['name']
-            repo_owner = repo['owner']['login']
-            if role.github_repo.lower() != repo_name.lower() or role.github_user.lower() != repo_owner.lower():
-                updated += 1
-                logger.info(u'UPDATED: {0} to {1}/{2}'.format(
-                    full_name,
-                    repo_owner,
-                    repo_name
-                ))
-                role.github_user = repo_owner
-                role.github_repo = repo_name
-                role.save()
-            else:
-                passed += 1
-        except UnknownObjectException:
-            logger.error(u"NOT FOUND: {0}".format(full_name))
-            role.delete()
-            deleted += 1
-        except Exception as exc:
-            logger.error(u"FAILED: {0} - {1}".format(full_name, unicode(exc)))
-            failed += 1
+    RefreshRoleCount.objects.filter(pk=tracker_id, state='PENDING').update(state='RUNNING')
+    fetcher = None
+    try:
+        pool = TokenPool.for_task_users(preferred=token)
+        fetcher = GithubFetcher(pool.acquire(preferred=token, resource='graphql'), pool=pool)
+        counts = refresh_repo_metadata(
+            Role.objects.filter(is_valid=True, active=True, id__in=role_ids).order_by('id'), fetcher)
+    except RateLimitExhausted as exc:
+        logger.info(u"RATE LIMITED: retrying batch in {0} seconds".format(exc.reset_in))
+        _add_refresh_counts(tracker_id, dict(requests=fetcher.request_count if fetcher else 0,
+                                             rate_limit_waits=1))
+        raise refresh_role_counts.retry(countdown=exc.reset_in, max_retries=None)
+    except GithubFetchError as exc:
+        logger.error(u"FAILED: batch of {0} roles - {1}".format(len(role_ids), unicode(exc)))
+        counts = dict(failed=len(role_ids))
+    except Exception as exc:
+        logger.exception(u"FAILED: batch of {0} roles - {1}".format(len(role_ids), unicode(exc)))
+        counts = dict(failed=len(role_ids))
+    finally:
+        if fetcher is not None:
+            fetcher.close()
+
+    counts['requests'] = fetcher.request_count if fetcher else 0
+    _add_refresh_counts(tracker_id, counts, batch_finished=True)
+    if batch is not None:
+        cache.set(refresh_batch_key(tracker_id, batch), True, 60 * 60 * 24)
+
+
+def refresh_batch_key(tracker_id, batch):
+    """
+    Cache key set once the numbered batch of a RefreshRoleCount run has
+    finished.
+    """
+    return u"refresh_role_counts_%d_%d" % (tracker_id, batch)
 
-    tracker.state = 'FINISHED'
-    tracker.passed = passed
-    tracker.failed = failed
-    tracker.deleted = deleted
-    tracker.updated = updated
-    tracker.save()
+
+def _add_refresh_counts(tracker_id, counts, batch_finished=False):
+    updates = dict((key, F(key) + value) for key, value in counts.items())
+    if batch_finished:
+        updates['batches_finished'] = F('batches_finished') + 1
+    RefreshRoleCount.objects.filter(pk=tracker_id).update(**updates)
+    if batch_finished:
+        RefreshRoleCount.objects.filter(pk=tracker_id, batches_finished__gte=F('batches')) \
+            .update(state='FINISHED')
 
 
 # ----------------------------------------------------------------------
@@ -1017,7 +1232,12 @@ def clear_stuck_imports():
     one_hours_ago = timezone.now() - datetime.timedelta(seconds=3600)
     logger.info(u"Clear Stuck Imports: {}".format(one_hours_ago.strftime("%Y-%m-%d %H:%M:%S")).encode('utf-8').strip())
     try:
-        for ri in ImportTask.objects.filter(created__lte=one_hours_ago, state__in=['PENDING', 'RUNNING']):
+        # follow-ups not handed to Celery yet are waiting, not stuck, and so
+        # are imports deferred until the rate limit resets
+        stuck = ImportTask.objects.filter(created__lte=one_hours_ago, state__in=['PENDING', 'RUNNING'],
+                                          celery_task_id__isnull=False) \
+            .filter(Q(deferred_until__isnull=True) | Q(deferred_until__lte=one_hours_ago))
+        for ri in stuck:
             logger.info(u"Clear Stuck Imports: {0} - {1}.{2}"
                         .format(ri.id, ri.role.namespace, ri.role.name))
             ri.state = u"FAILED"
@@ -1028,6 +1248,28 @@ def clear_stuck_imports():
             )
             ri.save()
             transaction.commit()
+            start_follow_up_import(ri)
+
+        # follow-ups left behind by a worker that died before handing them on
+        queued = ImportTask.objects.filter(state='PENDING', celery_task_id__isnull=True, created__lte=one_hours_ago)
+        for role_id, reference in set(queued.values_list('role_id', 'github_reference')):
+            start_queued_import(role_id, reference)
     except Exception as exc:
         logger.error(u"Clear Stuck Imports ERROR: {}".format(unicode(exc)))
         raise
+
+
+@task(name="galaxy.main.celerytasks.tasks.flush_download_counts")
+def flush_download_counts():
+    '''
+    Move the downloads counted in the cache since the last flush into
+    Role.download_count with one UPDATE per batch of roles, and set the new
+    totals on the search documents with partial updates.
+    '''
+    flushed = 0
+    for deltas in take_downloads():
+        bulk_increment(Role, 'download_count', deltas)
+        totals = Role.objects.filter(id__in=deltas.keys()).values_list('id', 'download_count')
+        update_search_fields(Role, dict((role_id, {'download_count': total}) for role_id, total in totals))
+        flushed += sum(deltas.values())
+    logger.info(u"Flushed {0} downloads".format(flushed))
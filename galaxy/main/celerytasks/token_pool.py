@@ -0,0 +1,164 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+"""
+Shared GitHub token pool.
+
+The remaining quota and reset time of every token, as last reported by
+GitHub's X-RateLimit-* headers, are kept in the cache so all workers see
+them. The REST API ('core') and GraphQL ('graphql') quotas of a token are
+separate, and tracked separately. Callers ask the pool for the healthiest token instead of using a
+fixed one, and are told how long to wait when every token is exhausted.
+"""
+
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from allauth.socialaccount.models import SocialToken
+
+
+logger = logging.getLogger(__name__)
+
+# GitHub's hourly quota for authenticated requests
+DEFAULT_LIMIT = 5000
+
+
+class RateLimitExhausted(Exception):
+    def __init__(self, reset_in, all_tokens=False):
+        super(RateLimitExhausted, self).__init__(
+            u"GitHub rate limit exhausted{0}, resets in {1} seconds".format(
+                u" on all tokens" if all_tokens else u"", reset_in))
+        self.reset_in = reset_in
+
+
+def _keys(token, resource='core'):
+    digest = hashlib.sha1(token).hexdigest()
+    if resource != 'core':
+        digest = resource + '_' + digest
+    return 'github_rate_remaining_' + digest, 'github_rate_reset_' + digest
+
+
+def record(token, headers, resource='core'):
+    '''
+    Store the quota reported by the X-RateLimit headers of a response.
+    '''
+    remaining = headers.get('X-RateLimit-Remaining')
+    reset = headers.get('X-RateLimit-Reset')
+    if remaining is None or reset is None:
+        return
+    record_values(token, int(remaining), int(reset), resource=resource)
+
+
+def record_values(token, remaining, reset, resource='core'):
+    remaining_key, reset_key = _keys(token, resource)
+    # keep the state a little past the reset, after which it is stale
+    timeout = max(int(reset - time.time()), 0) + 60
+    cache.set_many({remaining_key: remaining, reset_key: reset}, timeout)
+
+
+def mark_exhausted(token, reset_in, resource='core'):
+    '''
+    Record that token has no quota left for the next reset_in seconds.
+    '''
+    record_values(token, 0, int(time.time()) + reset_in, resource=resource)
+
+
+def is_rate_limited(response):
+    return response.status_code == 403 and response.headers.get('X-RateLimit-Remaining') == '0'
+
+
+def reset_in(response):
+    reset = int(response.headers.get('X-RateLimit-Reset', 0))
+    return max(reset - int(time.time()), 0) + 1
+
+
+class TokenPool(object):
+    '''
+    Hands out the token with the most remaining quota. Tokens with no
+    recorded state are assumed to have their full quota. A token is only
+    handed out while its remaining quota is above settings.GITHUB_TOKEN_RESERVE.
+    '''
+
+    def __init__(self, tokens):
+        # drop duplicates, keeping order
+        self.tokens = []
+        for token in tokens:
+            if token and token not in self.tokens:
+                self.tokens.append(token)
+
+    @classmethod
+    def for_task_users(cls, preferred=None):
+        '''
+        Pool of the GitHub tokens of settings.GITHUB_TASK_USERS, preceded by
+        the preferred token when given.
+        '''
+        tokens = SocialToken.objects.filter(account__user__username__in=settings.GITHUB_TASK_USERS,
+                                            account__provider='github').values_list('token', flat=True)
+        return cls(([preferred] if preferred else []) + list(tokens))
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def quotas(self, resource='core'):
+        '''
+        Return a list of (token, remaining, reset) tuples.
+        '''
+        keys = dict((token, _keys(token, resource)) for token in self.tokens)
+        state = cache.get_many([key for pair in keys.values() for key in pair])
+        now = time.time()
+        quotas = []
+        for token in self.tokens:
+            remaining_key, reset_key = keys[token]
+            reset = state.get(reset_key)
+            remaining = state.get(remaining_key)
+            if reset is None or remaining is None or reset <= now:
+                quotas.append((token, DEFAULT_LIMIT, None))
+            else:
+                quotas.append((token, remaining, reset))
+        return quotas
+
+    def acquire(self, preferred=None, resource='core'):
+        '''
+        Return the preferred token while it has quota of resource to spare,
+        otherwise the healthiest token. Raises RateLimitExhausted when no
+        token has quota above the reserve.
+        '''
+        if not self.tokens:
+            raise ValueError(u"The GitHub token pool is empty")
+        quotas = self.quotas(resource)
+        reserve = settings.GITHUB_TOKEN_RESERVE
+        available = [quota for quota in quotas if quota[1] > reserve]
+        if not available:
+            reset = min(quota[2] for quota in quotas)
+            raise RateLimitExhausted(max(int(reset - time.time()), 0) + 1, all_tokens=True)
+
+        token = None
+        if preferred is not None:
+            token = next((quota[0] for quota in available if quota[0] == preferred), None)
+        if token is None:
+            token = max(available, key=lambda quota: quota[1])[0]
+
+        # claim one request so concurrent callers spread across tokens
+        try:
+            cache.decr(_keys(token, resource)[0])
+        except ValueError:
+            pass
+        return token
@@ -0,0 +1,82 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+"""
+Write-behind role download counts.
+
+A download only increments a counter in the cache, and queues the role ID
+the first time the role is downloaded after a flush. The periodic
+flush_download_counts task moves the counted downloads of the queued roles
+into Role.download_count and the search index in bulk.
+"""
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+
+from galaxy.main.utils.cache_queue import CacheQueue
+
+
+DIRTY_QUEUE = CacheQueue('role_downloads')
+
+
+def _key(role_id):
+    return 'role_downloads_%d' % role_id
+
+
+def _dirty_key(role_id):
+    return 'role_downloads_dirty_%d' % role_id
+
+
+def record_download(role_id):
+    key = _key(role_id)
+    try:
+        django_cache.incr(key)
+    except ValueError:
+        # first download since the counter was last taken
+        if not django_cache.add(key, 1, None):
+            django_cache.incr(key)
+    dirty_key = _dirty_key(role_id)
+    # the marker expires after a few flushes, so a role whose queue slot
+    # was lost is queued again by its next download
+    if django_cache.add(dirty_key, 1, settings.DOWNLOAD_FLUSH_INTERVAL * 5):
+        try:
+            DIRTY_QUEUE.push(role_id)
+        except ValueError:
+            # not queued, let the next download try again
+            django_cache.delete(dirty_key)
+
+
+def take_downloads(batch_size=1000):
+    '''
+    Yield a dict of role ID to the downloads recorded since the last call
+    for each batch of the roles downloaded since, and subtract them from
+    the counters. Downloads recorded in the meantime stay for the next call.
+    '''
+    while True:
+        role_ids = DIRTY_QUEUE.drain(limit=batch_size)
+        if not role_ids:
+            return
+        # downloads from here on queue their role again
+        django_cache.delete_many([_dirty_key(role_id) for role_id in role_ids])
+        keys = dict((_key(role_id), role_id) for role_id in role_ids)
+        deltas = {}
+        for key, count in django_cache.get_many(keys.keys()).items():
+            if count:
+                django_cache.decr(key, count)
+                deltas[keys[key]] = count
+        if deltas:
+            yield deltas
@@ -15,8 +15,15 @@
 # You should have received a copy of the Apache License
 # along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
 
+import logging
+
+from elasticsearch.helpers import bulk
 from haystack.backends import BaseEngine
 from haystack.backends.elasticsearch_backend import ElasticsearchSearchBackend, ElasticsearchSearchQuery
+from haystack.utils import get_model_ct
+
+
+logger = logging.getLogger(__name__)
 
 
 class GalaxyElasticSearchBackend(ElasticsearchSearchBackend):
@@ -66,6 +73,26 @@ class GalaxyElasticSearchBackend(ElasticsearchSearchBackend):
         }
     }
 
+    def update_fields(self, model, values):
+        """
+        Set fields of already indexed objects with partial updates, sent as
+        one bulk request. values maps primary keys to dicts of field values.
+        Objects missing from the index are skipped.
+        """
+        if not self.setup_complete:
+            self.setup()
+        actions = [{
+            '_op_type': 'update',
+            '_index': self.index_name,
+            '_type': 'modelresult',
+            '_id': '%s.%s' % (get_model_ct(model), pk),
+            'doc': fields,
+        } for pk, fields in values.items()]
+        _, errors = bulk(self.conn, actions, raise_on_error=False)
+        for error in errors:
+            if error.get('update', {}).get('status') != 404:
+                logger.error(u"Failed to update search document: %s" % error)
+
 
 class ElasticsearchSearchEngine(BaseEngine):
     backend = GalaxyElasticSearchBackend
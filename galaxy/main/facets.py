@@ -0,0 +1,79 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+"""
+Role counts for the search facets: tags, platforms and cloud platforms.
+
+A role counts toward a facet value while it is active and valid. Counts are
+computed with one GROUP BY query per facet type, either for every value or
+for a given set of names, and facet_deltas() tells which values a single
+role's import or removal changed.
+"""
+
+from collections import OrderedDict
+
+from django.db.models import Count
+
+from galaxy.main.models import CloudPlatform, Platform, Tag
+
+
+FACETS = OrderedDict([
+    ('tags', Tag),
+    ('platforms', Platform),
+    ('cloud_platforms', CloudPlatform),
+])
+
+
+def facet_counts(facet, names=None):
+    '''
+    Return a dict of facet value name to the number of listed roles using
+    it. Values without any listed role are left out. Pass names to count
+    only those values.
+    '''
+    queryset = FACETS[facet].objects.filter(roles__active=True, roles__is_valid=True)
+    if names is not None:
+        queryset = queryset.filter(name__in=list(names))
+    # platforms have a row per release, count each role once per name
+    return dict(queryset.values('name')
+                .annotate(count=Count('roles', distinct=True))
+                .values_list('name', 'count'))
+
+
+def all_facet_counts():
+    return dict((facet, facet_counts(facet)) for facet in FACETS)
+
+
+def role_facets(role):
+    '''
+    Return a dict of facet type to the set of value names the role counts
+    toward, empty sets when the role is not listed.
+    '''
+    if not (role.active and role.is_valid):
+        return dict((facet, set()) for facet in FACETS)
+    return dict((facet, set(getattr(role, facet).values_list('name', flat=True))) for facet in FACETS)
+
+
+def facet_deltas(before, after):
+    '''
+    Compare two role_facets() results of the same role and return a dict of
+    facet type to {name: delta}, holding only the values whose count moved.
+    '''
+    deltas = {}
+    for facet in FACETS:
+        old, new = before.get(facet, set()), after.get(facet, set())
+        deltas[facet] = dict([(name, 1) for name in new - old] + [(name, -1) for name in old - new])
+    return deltas
@@ -0,0 +1,68 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from rest_framework.test import APIRequestFactory
+
+from galaxy.api.serializers import RoleDetailSerializer, RoleListSerializer
+from galaxy.api.utils import api_url
+from galaxy.main.models import Role
+
+
+SERIALIZERS = (
+    ('role_list', RoleListSerializer),
+    ('role_detail', RoleDetailSerializer),
+)
+
+
+class Command(BaseCommand):
+    help = (u"Time serializing roles, per row, with the rows and their relations already loaded, and "
+            u"compare building URLs with reverse() and api_url().")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500,
+                            help=u"Number of roles to serialize (default: 500)")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help=u"Runs of each measurement; the fastest is reported (default: 5)")
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        request = APIRequestFactory().get('/api/v1/roles/')
+
+        for name, serializer_class in SERIALIZERS:
+            queryset = serializer_class.setup_queryset(Role.objects.filter(active=True).order_by('id'))
+            roles = list(queryset[:options['rows']])
+            if not roles:
+                self.stdout.write(u"No roles to serialize")
+                return
+
+            def serialize():
+                return serializer_class(roles, many=True, context={'request': request}).data
+
+            best = min(timeit.repeat(serialize, number=1, repeat=repeat))
+            self.stdout.write(u"{0:<12} {1:>6} rows {2:>9.3f} ms/row".format(
+                name, len(roles), best * 1000 / len(roles)))
+
+        pk = roles[0].pk
+        calls = 1000
+        for label, build in ((u"reverse", lambda: reverse('api:role_detail', args=(pk,))),
+                             (u"api_url", lambda: api_url('api:role_detail', pk))):
+            best = min(timeit.repeat(build, number=calls, repeat=repeat))
+            self.stdout.write(u"{0:<12} {1:>9.3f} us/url".format(label, best * 1000000 / calls))
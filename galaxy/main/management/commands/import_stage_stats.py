@@ -0,0 +1,85 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import datetime
+import math
+
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from galaxy.main.models import ImportTaskStage
+
+
+METRICS = ('duration', 'query_count', 'github_request_count')
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, pct):
+    '''
+    Nearest-rank percentile of a sorted list.
+    '''
+    if not values:
+        return 0
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+class Command(BaseCommand):
+    help = (u"Summarize the recorded stages of recent role imports: wall time, database queries and "
+            u"GitHub requests per stage, as percentiles.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7,
+                            help=u"Include imports started within this many days (default: 7)")
+        parser.add_argument('--state', default=None,
+                            help=u"Only include imports that ended in this state, e.g. SUCCESS")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - datetime.timedelta(days=options['days'])
+        stages = ImportTaskStage.objects.filter(task__started__gte=since)
+        if options.get('state'):
+            stages = stages.filter(task__state=options['state'])
+
+        values = OrderedDict()
+        tasks = set()
+        for stage in stages.order_by('position').values('task_id', 'name', *METRICS):
+            tasks.add(stage['task_id'])
+            by_metric = values.setdefault(stage['name'], dict((metric, []) for metric in METRICS))
+            for metric in METRICS:
+                by_metric[metric].append(stage[metric])
+
+        self.stdout.write(u"Imports: {0} since {1}".format(len(tasks), since.strftime('%Y-%m-%d %H:%M')))
+        if not tasks:
+            return
+
+        header = u"{0:<14} {1:>6}".format(u"stage", u"count")
+        for metric in METRICS:
+            for pct in PERCENTILES:
+                header += u" {0:>10}".format(u"{0}_p{1}".format(metric[:5], pct))
+        self.stdout.write(header)
+
+        for name, by_metric in values.items():
+            line = u"{0:<14} {1:>6}".format(name, len(by_metric['duration']))
+            for metric in METRICS:
+                ordered = sorted(by_metric[metric])
+                for pct in PERCENTILES:
+                    value = percentile(ordered, pct)
+                    line += u" {0:>10.3f}".format(value) if metric == 'duration' else u" {0:>10d}".format(value)
+            self.stdout.write(line)
@@ -15,98 +15,116 @@
 # You should have received a copy of the Apache License
 # along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
 
+import datetime
+
 from django.core.management.base import BaseCommand
 
 # elasticsearch
-from elasticsearch_dsl import Index
+from elasticsearch.helpers import streaming_bulk
+from elasticsearch_dsl import Index, connections
 
 # local
+from galaxy.main.celerytasks.elastic_tasks import index_action, platform_doc_name
+from galaxy.main.facets import facet_counts
 from galaxy.main.models import Platform, CloudPlatform, Tag, Role
 from galaxy.main.search_models import (
     TagDoc, CloudPlatformDoc, PlatformDoc, UserDoc)
 
 
 class Command(BaseCommand):
-    help = 'Rebuild custom elasticsearch indexes: galaxy_platforms, galaxy_tags'
+    help = ('Rebuild custom elasticsearch indexes: galaxy_tags, galaxy_platforms, galaxy_cloud_platforms '
+            'and galaxy_users. Each one is built into a new versioned index, then its alias is switched over.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Documents per bulk request (default: 500)')
 
     def handle(self, *args, **options):
-        self.rebuild_tags()
-        self.rebuild_platforms()
-        self.rebuild_cloud_platforms()
-        self.rebuild_users()
-
-    def rebuild_users(self):
-        galaxy_users = Index('galaxy_users')
-        galaxy_users.doc_type(UserDoc)
-        galaxy_users.delete(ignore=404)
-        galaxy_users.create()
-
-        for role in Role.objects.filter(active=True, is_valid=True).order_by('namespace').distinct('namespace').all():
-            doc = UserDoc(username=role.namespace)
-            doc.save()
-
-    def rebuild_tags(self):
-        galaxy_tags = Index('galaxy_tags')
-        galaxy_tags.doc_type(TagDoc)
-        galaxy_tags.delete(ignore=404)
-        galaxy_tags.create()
-
-        for tag in Tag.objects.filter(active=True).all():
-            doc = TagDoc(tag=tag.name, roles=tag.get_num_roles())
-            doc.meta.id = tag.id
-            doc.save()
-
-    def rebuild_platforms(self):
-        galaxy_platforms = Index('galaxy_platforms')
-
-        galaxy_platforms.doc_type(PlatformDoc)
-        galaxy_platforms.delete(ignore=404)
-        galaxy_platforms.create()
-
-        for platform in Platform.objects.filter(active=True).distinct('name').all():
-            alias_list = [alias for alias in self.get_platform_search_terms(platform.name)]
+        self.chunk_size = options['chunk_size']
+        self.rebuild(TagDoc, self.tag_docs())
+        self.rebuild(PlatformDoc, self.platform_docs())
+        self.rebuild(CloudPlatformDoc, self.cloud_platform_docs())
+        self.rebuild(UserDoc, self.user_docs())
+
+    def rebuild(self, doc_class, docs):
+        '''
+        Stream docs, (id, document) pairs, into a new index and point the
+        doc_class alias at it once it is complete. Searches keep using the
+        previous index until then.
+        '''
+        es = connections.get_connection()
+        alias = doc_class._doc_type.index
+        name = '%s_%s' % (alias, datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'))
+
+        index = Index(name)
+        index.doc_type(doc_class)
+        index.create()
+
+        count = 0
+        try:
+            for ok, result in streaming_bulk(es, self.actions(docs, name), chunk_size=self.chunk_size):
+                count += 1
+            es.indices.refresh(index=name)
+        except Exception:
+            # the alias still points at the previous index, drop the partial one
+            es.indices.delete(index=name, ignore=404)
+            raise
+
+        old = es.indices.get_alias(name=alias).keys() if es.indices.exists_alias(name=alias) else []
+        if not old and es.indices.exists(index=alias):
+            # a plain index from before aliases were used holds the name
+            es.indices.delete(index=alias)
+        swap = [{'remove': {'index': old_name, 'alias': alias}} for old_name in old]
+        swap.append({'add': {'index': name, 'alias': alias}})
+        es.indices.update_aliases(body={'actions': swap})
+        for old_name in old:
+            es.indices.delete(index=old_name, ignore=404)
+
+        self.stdout.write('%s: %d documents indexed into %s' % (alias, count, name))
+
+    @staticmethod
+    def actions(docs, index):
+        now = datetime.datetime.now()
+        for doc_id, doc in docs:
+            doc.created_on = doc.last_modified_on = now
+            yield index_action(doc, doc_id, index=index)
+
+    def user_docs(self):
+        for namespace in Role.objects.filter(active=True, is_valid=True).order_by('namespace') \
+                .distinct('namespace').values_list('namespace', flat=True).iterator():
+            yield namespace, UserDoc(username=namespace)
+
+    def tag_docs(self):
+        counts = facet_counts('tags')
+        for tag_id, name in Tag.objects.filter(active=True).values_list('id', 'name').iterator():
+            yield tag_id, TagDoc(tag=name, roles=counts.get(name, 0))
+
+    def platform_docs(self):
+        counts = facet_counts('platforms')
+        releases, aliases = {}, {}
+        for name, release, alias in Platform.objects.filter(active=True).order_by('name', 'release') \
+                .values_list('name', 'release', 'alias'):
+            if release not in releases.setdefault(name, []):
+                releases[name].append(release)
+            aliases.setdefault(name, set()).update(alias.split(' ') if alias else [])
+
+        for name, release_list in releases.items():
+            alias_list = list(aliases[name])
             alias_list = '' if len(alias_list) == 0 else alias_list
-            release_list = [p.release for p in Platform.objects.filter(active=True, name=platform.name)
-                            .order_by('release').distinct('release').all()]
-            search_name = 'Enterprise_Linux' if platform.name == 'EL' else platform.name
-            doc = PlatformDoc(
+            search_name = platform_doc_name(name)
+            yield search_name, PlatformDoc(
                 name=search_name,
                 releases=release_list,
-                roles=Role.objects.filter(active=True, is_valid=True, platforms__name=platform.name)
-                                  .order_by('namespace', 'name')
-                                  .distinct('namespace', 'name').count(),
+                roles=counts.get(name, 0),
                 alias=alias_list,
                 autocomplete="%s %s %s" % (search_name, ' '.join(release_list), ' '.join(alias_list))
             )
-            doc.save()
-
-    def rebuild_cloud_platforms(self):
-        index = Index('galaxy_cloud_platforms')
-
-        index.doc_type(CloudPlatformDoc)
-        index.delete(ignore=404)
-        index.create()
 
-        for platform in CloudPlatform.objects.filter(active=True).all():
-            doc = CloudPlatformDoc(
-                name=platform.name,
-                roles=(
-                    Role.objects
-                        .filter(
-                            active=True, is_valid=True,
-                            cloud_platforms__name=platform.name)
-                        .order_by('namespace', 'name')
-                        .distinct('namespace', 'name').count()),
-                autocomplete=platform.name,
+    def cloud_platform_docs(self):
+        counts = facet_counts('cloud_platforms')
+        for name in CloudPlatform.objects.filter(active=True).values_list('name', flat=True):
+            yield name, CloudPlatformDoc(
+                name=name,
+                roles=counts.get(name, 0),
+                autocomplete=name,
             )
-            doc.save()
-
-    def get_platform_search_terms(self, name):
-        '''
-        Fetch the unique set of aliases for a given platform
-        '''
-        terms = []
-        for platform in Platform.objects.filter(active=True, name=name).all():
-            if platform.alias:
-                terms += platform.alias.split(' ')
-        return set(terms)
@@ -17,18 +17,17 @@
 
 from __future__ import print_function
 
+import json
 import time
 import logging
 
-from math import ceil, floor
+from math import floor
 
 from django.conf import settings
-from django.db.models import Max, Q
-from django.core.management.base import BaseCommand
-from django.core.exceptions import ObjectDoesNotExist
-from galaxy.accounts.models import CustomUser as User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
 from galaxy.main.models import Role, RefreshRoleCount
-from galaxy.main.celerytasks.tasks import refresh_role_counts
+from galaxy.main.celerytasks.tasks import refresh_batch_key, refresh_role_counts
 from allauth.socialaccount.models import SocialToken
 
 
@@ -39,70 +38,113 @@ class Command(BaseCommand):
     help = (u"Update each role's GitHub stargazer and watcher counts, and remove any roles "
             u"that no longer exist on GitHub.")
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help=u"Roles per task (default: 100)")
+        parser.add_argument('--poll-interval', type=float, default=2,
+                            help=u"Seconds between progress updates (default: 2)")
+        parser.add_argument('--stall-timeout', type=float, default=3900,
+                            help=u"Give up when no batch makes progress for this many seconds. The default is "
+                                 u"longer than GitHub's hourly rate limit window (default: 3900)")
+        parser.add_argument('--report', metavar='PATH',
+                            help=u"Write a JSON summary of the run to PATH when finished")
+
     def handle(self, *args, **options):
 
         # Users should already be authenticated to Galaxy via GitHub and have a valid token.
-        task_users = []
-        for task_user in settings.GITHUB_TASK_USERS:
-            try:
-                user = User.objects.get(username=task_user)
-            except ObjectDoesNotExist:
-                logger.info(u"USER NOT FOUND: {0}".format(task_user))
-                continue
-            try:
-                token = SocialToken.objects.get(account__user=user, account__provider='github')
-            except ObjectDoesNotExist:
-                logger.info(u"GITHUB TOKEN NOT FOUND: for user {0}".format(task_user))
-                continue
-            task_users.append({
-                u'username': task_user,
-                u'token': token.token
-            })
-
-        if len(task_users) == 0:
+        tokens = list(SocialToken.objects.filter(account__user__username__in=settings.GITHUB_TASK_USERS,
+                                                 account__provider='github').values_list('token', flat=True))
+        if len(tokens) == 0:
             raise Exception(u"No task workers found with valid GitHub tokens. "
                             u"Make sure your task workers are configured properly.")
 
-        agg = Role.objects.filter(is_valid=True, active=True).aggregate(Max('id'))
-        max_id = agg['id__max']
-        size = ceil(max_id / float(len(settings.GITHUB_TASK_USERS)))
-        in_list = []
-
-        logger.info(u"Refresh Role Counts")
-        for i in range(len(task_users)):
-            start = size * i
-            end = size * (i + 1)
-            logger.info(u"User: {0} Range: {1} - {2}".format(task_users[i]['username'], start, end))
-            role_count = RefreshRoleCount.objects.create(
-                state='PENDING',
-                description='User: %s Range: %s-%s' % (task_users[i]['username'], start, end)
-            )
-            in_list.append(role_count.id)
-            refresh_role_counts.delay(start, end, task_users[i]['token'], role_count)
+        # split the valid role IDs, not the ID range, so batches are even
+        size = options['batch_size']
+        role_ids = list(Role.objects.filter(is_valid=True, active=True).order_by('id').values_list('id', flat=True))
+        batches = [role_ids[i:i + size] for i in range(0, len(role_ids), size)]
+
+        total = len(role_ids)
+        tracker = RefreshRoleCount.objects.create(
+            state='PENDING' if batches else 'FINISHED',
+            description='Roles: %d Batches: %d Tokens: %d' % (total, len(batches), len(tokens)),
+            batches=len(batches)
+        )
+        logger.info(u"Refresh Role Counts: {0}".format(tracker.description))
+        for i, batch in enumerate(batches):
+            refresh_role_counts.delay(batch, tracker.id, tokens[i % len(tokens)], i)
 
         logger.info(u"Requests submitted to Celery. Waiting for task completion...")
-        finished = False
-        started = time.time()
-        while not finished:
-            finished = True
-            for obj in RefreshRoleCount.objects.filter(Q(pk__in=in_list), ~Q(state='COMPLETED')):
-                if not obj.state == 'FINISHED':
-                    finished = False
-                else:
-                    print(u"{0} Total: {1} Passed: {2} Failed: {3} Deleted: {4} Updated: {5}".format(
-                        obj.description,
-                        obj.failed + obj.passed + obj.deleted + obj.updated,
-                        obj.passed,
-                        obj.failed,
-                        obj.deleted,
-                        obj.updated
-                    ))
-                    obj.state = 'COMPLETED'
-                    obj.save()
-            time.sleep(60)
+        started = last_change = time.time()
+        last = None
+        while tracker.state != 'FINISHED' and time.time() - last_change < options['stall_timeout']:
+            time.sleep(options['poll_interval'])
+            tracker = RefreshRoleCount.objects.get(pk=tracker.pk)
+            progress = (tracker.batches_finished, tracker.requests, tracker.rate_limit_waits) + self.counts(tracker)
+            if progress != last:
+                last = progress
+                last_change = time.time()
+                print(self.progress_line(tracker, total, time.time() - started))
 
         elapsed = time.time() - started
+        unfinished = []
+        if tracker.state == 'FINISHED':
+            tracker.state = 'COMPLETED'
+        else:
+            tracker.state = 'STALLED'
+            unfinished = self.unfinished_batches(tracker, batches)
+        tracker.save()
+
+        if options['report']:
+            self.write_report(options['report'], tracker, total, len(tokens), size, elapsed, unfinished)
+        if unfinished:
+            for batch in unfinished:
+                print(u"Unfinished batch {number}: {roles} roles, IDs {first_role_id} to {last_role_id}".format(
+                    **batch))
+            raise CommandError(u"No progress for {0:.0f} seconds, {1} of {2} batches unfinished".format(
+                options['stall_timeout'], len(unfinished), len(batches)))
         hours = floor(elapsed / 3600) if elapsed >= 3600 else 0
         minutes = floor((elapsed - (hours * 3600)) / 60) if (elapsed - (hours * 3600)) >= 60 else 0
         seconds = elapsed - (hours * 3600) - (minutes * 60)
         logger.info(u"Elapsed time %02d.%02d.%02d" % (hours, minutes, seconds))
+
+    @staticmethod
+    def counts(tracker):
+        return (tracker.passed, tracker.failed, tracker.deleted, tracker.updated)
+
+    def progress_line(self, tracker, total, elapsed):
+        done = sum(self.counts(tracker))
+        rate = done / elapsed if elapsed else 0.0
+        eta = u"%ds" % ((total - done) / rate) if rate else u"-"
+        return (u"Roles: {0}/{1} Batches: {2}/{3} Passed: {4} Failed: {5} Deleted: {6} Updated: {7} "
+                u"Requests: {8} Rate limit waits: {9} Rate: {10:.1f} roles/s ETA: {11}").format(
+            done, total, tracker.batches_finished, tracker.batches, tracker.passed, tracker.failed,
+            tracker.deleted, tracker.updated, tracker.requests, tracker.rate_limit_waits, rate, eta)
+
+    @staticmethod
+    def unfinished_batches(tracker, batches):
+        keys = [refresh_batch_key(tracker.id, number) for number in range(len(batches))]
+        finished = cache.get_many(keys)
+        return [dict(number=number, roles=len(batch), first_role_id=batch[0], last_role_id=batch[-1])
+                for number, (key, batch) in enumerate(zip(keys, batches)) if key not in finished]
+
+    def write_report(self, path, tracker, total, tokens, batch_size, elapsed, unfinished=()):
+        report = {
+            'tracker_id': tracker.id,
+            'state': tracker.state,
+            'unfinished_batches': list(unfinished),
+            'roles': total,
+            'batches': tracker.batches,
+            'batch_size': batch_size,
+            'tokens': tokens,
+            'passed': tracker.passed,
+            'failed': tracker.failed,
+            'deleted': tracker.deleted,
+            'updated': tracker.updated,
+            'requests': tracker.requests,
+            'rate_limit_waits': tracker.rate_limit_waits,
+            'elapsed_seconds': round(elapsed, 2),
+            'roles_per_second': round(sum(self.counts(tracker)) / elapsed, 2) if elapsed else None,
+        }
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        logger.info(u"Report written to {0}".format(path))
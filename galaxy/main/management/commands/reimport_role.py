@@ -15,31 +15,183 @@
 # You should have received a copy of the Apache License
 # along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
 
-from django.core.management.base import BaseCommand
+from __future__ import print_function
+
+import collections
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
-from galaxy.main.celerytasks.tasks import import_role
-from galaxy.main.models import Role, ImportTask
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from allauth.socialaccount.models import SocialToken
+from galaxy.main.celerytasks.tasks import create_import_task
+from galaxy.main.models import Role, ImportTask, BulkReimport
 
 User = get_user_model()
 
 
 class Command(BaseCommand):
+    help = (u"Reimport roles, either by ID or in bulk by filter. Bulk runs are queued in waves, "
+            u"bounded by the number of imports in flight and by an hourly budget per GitHub token, "
+            u"and can be resumed with --resume.")
+
     def add_arguments(self, parser):
-        parser.add_argument('role_id', nargs='+', type=int)
+        parser.add_argument('role_id', nargs='*', type=int)
+        parser.add_argument('--force', action='store_true', default=False,
+                            help="Run a full import even when the commit has not changed")
+        parser.add_argument('--all', action='store_true', default=False,
+                            help="Bulk reimport all valid roles")
+        parser.add_argument('--namespace', action='append', default=[],
+                            help="Bulk reimport roles in this namespace, may be repeated")
+        parser.add_argument('--platform', default=None,
+                            help="Bulk reimport roles supporting this platform")
+        parser.add_argument('--tag', default=None,
+                            help="Bulk reimport roles with this tag")
+        parser.add_argument('--imported-before', default=None,
+                            help="Bulk reimport roles last imported before this date, YYYY-MM-DD")
+        parser.add_argument('--resume', type=int, default=None,
+                            help="Resume the bulk reimport run with this ID")
+        parser.add_argument('--wave-size', type=int, default=50,
+                            help="Imports queued per wave (default: 50)")
+        parser.add_argument('--max-in-flight', type=int, default=200,
+                            help="Maximum pending and running imports of the run (default: 200)")
+        parser.add_argument('--per-token-hourly', type=int, default=300,
+                            help="Maximum imports queued per GitHub token per hour (default: 300)")
+        parser.add_argument('--interval', type=int, default=10,
+                            help="Seconds between waves (default: 10)")
 
     def handle(self, *args, **options):
-        if not options.get('role_id'):
-            raise Exception("Please provide a role ID.")
-        role_id = options.get('role_id')[0]
-        role = Role.objects.get(id=role_id)
-        last_task = ImportTask.objects.filter(role=role, state='SUCCESS').order_by('-id').first()
-        task = ImportTask.objects.create(
-            github_user=role.github_user,
-            github_repo=role.github_repo,
-            github_reference=role.github_branch,
-            alternate_role_name=last_task.alternate_role_name,
-            role=role,
-            owner=last_task.owner,
-            state='PENDING'
-        )
-        import_role.delay(task.id)
+        if options.get('role_id'):
+            for role_id in options['role_id']:
+                self.reimport(Role.objects.get(id=role_id), options['force'])
+            return
+
+        if options.get('resume'):
+            run = BulkReimport.objects.get(id=options['resume'])
+            filters = json.loads(run.filters)
+        else:
+            filters = dict(
+                namespace=options['namespace'],
+                platform=options['platform'],
+                tag=options['tag'],
+                imported_before=options['imported_before'],
+                force=options['force'],
+            )
+            if not options['all'] and not any(filters[key] for key in filters if key != 'force'):
+                raise CommandError(u"Please provide a role ID, a filter or --all.")
+            run = BulkReimport.objects.create(state='PENDING', filters=json.dumps(filters))
+
+        self.bulk_reimport(run, filters, options)
+
+    def reimport(self, role, force=False, bulk_reimport=None, owner=None, last_task=None):
+        if last_task is None:
+            last_task = ImportTask.objects.filter(role=role, state='SUCCESS').order_by('-id').first()
+        return create_import_task(
+            role.github_user, role.github_repo, role.github_branch, role, owner or last_task.owner,
+            alternate_role_name=last_task.alternate_role_name, force=force, bulk_reimport=bulk_reimport)
+
+    def select_roles(self, filters):
+        qs = Role.objects.filter(active=True, is_valid=True)
+        if filters.get('namespace'):
+            qs = qs.filter(namespace__in=filters['namespace'])
+        if filters.get('platform'):
+            qs = qs.filter(platforms__name=filters['platform'])
+        if filters.get('tag'):
+            qs = qs.filter(tags__name=filters['tag'])
+        if filters.get('imported_before'):
+            imported_before = parse_date(filters['imported_before'])
+            if imported_before is None:
+                raise CommandError(u"Invalid date for --imported-before: %s" % filters['imported_before'])
+            qs = qs.filter(imported__lt=imported_before)
+        return qs.distinct()
+
+    def bulk_reimport(self, run, filters, options):
+        roles = self.select_roles(filters)
+        if not run.total:
+            # reimported roles can drop out of the selection, keep the
+            # original total when resuming
+            run.total = roles.count()
+        run.state = 'RUNNING'
+        run.save()
+        print(u"Bulk reimport {0}: {1} roles".format(run.id, run.total))
+
+        # roles whose owner has no GitHub token are skipped for this run
+        skipped = set()
+        # roles held back by the hourly token budget, mapped to their owner
+        deferred = {}
+        # queue times per token owner over the last hour
+        queued_by_owner = collections.defaultdict(collections.deque)
+        started = time.time()
+        initial_done = self.finished_count(run)
+
+        while True:
+            in_flight = run.import_tasks.filter(state__in=['PENDING', 'RUNNING']).count()
+            capacity = min(options['wave_size'], options['max_in_flight'] - in_flight)
+            hour_ago = time.time() - 3600
+            for times in queued_by_owner.values():
+                while times and times[0] < hour_ago:
+                    times.popleft()
+            for role_id, owner_id in deferred.items():
+                if len(queued_by_owner[owner_id]) < options['per_token_hourly']:
+                    del deferred[role_id]
+
+            remaining = roles.exclude(import_tasks__bulk_reimport=run).exclude(
+                import_tasks__state__in=['PENDING', 'RUNNING'])
+            candidates = []
+            if capacity > 0:
+                candidates = list(remaining.exclude(id__in=skipped | set(deferred)).order_by('id')[:capacity])
+
+            last_tasks = dict(
+                (task.role_id, task) for task in ImportTask.objects.filter(
+                    role_id__in=[role.id for role in candidates], state='SUCCESS'
+                ).order_by('role_id', '-id').distinct('role_id').select_related('owner'))
+            owners_with_token = set(SocialToken.objects.filter(
+                account__user_id__in=[task.owner_id for task in last_tasks.values()],
+                account__provider='github'
+            ).values_list('account__user_id', flat=True))
+
+            queued = 0
+            for role in candidates:
+                last_task = last_tasks.get(role.id)
+                if last_task is None or last_task.owner_id not in owners_with_token:
+                    skipped.add(role.id)
+                    continue
+                times = queued_by_owner[last_task.owner_id]
+                if len(times) >= options['per_token_hourly']:
+                    deferred[role.id] = last_task.owner_id
+                    continue
+                self.reimport(role, filters.get('force', False), bulk_reimport=run, last_task=last_task)
+                times.append(time.time())
+                queued += 1
+
+            run.queued += queued
+            run.skipped = len(skipped)
+            run.save()
+
+            done = self.finished_count(run)
+            pending = run.total - done - len(skipped)
+            self.report(run, done, done - initial_done, pending, in_flight + queued, started)
+            if pending <= 0 or (queued == 0 and in_flight == 0 and not deferred
+                                and not remaining.exclude(id__in=skipped).exists()):
+                break
+            time.sleep(options['interval'])
+
+        run.state = 'FINISHED'
+        run.save()
+
+    def finished_count(self, run):
+        return run.import_tasks.filter(state__in=['SUCCESS', 'FAILED']).count()
+
+    def report(self, run, done, done_this_session, pending, in_flight, started):
+        elapsed = time.time() - started
+        rate = done_this_session / elapsed if elapsed > 0 else 0
+        eta = datetime.timedelta(seconds=int(pending / rate)) if rate > 0 else u'unknown'
+        states = dict(run.import_tasks.values_list('state').annotate(count=Count('id')))
+        print(u"{0} Done: {1}/{2} Success: {3} Failed: {4} In flight: {5} Skipped: {6} "
+              u"Rate: {7:.2f}/min ETA: {8}".format(
+                  timezone.now().strftime('%H:%M:%S'), done, run.total, states.get('SUCCESS', 0),
+                  states.get('FAILED', 0), in_flight, run.skipped, rate * 60, eta))
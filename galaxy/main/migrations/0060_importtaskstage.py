@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import galaxy.main.mixins
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0059_drop_role_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportTaskStage',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False,
+                                        auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=64, db_index=True)),
+                ('position', models.IntegerField(default=0)),
+                ('duration', models.FloatField(default=0, help_text=b'Wall time in seconds')),
+                ('query_count', models.IntegerField(default=0)),
+                ('github_request_count', models.IntegerField(default=0)),
+                ('task', models.ForeignKey(related_name='stages', to='main.ImportTask')),
+            ],
+            options={
+                'ordering': ('task', 'position'),
+            },
+            bases=(models.Model, galaxy.main.mixins.DirtyMixin),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0060_importtaskstage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importtask',
+            name='force',
+            field=models.BooleanField(
+                default=False,
+                help_text=b'Run a full import even when the commit has not changed'),
+        ),
+    ]
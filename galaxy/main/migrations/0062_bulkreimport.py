@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+import galaxy.main.fields
+import galaxy.main.mixins
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0061_importtask_force'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkReimport',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False,
+                                        auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('description', galaxy.main.fields.TruncatingCharField(
+                    default=b'', max_length=255, blank=True)),
+                ('active', models.BooleanField(default=True, db_index=True)),
+                ('state', models.CharField(max_length=20)),
+                ('filters', models.TextField(default=b'', blank=True)),
+                ('total', models.IntegerField(default=0)),
+                ('queued', models.IntegerField(default=0)),
+                ('skipped', models.IntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(models.Model, galaxy.main.mixins.DirtyMixin),
+        ),
+        migrations.AddField(
+            model_name='importtask',
+            name='bulk_reimport',
+            field=models.ForeignKey(related_name='import_tasks', on_delete=django.db.models.deletion.SET_NULL,
+                                    blank=True, to='main.BulkReimport', null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0062_bulkreimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshrolecount',
+            name='batches',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='refreshrolecount',
+            name='batches_finished',
+            field=models.IntegerField(default=0),
+        ),
+    ]
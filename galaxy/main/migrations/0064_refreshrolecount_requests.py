@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0063_refreshrolecount_batches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='refreshrolecount',
+            name='requests',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='refreshrolecount',
+            name='rate_limit_waits',
+            field=models.IntegerField(default=0),
+        ),
+    ]
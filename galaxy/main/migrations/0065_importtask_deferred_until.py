@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0064_refreshrolecount_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importtask',
+            name='deferred_until',
+            field=models.DateTimeField(
+                null=True,
+                blank=True,
+                help_text=b'When the retry of an import deferred for the GitHub rate limit runs'),
+        ),
+    ]
@@ -15,6 +15,8 @@
 # You should have received a copy of the Apache License
 # along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
 
+from collections import OrderedDict
+
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.db import models
@@ -28,7 +30,7 @@ from galaxy.main.mixins import DirtyMixin
 
 __all__ = [
     'PrimordialModel', 'Platform', 'CloudPlatform', 'Category', 'Tag',
-    'Role', 'ImportTask', 'ImportTaskMessage', 'RoleVersion',
+    'Role', 'ImportTask', 'ImportTaskMessage', 'ImportTaskStage', 'RoleVersion',
     'UserAlias', 'NotificationSecret', 'Notification', 'Repository',
     'Subscription', 'Stargazer', 'Namespace', 'ContentBlock'
 ]
@@ -467,27 +469,58 @@ class Role(CommonModelNameNotUnique):
         except:
             return dict()
 
+    # ordering of the active related objects returned by active_related()
+    ACTIVE_RELATED = OrderedDict([
+        ('platforms', ('name', 'release')),
+        ('cloud_platforms', ('name',)),
+        ('tags', ('name',)),
+        ('versions', ('-loose_version',)),
+        ('dependencies', ('namespace', 'name')),
+    ])
+
+    @classmethod
+    def active_prefetches(cls):
+        """
+        Prefetch objects loading every relation in ACTIVE_RELATED, so that
+        active_related() does not query for each role of a queryset.
+        """
+        prefetches = []
+        for field_name, ordering in cls.ACTIVE_RELATED.items():
+            related_model = cls._meta.get_field(field_name).related_model
+            prefetches.append(models.Prefetch(
+                field_name,
+                queryset=related_model.objects.filter(active=True).order_by(*ordering),
+                to_attr='active_' + field_name))
+        return prefetches
+
+    def active_related(self, field_name):
+        prefetched = getattr(self, 'active_' + field_name, None)
+        if prefetched is not None:
+            return prefetched
+        return list(getattr(self, field_name).filter(active=True).order_by(*self.ACTIVE_RELATED[field_name]))
+
     def get_unique_platforms(self):
-        return [platform.name for platform in self.platforms.filter(active=True).order_by('name').distinct('name')]
+        return sorted(set(platform.name for platform in self.active_related('platforms')))
 
     def get_cloud_platforms(self):
-        return [cp.name for cp in self.cloud_platforms.filter(active=True)]
+        return [cp.name for cp in self.active_related('cloud_platforms')]
 
     def get_unique_platform_versions(self):
-        return [platform.release for platform in self.platforms.filter(active=True).order_by('release').distinct('release')]
+        return sorted(set(platform.release for platform in self.active_related('platforms')))
 
     def get_unique_platform_search_terms(self):
         # Fetch the unique set of aliases
         terms = []
-        for platform in self.platforms.filter(active=True).exclude(alias__isnull=True).exclude(alias__exact='').all():
-            terms += platform.alias.split(' ')
+        for platform in self.active_related('platforms'):
+            if platform.alias:
+                terms += platform.alias.split(' ')
         return set(terms)
 
     def get_username(self):
         return self.namespace
 
     def get_tags(self):
-        return [tag.name for tag in self.tags.filter(active=True)]
+        return [tag.name for tag in self.active_related('tags')]
 
     def validate_char_lengths(self):
         for field in self._meta.get_fields():
@@ -684,6 +717,22 @@ class ImportTask(PrimordialModel):
         default='',
         verbose_name="Travis Build URL"
     )
+    force = models.BooleanField(
+        default=False,
+        help_text="Run a full import even when the commit has not changed",
+    )
+    bulk_reimport = models.ForeignKey(
+        'BulkReimport',
+        related_name='import_tasks',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    deferred_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the retry of an import deferred for the GitHub rate limit runs",
+    )
 
     def __unicode__(self):
         return "%d-%s" % (self.id, self.started.strftime("%Y%m%d-%H%M%S-%Z"))
@@ -712,6 +761,39 @@ class ImportTaskMessage(PrimordialModel):
         return "%d-%s-%s" % (self.task.id, self.message_type, self.message_text)
 
 
+class ImportTaskStage(BaseModel):
+    """Wall time, database queries and GitHub requests of one stage of an
+    import run."""
+
+    class Meta:
+        ordering = ('task', 'position')
+
+    task = models.ForeignKey(
+        ImportTask,
+        related_name='stages',
+    )
+    name = models.CharField(
+        max_length=64,
+        db_index=True,
+    )
+    position = models.IntegerField(
+        default=0,
+    )
+    duration = models.FloatField(
+        default=0,
+        help_text="Wall time in seconds",
+    )
+    query_count = models.IntegerField(
+        default=0,
+    )
+    github_request_count = models.IntegerField(
+        default=0,
+    )
+
+    def __unicode__(self):
+        return "%d-%s" % (self.task_id, self.name)
+
+
 class NotificationSecret(PrimordialModel):
     class Meta:
         ordering = ('source', 'github_user', 'github_repo')
@@ -882,6 +964,40 @@ class RefreshRoleCount (PrimordialModel):
         default=0,
         null=True
     )
+    batches = models.IntegerField(
+        default=0
+    )
+    batches_finished = models.IntegerField(
+        default=0
+    )
+    requests = models.IntegerField(
+        default=0
+    )
+    rate_limit_waits = models.IntegerField(
+        default=0
+    )
+
+
+class BulkReimport(PrimordialModel):
+    """Progress of a bulk reimport run. filters holds the JSON encoded role
+    selection, so an interrupted run can be resumed."""
+
+    state = models.CharField(
+        max_length=20
+    )
+    filters = models.TextField(
+        blank=True,
+        default='',
+    )
+    total = models.IntegerField(
+        default=0
+    )
+    queued = models.IntegerField(
+        default=0
+    )
+    skipped = models.IntegerField(
+        default=0
+    )
 
 
 class ContentBlock(BaseModel):
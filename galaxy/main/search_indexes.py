@@ -62,14 +62,14 @@ class RoleIndex(indexes.SearchIndex, indexes.Indexable):
         return Role
 
     def index_queryset(self, using=None):
-        # Used when the entire index for model is updated
-        return self.get_model().objects.filter(active=True, is_valid=True)
+        # Used when the entire index for model is updated. Relations are
+        # loaded once per chunk of roles, and read by the prepare methods
+        # through Role.active_related().
+        return self.get_model().objects.filter(active=True, is_valid=True) \
+            .prefetch_related(*self.get_model().active_prefetches())
 
     def prepare_platforms(self, obj):
-        return [
-            'Enterprise_Linux' if platform.name == 'EL' else platform.name
-            for platform in obj.platforms.filter(active=True).order_by('name').distinct('name')
-        ]
+        return ['Enterprise_Linux' if name == 'EL' else name for name in obj.get_unique_platforms()]
 
     def prepare_cloud_platforms(self, obj):
         return obj.get_cloud_platforms()
@@ -95,7 +95,7 @@ class RoleIndex(indexes.SearchIndex, indexes.Indexable):
 
     def prepare_versions(self, obj):
         result = []
-        for version in obj.versions.filter(active=True).order_by('-loose_version'):
+        for version in obj.active_related('versions'):
             release_date = version.release_date.strftime('%Y-%m-%dT%H:%M:%SZ') if version.release_date else None
             result.append({
                 'name': version.name,
@@ -106,13 +106,13 @@ class RoleIndex(indexes.SearchIndex, indexes.Indexable):
     def prepare_dependencies(self, obj):
         result = [
             dict(name=dep.name, namespace=dep.namespace, id=dep.id)
-            for dep in obj.dependencies.filter(active=True).order_by('namespace', 'name')
+            for dep in obj.active_related('dependencies')
         ]
         return json.dumps(result)
 
     def prepare_platform_details(self, obj):
         results = []
-        for plat in obj.platforms.filter(active=True).order_by('name', 'release'):
+        for plat in obj.active_related('platforms'):
             name = 'Enterprise_Linux' if plat.name == 'EL' else plat.name
             results.append(
                 dict(name=name, release=plat.release)
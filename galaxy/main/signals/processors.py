@@ -0,0 +1,58 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django.db.models import signals
+
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+from haystack.utils import get_model_ct
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    Queue saved and deleted objects for the update_search_indexes task
+    instead of writing to the search engine while the request or task that
+    changed them waits.
+    """
+
+    def setup(self):
+        signals.post_save.connect(self.handle_save)
+        signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        signals.post_save.disconnect(self.handle_save)
+        signals.post_delete.disconnect(self.handle_delete)
+
+    def is_indexed(self, sender):
+        for using in self.connection_router.for_write():
+            try:
+                self.connections[using].get_unified_index().get_index(sender)
+                return True
+            except NotHandled:
+                pass
+        return False
+
+    def handle_save(self, sender, instance, **kwargs):
+        if self.is_indexed(sender):
+            # imported here, the processor is created before the apps are ready
+            from galaxy.main.celerytasks.elastic_tasks import queue_search_update
+            queue_search_update(get_model_ct(instance), instance.pk)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if self.is_indexed(sender):
+            from galaxy.main.celerytasks.elastic_tasks import queue_search_update
+            queue_search_update(get_model_ct(instance), instance.pk, remove=True)
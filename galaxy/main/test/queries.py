@@ -0,0 +1,40 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountMixin(object):
+    '''
+    TestCase mixin to check that the queries run by some code do not grow
+    with the amount of data it handles.
+    '''
+
+    def assertConstantQueries(self, func, sizes):
+        '''
+        Call func(size) for each of sizes and assert that every call runs
+        the same number of queries.
+        '''
+        counts = []
+        for size in sizes:
+            with CaptureQueriesContext(connection) as context:
+                func(size)
+            counts.append(len(context))
+        self.assertEqual(len(set(counts)), 1,
+                         'Query count changes with size: %s' % ', '.join(
+                             '%s: %d' % (size, count) for size, count in zip(sizes, counts)))
@@ -0,0 +1,90 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+"""
+A small work queue kept in the cache, so that processes can hand items to a
+periodic consumer without taking a lock.
+
+Producers claim a sequence number with an atomic incr and store their item
+in the slot for that number. The consumer reads every slot between the last
+drained number and the current tail. A slot can be claimed but not written
+yet; the consumer stops in front of it and gives up on it if it is still
+empty on the next drain.
+"""
+
+from django.core.cache import cache as django_cache
+
+
+class CacheQueue(object):
+
+    def __init__(self, name, cache=None):
+        self.name = name
+        self.cache = cache or django_cache
+
+    def _key(self, suffix):
+        return '__queue_%s_%s' % (self.name, suffix)
+
+    def _slot(self, seq):
+        return self._key('slot_%d' % seq)
+
+    def push(self, item):
+        '''
+        Add item to the queue. Raises ValueError when the cache is not
+        available.
+        '''
+        self.cache.add(self._key('tail'), 0, None)
+        seq = self.cache.incr(self._key('tail'))
+        self.cache.set(self._slot(seq), item, None)
+        return seq
+
+    def _bounds(self):
+        tail = self.cache.get(self._key('tail')) or 0
+        head = self.cache.get(self._key('head')) or 0
+        if tail < head:
+            # the tail was evicted and started again
+            head = 0
+        return head, tail
+
+    def pending(self):
+        head, tail = self._bounds()
+        return tail - head
+
+    def drain(self, limit=1000):
+        '''
+        Remove and return up to limit items, oldest first.
+        '''
+        head, tail = self._bounds()
+        end = min(tail, head + limit)
+        given_up = self.cache.get(self._key('given_up')) or 0
+        keys = [self._slot(seq) for seq in range(head + 1, end + 1)]
+        found = self.cache.get_many(keys)
+
+        items = []
+        drained = []
+        for seq, key in zip(range(head + 1, end + 1), keys):
+            if key in found:
+                items.append(found[key])
+                drained.append(key)
+            elif seq > given_up:
+                # possibly still being written, look again next time
+                self.cache.set(self._key('given_up'), end, None)
+                break
+            head = seq
+
+        self.cache.set(self._key('head'), head, None)
+        self.cache.delete_many(drained)
+        return items
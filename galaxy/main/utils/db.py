@@ -0,0 +1,61 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django.db.models import Case, F, Value, When
+
+
+def bulk_update(objects, fields, batch_size=500):
+    '''
+    Write the given fields of already saved model instances back to the
+    database, issuing one UPDATE ... SET field = CASE id WHEN ... per batch
+    instead of one UPDATE per object. Returns the number of rows updated.
+    '''
+    objects = list(objects)
+    if not objects:
+        return 0
+    model = type(objects[0])
+    model_fields = [model._meta.get_field(name) for name in fields]
+    updated = 0
+    for start in range(0, len(objects), batch_size):
+        batch = objects[start:start + batch_size]
+        values = {}
+        for field in model_fields:
+            values[field.attname] = Case(
+                *[When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field))
+                  for obj in batch],
+                output_field=field
+            )
+        updated += model.objects.filter(pk__in=[obj.pk for obj in batch]).update(**values)
+    return updated
+
+
+def bulk_increment(model, field_name, deltas, batch_size=500):
+    '''
+    Add deltas, a dict of primary key to amount, to field_name of the
+    matching rows with one UPDATE ... SET field = field + CASE id WHEN ...
+    per batch. The addition happens in the database, so concurrent writers
+    are not overwritten. Returns the number of rows updated.
+    '''
+    field = model._meta.get_field(field_name)
+    pks = list(deltas)
+    updated = 0
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        increment = Case(*[When(pk=pk, then=Value(deltas[pk])) for pk in batch],
+                         default=Value(0), output_field=field)
+        updated += model.objects.filter(pk__in=batch).update(**{field.attname: F(field.attname) + increment})
+    return updated
@@ -217,6 +217,13 @@ REST_FRAMEWORK = {
     }
 }
 
+# Seconds the row counts of unfiltered API lists are cached.
+API_COUNT_CACHE_TIMEOUT = 300
+
+# Filtered API lists estimated by the query planner to hold at least this
+# many rows report the estimate as an approximate count.
+API_COUNT_ESTIMATE_THRESHOLD = 10000
+
 # Elasticsearch
 # ---------------------------------------------------------
 
@@ -229,7 +236,18 @@ HAYSTACK_CONNECTIONS = {
     },
 }
 
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+HAYSTACK_SIGNAL_PROCESSOR = 'galaxy.main.signals.processors.QueuedSignalProcessor'
+
+# Seconds saved roles wait before the search index is updated, so that
+# repeated saves are indexed once and in bulk.
+SEARCH_INDEX_FLUSH_DELAY = 5
+
+# Seconds tag, platform and user search documents are left dirty, so that
+# the updates of concurrent imports are written in one batch.
+CUSTOM_INDEX_FLUSH_DELAY = 10
+
+# Seconds between writes of the role download counts kept in the cache.
+DOWNLOAD_FLUSH_INTERVAL = 60
 
 # Celery
 # ---------------------------------------------------------
@@ -244,6 +262,14 @@ CELERY_TRACK_STARTED = True
 
 CELERYBEAT_SCHEDULER = 'djcelery.schedulers.DatabaseScheduler'
 
+CELERYBEAT_SCHEDULE = {
+    # role downloads are counted in the cache and written in bulk
+    'flush-download-counts': {
+        'task': 'galaxy.main.celerytasks.tasks.flush_download_counts',
+        'schedule': float(DOWNLOAD_FLUSH_INTERVAL),
+    },
+}
+
 # Allauth
 # ---------------------------------------------------------
 
@@ -306,6 +332,33 @@ GITHUB_TASK_USERS = []
 
 GITHUB_SERVER = 'https://api.github.com'
 
+GITHUB_GRAPHQL_URL = GITHUB_SERVER + '/graphql'
+
+# Repositories looked up per GraphQL request by the bulk metadata refresh.
+GITHUB_GRAPHQL_BATCH_SIZE = 50
+
+# Number of concurrent requests, and pooled connections, used by the
+# import fetch stage.
+GITHUB_FETCH_CONCURRENCY = 8
+
+# Timeout in seconds for a single GitHub API request.
+GITHUB_FETCH_TIMEOUT = 30
+
+# How candidate files (meta/main.yml, container.yml, ...) are fetched during
+# import: 'contents' probes each path, 'tree' reads one recursive git tree,
+# 'tarball' downloads the commit once.
+GITHUB_IMPORT_MODE = 'tree'
+
+# Requests left untouched on each GitHub token. Once every token in the
+# pool is down to this many, tasks wait for the quota to reset.
+GITHUB_TOKEN_RESERVE = 100
+
+# Seconds between writes of buffered import messages while an import runs.
+IMPORT_MESSAGE_FLUSH_INTERVAL = 2
+
+# How long ETags and response bodies are kept for conditional requests.
+GITHUB_ETAG_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
 GALAXY_COMMENTS_THRESHOLD = 10.0
 
 SITE_ENV = 'PROD'
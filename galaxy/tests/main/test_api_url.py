@@ -0,0 +1,60 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django import test
+from django.conf.urls import url
+from django.core.urlresolvers import NoReverseMatch, reverse
+
+from galaxy.api.utils import api_url, _url_templates
+
+
+def view(request, *args):
+    pass
+
+
+urlpatterns = [
+    url(r'^short/(\d{1,3})/$', view, name='short'),
+    url(r'^slug/([\w-]+)/$', view, name='slug'),
+]
+
+
+class TestApiUrl(test.SimpleTestCase):
+
+    def test_matches_reverse(self):
+        for name in ('api:role_detail', 'api:role_versions_list', 'api:user_detail', 'api:import_task_detail'):
+            for pk in (1, 42, 1234567):
+                self.assertEqual(api_url(name, pk), reverse(name, args=(pk,)))
+
+    def test_string_pk(self):
+        self.assertEqual(api_url('api:role_detail', '42'), reverse('api:role_detail', args=(42,)))
+        self.assertEqual(api_url('api:role_detail', u'42'), reverse('api:role_detail', args=(42,)))
+        with self.assertRaises(NoReverseMatch):
+            api_url('api:role_detail', 'abc')
+
+
+@test.utils.override_settings(ROOT_URLCONF='galaxy.tests.main.test_api_url')
+class TestApiUrlFallback(test.SimpleTestCase):
+
+    def test_route_rejecting_markers(self):
+        self.assertEqual(api_url('short', 12), '/short/12/')
+        self.assertNotIn(('/', 'short', 1), _url_templates)
+        with self.assertRaises(NoReverseMatch):
+            api_url('short', 1234)
+
+    def test_non_integer_argument(self):
+        self.assertEqual(api_url('slug', 'my-role'), '/slug/my-role/')
+        self.assertEqual(api_url('slug', 7), '/slug/7/')
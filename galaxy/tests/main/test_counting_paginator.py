@@ -0,0 +1,90 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import mock
+
+from django import test
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory
+
+from galaxy.api import views
+from galaxy.api.pagination import CountingPaginator
+from galaxy.main.models import Role
+
+
+def make_role(name, **kwargs):
+    return Role.objects.create(namespace='user', name=name, github_user='user', github_repo=name,
+                               is_valid=True, **kwargs)
+
+
+@test.utils.override_settings(API_COUNT_ESTIMATE_THRESHOLD=100)
+class TestCountingPaginator(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for i in range(3):
+            make_role('role%d' % i)
+
+    def test_cached_count_is_kept_per_query(self):
+        self.assertEqual(CountingPaginator(Role.objects.all(), 10, cache_count=True).count, 3)
+        make_role('role3')
+        self.assertEqual(CountingPaginator(Role.objects.all(), 10, cache_count=True).count, 3)
+        # the ordering does not change the key, the filters do
+        self.assertEqual(CountingPaginator(Role.objects.order_by('-name'), 10, cache_count=True).count, 3)
+        self.assertEqual(CountingPaginator(Role.objects.filter(name='role3'), 10, cache_count=True).count, 1)
+        self.assertEqual(CountingPaginator(Role.objects.all(), 10).count, 4)
+
+    def test_estimate_below_threshold_is_counted(self):
+        with mock.patch.object(CountingPaginator, 'estimate_count', return_value=99):
+            paginator = CountingPaginator(Role.objects.all(), 10)
+            self.assertEqual(paginator.count, 3)
+        self.assertFalse(paginator.count_is_approximate)
+
+    def test_estimate_at_threshold_is_used(self):
+        with mock.patch.object(CountingPaginator, 'estimate_count', return_value=100):
+            paginator = CountingPaginator(Role.objects.order_by('name'), 2)
+            self.assertEqual(paginator.count, 100)
+            self.assertTrue(paginator.count_is_approximate)
+            page = paginator.page(2)
+        self.assertEqual([role.name for role in page.object_list], ['role2'])
+        self.assertFalse(page.has_next())
+
+    def test_estimate_from_planner(self):
+        self.assertIsInstance(CountingPaginator.estimate_count(Role.objects.all()), int)
+
+
+class TestApproximateCountResponse(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_role('role')
+
+    def get(self, params):
+        request = APIRequestFactory().get('/api/v1/roles/', params)
+        return views.RoleList.as_view()(request).data
+
+    def test_exact_count(self):
+        data = self.get({'name': 'role'})
+        self.assertEqual(data['count'], 1)
+        self.assertFalse(data['count_is_approximate'])
+
+    @test.utils.override_settings(API_COUNT_ESTIMATE_THRESHOLD=100)
+    def test_approximate_count(self):
+        with mock.patch.object(CountingPaginator, 'estimate_count', return_value=500):
+            data = self.get({'name': 'role'})
+        self.assertEqual(data['count'], 500)
+        self.assertTrue(data['count_is_approximate'])
@@ -0,0 +1,97 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import base64
+import json
+import urlparse
+
+from django import test
+from rest_framework.test import APIRequestFactory
+
+from galaxy.api import views
+from galaxy.api.pagination import CursorPaginator
+from galaxy.main.models import Role, RoleVersion
+
+
+class TestCursorPaginator(test.TestCase):
+
+    def test_pk_is_added_to_non_unique_ordering(self):
+        self.assertEqual(CursorPaginator(Role.objects.all(), 10, ('namespace', 'name')).ordering,
+                         ('namespace', 'name'))
+        self.assertEqual(CursorPaginator(Role.objects.all(), 10, ('-download_count',)).ordering,
+                         ('-download_count', 'pk'))
+        self.assertEqual(CursorPaginator(RoleVersion.objects.all(), 10, ('id',)).ordering, ('id',))
+
+    def test_distinct_is_dropped_without_joins(self):
+        paginator = CursorPaginator(Role.objects.filter(active=True).distinct(), 10, ('namespace', 'name'))
+        self.assertFalse(paginator.queryset.query.distinct)
+        paginator = CursorPaginator(Role.objects.filter(tags__name='web').distinct(), 10, ('namespace', 'name'))
+        self.assertTrue(paginator.queryset.query.distinct)
+
+
+class TestRoleListCursor(test.TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        for i in range(5):
+            Role.objects.create(namespace='user', name='role%d' % i, github_user='user',
+                                github_repo='role%d' % i, is_valid=True)
+
+    def get(self, params):
+        request = self.factory.get('/api/v1/roles/', params)
+        return views.RoleList.as_view()(request)
+
+    def get_page(self, cursor):
+        response = self.get({'cursor': cursor, 'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    @staticmethod
+    def cursor(link):
+        return urlparse.parse_qs(urlparse.urlparse(link).query)['cursor'][0]
+
+    @staticmethod
+    def names(page):
+        return [role['name'] for role in page['results']]
+
+    def test_next_and_previous(self):
+        first = self.get_page('')
+        self.assertEqual(self.names(first), ['role0', 'role1'])
+        self.assertIsNone(first['previous_link'])
+
+        second = self.get_page(self.cursor(first['next_link']))
+        third = self.get_page(self.cursor(second['next_link']))
+        self.assertEqual(self.names(second), ['role2', 'role3'])
+        self.assertEqual(self.names(third), ['role4'])
+        self.assertIsNone(third['next_link'])
+
+        back = self.get_page(self.cursor(third['previous_link']))
+        self.assertEqual(self.names(back), ['role2', 'role3'])
+        back = self.get_page(self.cursor(back['previous_link']))
+        self.assertEqual(self.names(back), ['role0', 'role1'])
+        self.assertIsNone(back['previous_link'])
+        self.assertEqual(self.cursor(back['next_link']), self.cursor(first['next_link']))
+
+    def test_malformed_cursors(self):
+        for cursor in ('not base64', base64.urlsafe_b64encode('not json'),
+                       base64.urlsafe_b64encode(json.dumps(['user', 'role1'])),
+                       base64.urlsafe_b64encode(json.dumps({'key': ['user'], 'reverse': False})),
+                       base64.urlsafe_b64encode(json.dumps({'key': ['user', {}], 'reverse': False}))):
+            self.assertEqual(self.get({'cursor': cursor}).status_code, 404)
+
+    def test_order_by_is_rejected(self):
+        self.assertEqual(self.get({'cursor': '', 'order_by': 'name'}).status_code, 400)
@@ -0,0 +1,90 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import mock
+
+from django import test
+from django.core.cache import cache
+
+from galaxy.main.celerytasks.tasks import flush_download_counts
+from galaxy.main.downloads import DIRTY_QUEUE, record_download
+from galaxy.main.models import Role
+
+
+class TestDownloadCounts(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.roles = [
+            Role.objects.create(namespace='user', name=name, github_user='user', github_repo=name)
+            for name in ('one', 'two', 'three')
+        ]
+        patcher = mock.patch('galaxy.main.celerytasks.tasks.update_search_fields')
+        self.update_search_fields = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def counts(self):
+        return [Role.objects.get(pk=role.pk).download_count for role in self.roles]
+
+    def test_flushes_downloaded_roles(self):
+        one, two, three = self.roles
+        for role in (one, one, two):
+            record_download(role.pk)
+        flush_download_counts()
+        self.assertEqual(self.counts(), [2, 1, 0])
+        self.update_search_fields.assert_called_once_with(
+            Role, {one.pk: {'download_count': 2}, two.pk: {'download_count': 1}})
+
+        # nothing new to flush
+        self.update_search_fields.reset_mock()
+        flush_download_counts()
+        self.assertFalse(self.update_search_fields.called)
+        self.assertEqual(self.counts(), [2, 1, 0])
+
+    def test_downloads_after_flush_are_counted_again(self):
+        one = self.roles[0]
+        record_download(one.pk)
+        flush_download_counts()
+        record_download(one.pk)
+        record_download(one.pk)
+        flush_download_counts()
+        self.assertEqual(self.counts(), [3, 0, 0])
+
+    def test_only_downloaded_roles_are_read(self):
+        record_download(self.roles[1].pk)
+        with mock.patch('galaxy.main.downloads.django_cache.get_many', wraps=cache.get_many) as get_many:
+            flush_download_counts()
+        keys = [key for call in get_many.call_args_list for key in call[0][0] if key.startswith('role_downloads')]
+        self.assertEqual(keys, ['role_downloads_%d' % self.roles[1].pk])
+
+    def test_lost_queue_slot_is_queued_again(self):
+        one = self.roles[0]
+        record_download(one.pk)
+        # the slot is evicted, the dirty marker outlives it
+        cache.delete(DIRTY_QUEUE._slot(1))
+        DIRTY_QUEUE.drain()
+        DIRTY_QUEUE.drain()
+        self.assertEqual(DIRTY_QUEUE.pending(), 0)
+        with mock.patch('galaxy.main.downloads.django_cache.add', wraps=cache.add) as add:
+            record_download(one.pk)
+        self.assertIn(mock.call('role_downloads_dirty_%d' % one.pk, 1, 300), add.call_args_list)
+
+        # once the marker expires the next download queues the role again
+        cache.delete('role_downloads_dirty_%d' % one.pk)
+        record_download(one.pk)
+        flush_download_counts()
+        self.assertEqual(self.counts(), [3, 0, 0])
@@ -0,0 +1,53 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django import test
+
+from galaxy.main.facets import facet_counts, facet_deltas, role_facets
+from galaxy.main.models import Platform, Role, Tag
+
+
+class TestFacets(test.TestCase):
+
+    def setUp(self):
+        self.web, self.db = Tag.objects.create(name='web'), Tag.objects.create(name='db')
+        el6, el7 = Platform.objects.create(name='EL', release='6'), Platform.objects.create(name='EL', release='7')
+        self.roles = []
+        for i, valid in enumerate((True, True, False)):
+            role = Role.objects.create(namespace='user', name='role%d' % i, github_user='user',
+                                       github_repo='role%d' % i, is_valid=valid)
+            role.tags.add(self.web)
+            role.platforms.add(el6, el7)
+            self.roles.append(role)
+        self.roles[0].tags.add(self.db)
+
+    def test_counts_listed_roles_once_per_name(self):
+        self.assertEqual(facet_counts('tags'), {'web': 2, 'db': 1})
+        self.assertEqual(facet_counts('platforms'), {'EL': 2})
+        self.assertEqual(facet_counts('tags', names=['db', 'missing']), {'db': 1})
+
+    def test_role_facets(self):
+        self.assertEqual(role_facets(self.roles[0]),
+                         {'tags': set(['web', 'db']), 'platforms': set(['EL']), 'cloud_platforms': set()})
+        self.assertEqual(role_facets(self.roles[2]), {'tags': set(), 'platforms': set(), 'cloud_platforms': set()})
+
+    def test_facet_deltas(self):
+        before = role_facets(self.roles[0])
+        self.roles[0].tags.remove(self.db)
+        self.roles[0].tags.add(Tag.objects.create(name='cache'))
+        self.assertEqual(facet_deltas(before, role_facets(self.roles[0])),
+                         {'tags': {'cache': 1, 'db': -1}, 'platforms': {}, 'cloud_platforms': {}})
@@ -0,0 +1,130 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import datetime
+
+import mock
+
+from django import test
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from galaxy.main.celerytasks.tasks import (clear_stuck_imports, create_import_task, defer_import_task,
+                                           import_lock_key, start_follow_up_import)
+from galaxy.main.celerytasks.token_pool import RateLimitExhausted
+from galaxy.main.models import ImportTask, Role
+from galaxy.main.utils.memcache_lock import memcache_lock
+
+
+class ImportTaskTestCase(test.TransactionTestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='user')
+        self.role = Role.objects.create(namespace='user', name='role', github_user='user', github_repo='role')
+        self.import_role = mock.Mock()
+        self.import_role.delay.return_value.id = 'celery-id'
+        patcher = mock.patch('galaxy.main.celerytasks.tasks.import_role', self.import_role)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request_import(self, **kwargs):
+        return create_import_task('user', 'role', '', self.role, self.user, **kwargs)
+
+    def in_flight(self, state, **kwargs):
+        return ImportTask.objects.create(github_user='user', github_repo='role', github_reference='',
+                                         role=self.role, owner=self.user, state=state,
+                                         celery_task_id='running-id', **kwargs)
+
+
+class TestCreateImportTask(ImportTaskTestCase):
+
+    def test_starts_an_import(self):
+        task = self.request_import()
+        self.assertEqual(task.celery_task_id, 'celery-id')
+        self.import_role.delay.assert_called_once_with(task.id)
+
+    def test_merges_into_pending_import(self):
+        pending = self.in_flight('PENDING', alternate_role_name='old')
+        task = self.request_import(alternate_role_name='new', force=True)
+        self.assertEqual(task.id, pending.id)
+        pending = ImportTask.objects.get(id=pending.id)
+        self.assertEqual((pending.alternate_role_name, pending.force), ('new', True))
+        self.assertEqual(ImportTask.objects.count(), 1)
+        self.assertFalse(self.import_role.delay.called)
+
+    def test_joins_running_import_of_same_commit(self):
+        running = self.in_flight('RUNNING', commit='abc')
+        self.assertEqual(self.request_import(commit='abc').id, running.id)
+
+    def test_queues_follow_up_behind_running_import(self):
+        self.in_flight('RUNNING', commit='abc')
+        for kwargs in ({'commit': 'def'}, {'commit': 'abc', 'alternate_role_name': 'other'}):
+            ImportTask.objects.filter(celery_task_id__isnull=True).delete()
+            task = self.request_import(**kwargs)
+            self.assertIsNone(task.celery_task_id)
+            self.assertEqual(task.alternate_role_name, kwargs.get('alternate_role_name'))
+        self.assertFalse(self.import_role.delay.called)
+
+    @mock.patch('galaxy.main.utils.memcache_lock.time.sleep')
+    def test_starts_an_import_when_the_lock_is_held(self, sleep):
+        self.in_flight('PENDING')
+        with memcache_lock(import_lock_key(self.role.id, '')):
+            task = self.request_import()
+        self.assertEqual(task.celery_task_id, 'celery-id')
+        self.assertEqual(ImportTask.objects.count(), 2)
+
+
+class TestFollowUpImports(ImportTaskTestCase):
+
+    def test_follow_up_waits_for_in_flight_import(self):
+        running = self.in_flight('RUNNING', commit='abc')
+        follow_up = self.request_import(commit='def')
+        self.assertIsNone(start_follow_up_import(running))
+
+        ImportTask.objects.filter(id=running.id).update(state='SUCCESS')
+        self.assertEqual(start_follow_up_import(running).id, follow_up.id)
+        self.import_role.delay.assert_called_once_with(follow_up.id)
+
+    def test_clear_stuck_imports_starts_follow_up(self):
+        running = self.in_flight('RUNNING', commit='abc')
+        follow_up = self.request_import(commit='def')
+        ImportTask.objects.update(created=timezone.now() - datetime.timedelta(hours=2))
+
+        clear_stuck_imports()
+        self.assertEqual(ImportTask.objects.get(id=running.id).state, 'FAILED')
+        follow_up = ImportTask.objects.get(id=follow_up.id)
+        self.assertEqual((follow_up.state, follow_up.celery_task_id), ('PENDING', 'celery-id'))
+
+    def test_deferred_import_records_retry_time(self):
+        task = self.in_flight('RUNNING')
+        self.import_role.retry.return_value = RuntimeError('retry')
+        with self.assertRaises(RuntimeError):
+            defer_import_task(task, RateLimitExhausted(600))
+        task = ImportTask.objects.get(id=task.id)
+        self.assertEqual(task.state, 'PENDING')
+        self.assertAlmostEqual((task.deferred_until - timezone.now()).total_seconds(), 600, delta=5)
+        self.import_role.retry.assert_called_once_with(countdown=600, max_retries=None)
+
+    def test_clear_stuck_imports_skips_deferred_import(self):
+        now = timezone.now()
+        deferred = self.in_flight('PENDING', deferred_until=now + datetime.timedelta(minutes=30))
+        overdue = self.in_flight('PENDING', deferred_until=now - datetime.timedelta(hours=2))
+        ImportTask.objects.update(created=now - datetime.timedelta(hours=2))
+
+        clear_stuck_imports()
+        self.assertEqual(ImportTask.objects.get(id=deferred.id).state, 'PENDING')
+        self.assertEqual(ImportTask.objects.get(id=overdue.id).state, 'FAILED')
@@ -0,0 +1,51 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django import test
+from django.contrib.auth import get_user_model
+
+from galaxy.main.celerytasks.import_log import ImportMessageBuffer
+from galaxy.main.models import ImportTask, ImportTaskMessage, Role
+
+
+class TestImportMessageBuffer(test.TransactionTestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create(username='user')
+        role = Role.objects.create(namespace='user', name='role', github_user='user', github_repo='role')
+        self.import_task = ImportTask.objects.create(github_user='user', github_repo='role', role=role, owner=user)
+
+    def messages(self):
+        return list(ImportTaskMessage.objects.filter(task=self.import_task).order_by('id')
+                    .values_list('message_type', 'message_text'))
+
+    def test_messages_are_written_on_flush(self):
+        buffer = ImportMessageBuffer(self.import_task, flush_interval=3600)
+        buffer.add(u"INFO", u"starting")
+        buffer.add(u"ERROR", u"broken")
+        buffer.add(u"WARNING", u"odd")
+        self.assertEqual(self.messages(), [])
+        self.assertEqual((buffer.error_count, buffer.warning_count), (1, 1))
+
+        buffer.flush()
+        self.assertEqual(self.messages(), [(u"INFO", u"starting"), (u"ERROR", u"broken"), (u"WARNING", u"odd")])
+        self.assertEqual(buffer.pending, [])
+
+    def test_flushes_after_interval(self):
+        buffer = ImportMessageBuffer(self.import_task, flush_interval=0)
+        buffer.add(u"INFO", u"x" * 300)
+        self.assertEqual(self.messages(), [(u"INFO", u"x" * 255)])
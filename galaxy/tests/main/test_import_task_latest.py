@@ -0,0 +1,47 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django import test
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory
+
+from galaxy.api import views
+from galaxy.main.models import ImportTask, Role
+
+
+class TestImportTaskLatestList(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create(username='user')
+        self.latest = []
+        for name in ('one', 'two'):
+            role = Role.objects.create(namespace='user', name=name, github_user='user', github_repo=name)
+            for state in ('FAILED', 'SUCCESS'):
+                task = ImportTask.objects.create(github_user='user', github_repo=name, role=role,
+                                                 owner=self.user, state=state)
+            self.latest.append(task)
+
+    def test_one_row_per_repository(self):
+        request = APIRequestFactory().get('/api/v1/import_task_latest/')
+        response = views.ImportTaskLatestList.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([(task['id'], task['github_repo'], task['summary_fields']['details']['state'])
+                          for task in response.data['results']],
+                         [(task.id, task.github_repo, 'SUCCESS') for task in self.latest])
@@ -0,0 +1,60 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django import test
+from django.contrib.auth import get_user_model
+
+from galaxy.main.celerytasks.tasks import is_unchanged
+from galaxy.main.models import ImportTask, Role
+
+
+class Snapshot(object):
+
+    def __init__(self, commit_sha):
+        self.commit_sha = commit_sha
+
+
+class TestIsUnchanged(test.TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='user')
+        self.role = Role.objects.create(namespace='user', name='role', github_user='user', github_repo='role',
+                                        is_valid=True, commit='abc')
+        self.last = self.create_task(state='SUCCESS')
+        self.import_task = self.create_task(state='RUNNING')
+
+    def create_task(self, **kwargs):
+        return ImportTask.objects.create(github_user='user', github_repo='role', role=self.role,
+                                         owner=self.user, **kwargs)
+
+    def test_same_commit_after_success(self):
+        self.assertTrue(is_unchanged(self.import_task, self.role, Snapshot('abc')))
+
+    def test_new_commit(self):
+        self.assertFalse(is_unchanged(self.import_task, self.role, Snapshot('def')))
+
+    def test_forced(self):
+        self.import_task.force = True
+        self.assertFalse(is_unchanged(self.import_task, self.role, Snapshot('abc')))
+
+    def test_new_role_name(self):
+        self.import_task.alternate_role_name = 'renamed'
+        self.assertFalse(is_unchanged(self.import_task, self.role, Snapshot('abc')))
+
+    def test_last_import_failed(self):
+        self.create_task(state='FAILED')
+        self.assertFalse(is_unchanged(self.import_task, self.role, Snapshot('abc')))
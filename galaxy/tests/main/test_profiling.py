@@ -0,0 +1,50 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django import test
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from galaxy.main.celerytasks.profiling import ImportProfiler
+from galaxy.main.models import ImportTask, ImportTaskStage, Role
+
+
+class TestImportProfiler(test.TransactionTestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create(username='user')
+        role = Role.objects.create(namespace='user', name='role', github_user='user', github_repo='role')
+        self.import_task = ImportTask.objects.create(github_user='user', github_repo='role', role=role, owner=user)
+
+    def test_records_stages(self):
+        with ImportProfiler(self.import_task) as profiler:
+            profiler.start('first')
+            list(Role.objects.all())
+            list(Role.objects.all())
+            profiler.start('second')
+            profiler.save()
+        stages = ImportTaskStage.objects.filter(task=self.import_task).order_by('position')
+        self.assertEqual([(stage.name, stage.query_count) for stage in stages], [('first', 2), ('second', 0)])
+
+    def test_debug_cursor_is_restored_when_the_import_raises(self):
+        self.assertFalse(connection.force_debug_cursor)
+        with self.assertRaises(ValueError):
+            with ImportProfiler(self.import_task) as profiler:
+                profiler.start('setup')
+                self.assertTrue(connection.force_debug_cursor)
+                raise ValueError()
+        self.assertFalse(connection.force_debug_cursor)
@@ -0,0 +1,88 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import mock
+
+from django import test
+
+from galaxy.main.celerytasks.elastic_tasks import platform_doc_name
+from galaxy.main.management.commands.rebuild_galaxy_indexes import Command
+from galaxy.main.models import Platform, Role, Tag
+from galaxy.main.search_models import TagDoc
+
+
+class TestRebuildIndexes(test.TestCase):
+
+    def setUp(self):
+        self.es = mock.Mock()
+        self.command = Command(stdout=mock.Mock())
+        self.command.chunk_size = 10
+        for target, value in (('connections', mock.Mock(**{'get_connection.return_value': self.es})),
+                              ('Index', mock.Mock()),
+                              ('streaming_bulk', mock.Mock(side_effect=self.bulk))):
+            patcher = mock.patch('galaxy.main.management.commands.rebuild_galaxy_indexes.' + target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.indexed = []
+
+    def bulk(self, es, actions, chunk_size):
+        for action in actions:
+            self.indexed.append(action)
+            yield True, {}
+
+    def rebuild(self):
+        self.command.rebuild(TagDoc, [(1, TagDoc(tag='web', roles=2))])
+        return self.indexed[0]['_index']
+
+    def test_swaps_alias_to_new_index(self):
+        self.es.indices.exists_alias.return_value = True
+        self.es.indices.get_alias.return_value = {'galaxy_tags_old': {}}
+        name = self.rebuild()
+        self.assertTrue(name.startswith('galaxy_tags_'))
+        self.es.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'remove': {'index': 'galaxy_tags_old', 'alias': 'galaxy_tags'}},
+            {'add': {'index': name, 'alias': 'galaxy_tags'}},
+        ]})
+        self.es.indices.delete.assert_called_once_with(index='galaxy_tags_old', ignore=404)
+
+    def test_replaces_index_without_alias(self):
+        self.es.indices.exists_alias.return_value = False
+        self.es.indices.exists.return_value = True
+        name = self.rebuild()
+        self.es.indices.delete.assert_called_once_with(index='galaxy_tags')
+        self.es.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'add': {'index': name, 'alias': 'galaxy_tags'}}]})
+
+    def test_failed_build_keeps_alias(self):
+        self.es.indices.refresh.side_effect = ValueError()
+        with self.assertRaises(ValueError):
+            self.rebuild()
+        self.assertFalse(self.es.indices.update_aliases.called)
+        self.es.indices.delete.assert_called_once_with(index=self.indexed[0]['_index'], ignore=404)
+
+    def test_documents(self):
+        web = Tag.objects.create(name='web')
+        Platform.objects.create(name='EL', release='6', alias='rhel')
+        Platform.objects.create(name='EL', release='7', alias='centos')
+        role = Role.objects.create(namespace='user', name='role', github_user='user', github_repo='role',
+                                   is_valid=True)
+        role.tags.add(web)
+        self.assertEqual([(tag_id, doc.tag, doc.roles) for tag_id, doc in self.command.tag_docs()],
+                         [(web.id, 'web', 1)])
+        [(name, platform)] = list(self.command.platform_docs())
+        self.assertEqual((name, sorted(platform.releases), platform.roles), (platform_doc_name('EL'), ['6', '7'], 0))
+        self.assertEqual([namespace for namespace, doc in self.command.user_docs()], ['user'])
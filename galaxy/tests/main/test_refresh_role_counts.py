@@ -0,0 +1,134 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from allauth.socialaccount.models import SocialAccount, SocialApp, SocialToken
+from django import test
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import F
+
+from galaxy.main.celerytasks.tasks import refresh_batch_key, refresh_role_counts
+from galaxy.main.celerytasks.token_pool import RateLimitExhausted
+from galaxy.main.management.commands.refresh_role_counts import Command
+from galaxy.main.models import RefreshRoleCount, Role
+
+
+class TestRefreshRoleCountsTask(test.TestCase):
+
+    def setUp(self):
+        for_task_users = self.patch('galaxy.main.celerytasks.tasks.TokenPool.for_task_users')
+        for_task_users.return_value.acquire.return_value = 'token'
+        self.refresh_repo_metadata = self.patch('galaxy.main.celerytasks.tasks.refresh_repo_metadata')
+        self.role_ids = [Role.objects.create(namespace='user', name=name, github_user='user', github_repo=name,
+                                             is_valid=True).id
+                         for name in ('one', 'two')]
+        self.tracker = RefreshRoleCount.objects.create(state='PENDING', batches=2)
+
+    def patch(self, target):
+        patcher = mock.patch(target)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def tracker_state(self):
+        tracker = RefreshRoleCount.objects.get(id=self.tracker.id)
+        return (tracker.state, tracker.batches_finished, tracker.passed, tracker.failed, tracker.rate_limit_waits)
+
+    def test_counts_are_added(self):
+        self.refresh_repo_metadata.return_value = dict(passed=2, failed=0, deleted=0, updated=0)
+        refresh_role_counts(self.role_ids, self.tracker.id)
+        self.assertEqual(self.tracker_state(), ('RUNNING', 1, 2, 0, 0))
+        refresh_role_counts(self.role_ids, self.tracker.id, batch=1)
+        self.assertEqual(self.tracker_state(), ('FINISHED', 2, 4, 0, 0))
+        self.assertTrue(cache.get(refresh_batch_key(self.tracker.id, 1)))
+
+    def test_unexpected_error_fails_the_batch(self):
+        self.refresh_repo_metadata.side_effect = ValueError('unexpected payload')
+        refresh_role_counts(self.role_ids, self.tracker.id)
+        self.assertEqual(self.tracker_state(), ('RUNNING', 1, 0, 2, 0))
+
+    def test_rate_limit_retries_the_batch(self):
+        self.refresh_repo_metadata.side_effect = RateLimitExhausted(60)
+        with self.assertRaises(Exception):
+            refresh_role_counts(self.role_ids, self.tracker.id)
+        self.assertEqual(self.tracker_state(), ('RUNNING', 0, 0, 0, 1))
+
+
+@test.override_settings(GITHUB_TASK_USERS=['worker'])
+@mock.patch('sys.stdout', mock.Mock())
+class TestRefreshRoleCountsCommand(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create(username='worker')
+        app = SocialApp.objects.create(provider='github', name='github', client_id='id', secret='secret')
+        account = SocialAccount.objects.create(user=user, provider='github', uid='1')
+        SocialToken.objects.create(app=app, account=account, token='token')
+        for i in range(5):
+            Role.objects.create(namespace='user', name='role%d' % i, github_user='user', github_repo='role%d' % i,
+                                is_valid=True)
+        patcher = mock.patch('galaxy.main.management.commands.refresh_role_counts.refresh_role_counts')
+        self.addCleanup(patcher.stop)
+        self.task = patcher.start()
+        self.task.delay.side_effect = self.run_batch
+        self.lost_batches = set()
+
+    def run_batch(self, role_ids, tracker_id, token, batch):
+        if batch in self.lost_batches:
+            return
+        RefreshRoleCount.objects.filter(pk=tracker_id).update(
+            passed=F('passed') + len(role_ids), batches_finished=F('batches_finished') + 1)
+        RefreshRoleCount.objects.filter(pk=tracker_id, batches_finished__gte=F('batches')).update(state='FINISHED')
+        cache.set(refresh_batch_key(tracker_id, batch), True)
+
+    def test_completes(self):
+        call_command('refresh_role_counts', batch_size=2, poll_interval=0)
+        tracker = RefreshRoleCount.objects.get()
+        self.assertEqual((tracker.state, tracker.batches, tracker.passed), ('COMPLETED', 3, 5))
+
+    def test_stalls_with_unfinished_batches(self):
+        self.lost_batches.add(1)
+        with self.assertRaises(CommandError) as context:
+            call_command('refresh_role_counts', batch_size=2, poll_interval=0.01, stall_timeout=0.1)
+        self.assertIn(u"1 of 3 batches unfinished", unicode(context.exception))
+        tracker = RefreshRoleCount.objects.get()
+        self.assertEqual((tracker.state, tracker.batches_finished), ('STALLED', 2))
+
+    def test_writes_report(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'report.json')
+        call_command('refresh_role_counts', batch_size=2, poll_interval=0, report=path)
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual((report['state'], report['roles'], report['batches'], report['passed']),
+                         ('COMPLETED', 5, 3, 5))
+        self.assertEqual(report['unfinished_batches'], [])
+
+    def test_progress_line(self):
+        tracker = RefreshRoleCount(batches=4, batches_finished=2, passed=30, failed=5, deleted=3, updated=2,
+                                   requests=12, rate_limit_waits=1)
+        self.assertEqual(Command().progress_line(tracker, 100, 10.0),
+                         u"Roles: 40/100 Batches: 2/4 Passed: 30 Failed: 5 Deleted: 3 Updated: 2 "
+                         u"Requests: 12 Rate limit waits: 1 Rate: 4.0 roles/s ETA: 15s")
@@ -0,0 +1,71 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import mock
+
+from allauth.socialaccount.models import SocialAccount, SocialApp, SocialToken
+from django import test
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from galaxy.main.models import BulkReimport, ImportTask, Role
+
+
+@mock.patch('sys.stdout', mock.Mock())
+class TestReimportRole(test.TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='user')
+        app = SocialApp.objects.create(provider='github', name='github', client_id='id', secret='secret')
+        account = SocialAccount.objects.create(user=self.user, provider='github', uid='1')
+        SocialToken.objects.create(app=app, account=account, token='token')
+        self.roles = [self.create_role(name) for name in ('one', 'two')]
+
+        self.import_role = mock.Mock()
+        self.import_role.delay.return_value.id = 'celery-id'
+        patcher = mock.patch('galaxy.main.celerytasks.tasks.import_role', self.import_role)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_role(self, name):
+        role = Role.objects.create(namespace='user', name=name, github_user='user', github_repo=name,
+                                   is_valid=True)
+        ImportTask.objects.create(github_user='user', github_repo=name, role=role, owner=self.user,
+                                  state='SUCCESS', alternate_role_name=name)
+        return role
+
+    def finish_imports(self, seconds):
+        ImportTask.objects.filter(state='PENDING').update(state='SUCCESS')
+
+    def test_reimport_by_id_joins_pending_import(self):
+        pending = ImportTask.objects.create(github_user='user', github_repo='one', role=self.roles[0],
+                                            owner=self.user, state='PENDING', celery_task_id='queued')
+        call_command('reimport_role', str(self.roles[0].id), str(self.roles[1].id))
+        self.assertEqual(ImportTask.objects.filter(state='PENDING').count(), 2)
+        self.assertEqual(ImportTask.objects.get(id=pending.id).alternate_role_name, 'one')
+        self.import_role.delay.assert_called_once_with(
+            ImportTask.objects.get(role=self.roles[1], state='PENDING').id)
+
+    @mock.patch('galaxy.main.management.commands.reimport_role.time.sleep')
+    def test_bulk_reimport(self, sleep):
+        sleep.side_effect = self.finish_imports
+        call_command('reimport_role', all=True, force=True, interval=0)
+        run = BulkReimport.objects.get()
+        self.assertEqual((run.state, run.total, run.queued, run.skipped), ('FINISHED', 2, 2, 0))
+        tasks = ImportTask.objects.filter(bulk_reimport=run)
+        self.assertEqual(set(task.role_id for task in tasks), set(role.id for role in self.roles))
+        self.assertTrue(all(task.force for task in tasks))
@@ -0,0 +1,61 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django import test
+
+from galaxy.main.models import Platform, Role, RoleVersion, Tag
+from galaxy.main.search_indexes import RoleIndex
+
+
+class TestActiveRelated(test.TestCase):
+
+    def setUp(self):
+        self.index = RoleIndex()
+        xenial = Platform.objects.create(name='Ubuntu', release='xenial')
+        el = Platform.objects.create(name='EL', release='7', alias='rhel centos')
+        retired = Platform.objects.create(name='Debian', release='etch', active=False)
+        web = Tag.objects.create(name='web')
+        old = Tag.objects.create(name='old', active=False)
+        for i in range(3):
+            role = Role.objects.create(namespace='user', name='role%d' % i, github_user='user',
+                                       github_repo='role%d' % i, is_valid=True)
+            role.platforms.add(xenial, el, retired)
+            role.tags.add(web, old)
+            RoleVersion.objects.create(role=role, name='1.0.0')
+            RoleVersion.objects.create(role=role, name='1.10.0')
+
+    def test_skips_inactive_and_orders(self):
+        role = Role.objects.get(name='role0')
+        self.assertEqual([(p.name, p.release) for p in role.active_related('platforms')],
+                         [('EL', '7'), ('Ubuntu', 'xenial')])
+        self.assertEqual(role.get_tags(), ['web'])
+        self.assertEqual([v.name for v in role.active_related('versions')], ['1.10.0', '1.0.0'])
+
+    def test_prefetched_matches_queried(self):
+        prefetched = self.index.index_queryset().get(name='role0')
+        role = Role.objects.get(name='role0')
+        with self.assertNumQueries(0):
+            data = self.index.prepare(prefetched)
+        self.assertEqual(data, self.index.prepare(role))
+        self.assertEqual(data['platforms'], ['Enterprise_Linux', 'Ubuntu'])
+
+    def test_queries_do_not_grow_with_roles(self):
+        roles = list(self.index.index_queryset().order_by('id'))
+        self.assertEqual(len(roles), 3)
+        with self.assertNumQueries(0):
+            for role in roles:
+                self.index.prepare(role)
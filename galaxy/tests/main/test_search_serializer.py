@@ -0,0 +1,61 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import mock
+
+from django import test
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+
+from galaxy.api.serializers import RoleSearchSerializer
+from galaxy.main.models import Role, Stargazer, Subscription
+
+
+class TestUserRelations(test.TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='user')
+        self.roles = [
+            Role.objects.create(namespace='user', name=name, github_user='user', github_repo=name)
+            for name in ('one', 'two', 'three')
+        ]
+        Subscription.objects.create(owner=self.user, github_user='user', github_repo='one')
+        Stargazer.objects.create(owner=self.user, role=self.roles[1])
+        # search results carry the fields of the role document
+        self.results = [
+            mock.Mock(role_id=role.id, github_user=role.github_user, github_repo=role.github_repo)
+            for role in self.roles
+        ]
+
+    def serializer(self, user):
+        request = test.RequestFactory().get('/api/v1/search/roles/')
+        request.user = user
+        return RoleSearchSerializer(self.results, many=True, context={'request': request}).child
+
+    def test_relations_are_loaded_once_per_page(self):
+        serializer = self.serializer(self.user)
+        with self.assertNumQueries(2):
+            subscribed = [serializer.get_user_is_subscriber(result) for result in self.results]
+            starred = [serializer.get_user_is_stargazer(result) for result in self.results]
+        self.assertEqual(subscribed, [True, False, False])
+        self.assertEqual(starred, [False, True, False])
+
+    def test_anonymous_user(self):
+        serializer = self.serializer(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertFalse(serializer.get_user_is_subscriber(self.results[0]))
+            self.assertFalse(serializer.get_user_is_stargazer(self.results[1]))
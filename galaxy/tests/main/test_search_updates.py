@@ -0,0 +1,124 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import mock
+
+from django import test
+from django.core.cache import cache
+from haystack import connections, connection_router
+
+from galaxy.main.celerytasks import elastic_tasks
+from galaxy.main.models import Role, Tag
+from galaxy.main.search_indexes import RoleIndex
+from galaxy.main.signals.processors import QueuedSignalProcessor
+
+
+def make_role(name, **kwargs):
+    return Role.objects.create(namespace='user', name=name, github_user='user', github_repo=name,
+                               is_valid=True, **kwargs)
+
+
+class TestQueuedSignalProcessor(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('galaxy.main.celerytasks.elastic_tasks.update_search_indexes')
+        self.task = patcher.start()
+        self.addCleanup(patcher.stop)
+        processor = QueuedSignalProcessor(connections, connection_router)
+        self.addCleanup(processor.teardown)
+
+    def test_saved_and_deleted_roles_are_queued(self):
+        role = make_role('role')
+        pk = role.pk
+        role.delete()
+        self.assertEqual(elastic_tasks.SEARCH_QUEUE.drain(), [('main.role', pk, False), ('main.role', pk, True)])
+        # one update is scheduled however many changes are queued
+        self.task.apply_async.assert_called_once_with(countdown=mock.ANY)
+
+    def test_unindexed_models_are_ignored(self):
+        Tag.objects.create(name='web')
+        self.assertEqual(elastic_tasks.SEARCH_QUEUE.pending(), 0)
+        self.assertFalse(self.task.apply_async.called)
+
+    def test_indexes_from_task_without_cache(self):
+        with mock.patch.object(elastic_tasks.SEARCH_QUEUE, 'push', side_effect=ValueError):
+            role = make_role('role')
+        self.task.delay.assert_called_once_with(updates=[('main.role', role.pk, False)])
+
+
+class TestUpdateSearchIndexes(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.backend = mock.Mock()
+        haystack = mock.MagicMock()
+        haystack['default'].get_unified_index.return_value.get_index.return_value = RoleIndex()
+        haystack['default'].get_backend.return_value = self.backend
+        patcher = mock.patch('galaxy.main.celerytasks.elastic_tasks.haystack_connections', haystack)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_last_change_wins(self):
+        kept = make_role('kept')
+        deleted = make_role('deleted')
+        elastic_tasks.SEARCH_QUEUE.push(('main.role', deleted.pk, False))
+        elastic_tasks.SEARCH_QUEUE.push(('main.role', deleted.pk, True))
+        elastic_tasks.update_search_indexes(updates=[('main.role', kept.pk, False)])
+        index, objects = self.backend.update.call_args[0]
+        self.assertEqual([role.pk for role in objects], [kept.pk])
+        self.backend.remove.assert_called_once_with('main.role.%d' % deleted.pk)
+        self.assertEqual(elastic_tasks.SEARCH_QUEUE.pending(), 0)
+
+    def test_removes_roles_outside_index_queryset(self):
+        role = make_role('role', active=False)
+        elastic_tasks.update_search_indexes(updates=[('main.role', role.pk, False)])
+        self.assertFalse(self.backend.update.called)
+        self.backend.remove.assert_called_once_with('main.role.%d' % role.pk)
+
+
+class TestFlushCustomIndexes(test.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for target in ('update_indexes', 'schedule_flush'):
+            patcher = mock.patch('galaxy.main.celerytasks.elastic_tasks.' + target)
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.update_indexes.side_effect = ValueError('search engine down')
+        elastic_tasks.INDEX_QUEUE.push(dict(username='user', tags=['web'], platforms=[], cloud_platforms=[]))
+
+    def flush(self, retries):
+        elastic_tasks.flush_custom_indexes.push_request(retries=retries)
+        self.addCleanup(elastic_tasks.flush_custom_indexes.pop_request)
+        elastic_tasks.flush_custom_indexes.run()
+
+    def test_retry_carries_drained_updates(self):
+        with mock.patch.object(elastic_tasks.flush_custom_indexes, 'retry',
+                               return_value=RuntimeError('retry')) as retry:
+            with self.assertRaises(RuntimeError):
+                self.flush(0)
+        self.assertEqual(retry.call_args[1]['kwargs']['updates'],
+                         [dict(username='user'), dict(tags=['web'], platforms=[], cloud_platforms=[])])
+        self.assertEqual(elastic_tasks.INDEX_QUEUE.pending(), 0)
+
+    def test_updates_are_requeued_after_last_retry(self):
+        with self.assertRaises(ValueError):
+            self.flush(3)
+        self.assertEqual(elastic_tasks.INDEX_QUEUE.drain(),
+                         [dict(username='user'), dict(tags=['web'], platforms=[], cloud_platforms=[])])
+        self.schedule_flush.assert_called_once_with()
@@ -0,0 +1,113 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+from django import test
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from galaxy.api import views
+from galaxy.main.models import Platform, Role, Tag
+from galaxy.main.test.queries import QueryCountMixin
+
+
+class TestRoleListQueries(QueryCountMixin, test.TestCase):
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        platform = Platform.objects.create(name='EL', release='7')
+        tag = Tag.objects.create(name='web')
+        for i in range(20):
+            role = Role.objects.create(namespace='user%d' % i, name='role%d' % i, github_user='user%d' % i,
+                                       github_repo='repo%d' % i, is_valid=True)
+            role.platforms.add(platform)
+            role.tags.add(tag)
+
+    def get_page(self, size):
+        # every size counts the roles, instead of reading the cached count
+        cache.clear()
+        request = self.factory.get('/api/v1/roles/', {'page_size': size})
+        response = views.RoleList.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), size)
+
+    def test_role_list_queries_do_not_grow_with_page_size(self):
+        self.assertConstantQueries(self.get_page, [1, 5, 20])
+
+
+class TestRoleFieldSelection(test.TestCase):
+
+    def setUp(self):
+        # counts of unfiltered lists are cached
+        cache.clear()
+        self.factory = APIRequestFactory()
+        Role.objects.create(namespace='user', name='role', github_user='user', github_repo='repo',
+                            is_valid=True, readme='# role', readme_html='<h1>role</h1>')
+
+    def get_role(self, params):
+        request = self.factory.get('/api/v1/roles/', params)
+        response = views.RoleList.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'][0]
+
+    def test_readme_is_sent_by_default(self):
+        role = self.get_role({})
+        self.assertEqual(role['readme'], '# role')
+        self.assertEqual(role['readme_html'], '<h1>role</h1>')
+
+    def get_role_and_query(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            role = self.get_role(params)
+        [query] = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT DISTINCT "main_role"')]
+        return role, query
+
+    def test_excluded_readme_is_deferred(self):
+        role, query = self.get_role_and_query({'exclude': 'readme,readme_html'})
+        self.assertNotIn('readme', role)
+        self.assertNotIn('readme_html', role)
+        self.assertIn('name', role)
+        self.assertNotIn('"readme"', query)
+        self.assertNotIn('"readme_html"', query)
+
+    def test_readme_is_loaded_when_selected(self):
+        role, query = self.get_role_and_query({'fields': 'name,readme'})
+        self.assertEqual(role, {'name': 'role', 'readme': '# role'})
+        self.assertIn('"readme"', query)
+        self.assertNotIn('"readme_html"', query)
+
+    def test_fields_selects_output(self):
+        role = self.get_role({'fields': 'name,readme_html'})
+        self.assertEqual(set(role.keys()), set(['name', 'readme_html']))
+        self.assertEqual(role['readme_html'], '<h1>role</h1>')
+
+    def test_exclude_drops_fields(self):
+        role = self.get_role({'exclude': 'summary_fields,related'})
+        self.assertNotIn('summary_fields', role)
+        self.assertNotIn('related', role)
+        self.assertIn('name', role)
+
+
+class TestFieldSelectionScope(test.TestCase):
+
+    def test_other_serializers_ignore_fields(self):
+        Platform.objects.create(name='EL', release='7')
+        request = APIRequestFactory().get('/api/v1/platforms/', {'fields': 'name'})
+        response = views.PlatformList.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('release', response.data[0])
@@ -0,0 +1,85 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import datetime
+
+from django import test
+from django.utils import timezone
+
+from galaxy.main.celerytasks.sync import sync_relation, sync_role_versions
+from galaxy.main.models import Role, RoleVersion, Tag
+
+
+def make_role(name='role'):
+    return Role.objects.create(namespace='user', name=name, github_user='user', github_repo=name)
+
+
+class TestSyncRoleVersions(test.TestCase):
+
+    def setUp(self):
+        self.role = make_role()
+        self.day = timezone.now().replace(microsecond=0)
+        RoleVersion.objects.create(role=self.role, name='v1', loose_version='v1', release_date=self.day)
+        RoleVersion.objects.create(role=self.role, name='old', loose_version='old', release_date=self.day)
+
+    def versions(self):
+        return dict(RoleVersion.objects.filter(role=self.role).values_list('name', 'release_date'))
+
+    def test_adds_updates_and_removes(self):
+        later = self.day + datetime.timedelta(days=1)
+        added, updated, removed = sync_role_versions(self.role, [
+            {'name': 'v1', 'date': later},
+            {'name': 'v2', 'date': self.day},
+        ])
+        self.assertEqual((added, updated, removed), (set(['v2']), set(['v1']), set(['old'])))
+        self.assertEqual(self.versions(), {'v1': later, 'v2': self.day})
+
+    def test_resolves_dates_of_new_undated_tags(self):
+        asked = []
+
+        def resolve_dates(names):
+            asked.extend(names)
+            return {'v2': self.day}
+
+        sync_role_versions(self.role, [
+            {'name': 'v1', 'date': None},
+            {'name': 'v2', 'date': None},
+            {'name': 'tree', 'date': None},
+        ], resolve_dates=resolve_dates)
+        self.assertEqual(sorted(asked), ['tree', 'v2'])
+        self.assertEqual(self.versions(), {'v1': self.day, 'v2': self.day, 'tree': None})
+
+    def test_no_tags_removes_nothing(self):
+        self.assertEqual(sync_role_versions(self.role, []), (set(), set(), set()))
+        self.assertEqual(set(self.versions()), set(['v1', 'old']))
+
+
+class TestSyncRelation(test.TestCase):
+
+    def setUp(self):
+        self.role = make_role()
+        self.web, self.db, self.cache = [Tag.objects.create(name=name) for name in ('web', 'db', 'cache')]
+        self.role.tags.add(self.web, self.db)
+
+    def test_adds_and_removes_links(self):
+        added, removed = sync_relation(self.role, 'tags', [self.db, self.cache])
+        self.assertEqual((added, removed), (set([self.cache]), set([self.web])))
+        self.assertEqual(set(self.role.tags.all()), set([self.db, self.cache]))
+
+    def test_unchanged_relation_only_reads(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(sync_relation(self.role, 'tags', [self.web, self.db]), (set(), set()))
@@ -0,0 +1,150 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import time
+
+import mock
+
+from django import test
+from django.core.cache import cache
+
+from galaxy.main.celerytasks import token_pool
+from galaxy.main.celerytasks.github_fetch import GithubFetcher
+from galaxy.main.celerytasks.token_pool import RateLimitExhausted, TokenPool
+
+
+@test.override_settings(GITHUB_TOKEN_RESERVE=100)
+class TestTokenPool(test.SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.reset = int(time.time()) + 600
+        self.pool = TokenPool(['a', 'b', 'a', None, 'c'])
+
+    def test_duplicates_and_empty_tokens_are_dropped(self):
+        self.assertEqual(self.pool.tokens, ['a', 'b', 'c'])
+
+    def test_preferred_token_while_it_has_quota(self):
+        token_pool.record_values('b', 4000, self.reset)
+        self.assertEqual(self.pool.acquire(preferred='b'), 'b')
+        self.assertEqual(dict((token, remaining) for token, remaining, _ in self.pool.quotas())['b'], 3999)
+
+    def test_healthiest_token_once_preferred_is_low(self):
+        token_pool.record('a', {'X-RateLimit-Remaining': '50', 'X-RateLimit-Reset': str(self.reset)})
+        token_pool.record_values('b', 3000, self.reset)
+        token_pool.record_values('c', 200, self.reset)
+        self.assertEqual(self.pool.acquire(preferred='a'), 'b')
+
+    def test_stale_state_counts_as_full_quota(self):
+        token_pool.record_values('a', 0, int(time.time()) - 1)
+        self.assertEqual(self.pool.quotas()[0], ('a', token_pool.DEFAULT_LIMIT, None))
+
+    def test_graphql_quota_is_separate(self):
+        token_pool.record_values('a', 50, self.reset, resource='graphql')
+        self.assertEqual(self.pool.acquire(preferred='a'), 'a')
+        self.assertEqual(self.pool.acquire(preferred='a', resource='graphql'), 'b')
+
+    def test_exhausted_pool_raises_with_earliest_reset(self):
+        for token, reset in (('a', self.reset), ('b', self.reset - 300), ('c', self.reset)):
+            token_pool.record_values(token, 10, reset)
+        with self.assertRaises(RateLimitExhausted) as context:
+            self.pool.acquire()
+        self.assertAlmostEqual(context.exception.reset_in, 301, delta=2)
+
+
+def response(status=200, remaining=4000, body=None):
+    return mock.Mock(status_code=status, links={}, reason='', json=mock.Mock(return_value=body or {}),
+                     headers={'X-RateLimit-Remaining': str(remaining),
+                              'X-RateLimit-Reset': str(int(time.time()) + 600)})
+
+
+@test.override_settings(GITHUB_TOKEN_RESERVE=100)
+class TestFetcherTokenSwitch(test.SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.pool = TokenPool(['a', 'b'])
+        self.responses = {}
+
+    def fetcher(self, pool):
+        fetcher = GithubFetcher('a', pool=pool)
+        fetcher.session.get = mock.Mock(side_effect=self.get)
+        self.addCleanup(fetcher.close)
+        return fetcher
+
+    def get(self, url, headers=None, **kwargs):
+        return self.responses[headers['Authorization']]
+
+    def post(self, url, headers=None, **kwargs):
+        return self.responses[headers['Authorization']]
+
+    def used_tokens(self, fetcher):
+        return [call[1]['headers']['Authorization'] for call in fetcher.session.get.call_args_list]
+
+    def test_exhausted_token_is_swapped(self):
+        self.responses = {'token a': response(403, 0), 'token b': response(body={'name': 'repo'})}
+        fetcher = self.fetcher(self.pool)
+        self.assertEqual(fetcher.get('/repos/owner/repo'), {'name': 'repo'})
+        self.assertEqual(self.used_tokens(fetcher), ['token a', 'token b'])
+        self.assertEqual(fetcher.token, 'b')
+        quotas = dict((token, remaining) for token, remaining, _ in self.pool.quotas())
+        self.assertEqual(quotas['a'], 0)
+
+        # later requests go straight to the new token
+        fetcher.get('/repos/owner/other')
+        self.assertEqual(self.used_tokens(fetcher)[-1], 'token b')
+
+    def test_raises_once_every_token_is_exhausted(self):
+        self.responses = {'token a': response(403, 0), 'token b': response(403, 0)}
+        fetcher = self.fetcher(self.pool)
+        with self.assertRaises(RateLimitExhausted) as context:
+            fetcher.get('/repos/owner/repo')
+        self.assertIn('on all tokens', unicode(context.exception))
+        self.assertEqual(self.used_tokens(fetcher), ['token a', 'token b'])
+
+    def test_raises_without_pool(self):
+        self.responses = {'token a': response(403, 0)}
+        fetcher = self.fetcher(None)
+        with self.assertRaises(RateLimitExhausted) as context:
+            fetcher.get('/repos/owner/repo')
+        self.assertNotIn('on all tokens', unicode(context.exception))
+        self.assertEqual(fetcher.session.get.call_count, 1)
+
+    def graphql_fetcher(self):
+        fetcher = self.fetcher(self.pool)
+        fetcher.session.post = mock.Mock(side_effect=self.post)
+        return fetcher
+
+    def test_graphql_uses_token_with_graphql_quota(self):
+        token_pool.record_values('a', 50, int(time.time()) + 600, resource='graphql')
+        self.responses = {'token b': response(remaining=3000, body={'data': {'r0': None}})}
+        fetcher = self.graphql_fetcher()
+        self.assertEqual(fetcher.graphql_partial('query'), ({'r0': None}, []))
+        self.assertEqual(fetcher.tokens['graphql'], 'b')
+        quotas = dict((token, remaining) for token, remaining, _ in self.pool.quotas(resource='graphql'))
+        self.assertEqual(quotas['b'], 3000)
+        # the REST quota of b is untouched
+        self.assertEqual(self.pool.quotas()[1], ('b', token_pool.DEFAULT_LIMIT, None))
+
+    def test_rate_limited_graphql_query_switches_token(self):
+        self.responses = {'token a': response(remaining=0, body={'errors': [{'type': 'RATE_LIMITED'}]}),
+                          'token b': response(body={'data': {'r0': None}})}
+        fetcher = self.graphql_fetcher()
+        self.assertEqual(fetcher.graphql_partial('query'), ({'r0': None}, []))
+        self.assertEqual([call[1]['headers']['Authorization'] for call in fetcher.session.post.call_args_list],
+                         ['token a', 'token b'])
+        self.assertEqual(fetcher.token, 'a')
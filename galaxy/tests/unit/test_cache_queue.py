@@ -0,0 +1,87 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import unittest
+
+from galaxy.main.utils.cache_queue import CacheQueue
+
+
+class FakeCache(object):
+
+    def __init__(self):
+        self.data = {}
+
+    def add(self, key, value, timeout=None):
+        if key in self.data:
+            return False
+        self.data[key] = value
+        return True
+
+    def incr(self, key):
+        self.data[key] += 1
+        return self.data[key]
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+
+    def get_many(self, keys):
+        return dict((key, self.data[key]) for key in keys if key in self.data)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class CacheQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FakeCache()
+        self.queue = CacheQueue('test', cache=self.cache)
+
+    def test_drain_returns_items_in_order(self):
+        for item in ('a', 'b', 'c'):
+            self.queue.push(item)
+        self.assertEqual(self.queue.pending(), 3)
+        self.assertEqual(self.queue.drain(), ['a', 'b', 'c'])
+        self.assertEqual(self.queue.pending(), 0)
+        self.assertEqual(self.queue.drain(), [])
+
+    def test_drain_limit(self):
+        for item in range(5):
+            self.queue.push(item)
+        self.assertEqual(self.queue.drain(limit=2), [0, 1])
+        self.assertEqual(self.queue.drain(), [2, 3, 4])
+
+    def test_unwritten_slot_is_retried_then_given_up(self):
+        self.queue.push('a')
+        # a producer claimed a slot but has not stored its item yet
+        self.cache.incr(self.queue._key('tail'))
+        self.queue.push('c')
+        self.assertEqual(self.queue.drain(), ['a'])
+        self.assertEqual(self.queue.pending(), 2)
+        self.assertEqual(self.queue.drain(), ['c'])
+        self.assertEqual(self.queue.pending(), 0)
+
+    def test_late_write_is_drained(self):
+        self.queue.push('a')
+        seq = self.cache.incr(self.queue._key('tail'))
+        self.assertEqual(self.queue.drain(), ['a'])
+        self.cache.set(self.queue._slot(seq), 'b')
+        self.assertEqual(self.queue.drain(), ['b'])
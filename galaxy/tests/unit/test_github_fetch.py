@@ -0,0 +1,257 @@
+# (c) 2012-2018, Ansible by Red Hat
+#
+# This file is part of Ansible Galaxy
+#
+# Ansible Galaxy is free software: you can redistribute it and/or modify
+# it under the terms of the Apache License as published by
+# the Apache Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Ansible Galaxy is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# Apache License for more details.
+#
+# You should have received a copy of the Apache License
+# along with Galaxy.  If not, see <http://www.apache.org/licenses/>.
+
+import base64
+import io
+import tarfile
+import unittest
+
+from galaxy.main.celerytasks import github_fetch
+from galaxy.main.celerytasks.token_pool import RateLimitExhausted
+
+
+def make_tarball(files, prefix='owner-repo-abc123'):
+    fileobj = io.BytesIO()
+    with tarfile.open(fileobj=fileobj, mode='w:gz') as archive:
+        for path, content in files.items():
+            info = tarfile.TarInfo(name='{0}/{1}'.format(prefix, path))
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    fileobj.seek(0)
+    return fileobj
+
+
+class FakeFetcher(object):
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.requested = []
+
+    def get(self, path, params=None, accept=None, allow_404=False):
+        self.requested.append(path)
+        document = self.documents.get((path, accept), self.documents.get(path))
+        if isinstance(document, Exception):
+            raise document
+        return document
+
+    def run(self, calls):
+        results = {}
+        for key, (func, args) in calls.items():
+            try:
+                results[key] = (func(*args), None)
+            except Exception as exc:
+                results[key] = (None, exc)
+        return results
+
+
+class TestReadTarballFiles(unittest.TestCase):
+
+    def test_resolves_present_and_missing_files(self):
+        fileobj = make_tarball({
+            'meta/main.yml': b'galaxy_info: {}\n',
+            'container.yml': b'services: {}\n',
+            'tasks/main.yml': b'- debug: msg=hi\n',
+        })
+        files = github_fetch.read_tarball_files(
+            fileobj, ['meta/main.yml', 'meta.yml', 'container.yml', 'meta/container.yml'])
+        self.assertEqual(files, {
+            'meta/main.yml': b'galaxy_info: {}\n',
+            'meta.yml': None,
+            'container.yml': b'services: {}\n',
+            'meta/container.yml': None,
+        })
+
+
+class TestResolveTree(unittest.TestCase):
+
+    def setUp(self):
+        self.fetcher = FakeFetcher({
+            '/repos/owner/repo/git/blobs/sha-meta': {'content': base64.b64encode(b'galaxy_info: {}\n')},
+        })
+        self.snapshot = github_fetch.RepoSnapshot(self.fetcher, 'owner/repo', mode='tree')
+        self.snapshot.commit = {'sha': 'abc123'}
+
+    def test_only_existing_files_are_fetched(self):
+        tree = {
+            'truncated': False,
+            'tree': [
+                {'path': 'meta', 'type': 'tree', 'sha': 'sha-dir'},
+                {'path': 'meta/main.yml', 'type': 'blob', 'sha': 'sha-meta'},
+                {'path': 'README.md', 'type': 'blob', 'sha': 'sha-readme'},
+            ],
+        }
+        self.snapshot._resolve_tree(tree, ['meta/main.yml', 'meta.yml', 'container.yml'])
+        self.assertEqual(self.snapshot.files, {
+            'meta/main.yml': b'galaxy_info: {}\n',
+            'meta.yml': None,
+            'container.yml': None,
+        })
+        self.assertEqual(self.fetcher.requested, ['/repos/owner/repo/git/blobs/sha-meta'])
+
+    def test_truncated_tree_falls_back_to_contents(self):
+        tree = {'truncated': True, 'tree': []}
+        self.snapshot._resolve_tree(tree, ['meta/main.yml'])
+        self.assertEqual(self.fetcher.requested, ['/repos/owner/repo/contents/meta/main.yml'])
+        self.assertEqual(self.snapshot.files, {'meta/main.yml': None})
+
+
+class FakeGraphQL(object):
+    '''
+    Answers batched repository queries from a dict of repositories keyed
+    by full name, like GitHub's GraphQL endpoint.
+    '''
+
+    def __init__(self, repos):
+        self.repos = repos
+        self.queries = 0
+
+    def graphql_partial(self, query, variables):
+        self.queries += 1
+        data = {}
+        errors = []
+        i = 0
+        while u'o{0}'.format(i) in variables:
+            full_name = u'{0}/{1}'.format(variables[u'o{0}'.format(i)], variables[u'n{0}'.format(i)])
+            alias = u'r{0}'.format(i)
+            data[alias] = self.repos.get(full_name)
+            if data[alias] is None:
+                errors.append({'type': 'NOT_FOUND', 'path': [alias]})
+            i += 1
+        return data, errors
+
+
+def graphql_repo(owner, name, stars=0):
+    return {
+        'name': name,
+        'owner': {'login': owner},
+        'stargazers': {'totalCount': stars},
+        'watchers': {'totalCount': 2},
+        'forkCount': 3,
+        'issues': {'totalCount': 4},
+        'defaultBranchRef': {'name': 'master', 'target': {'oid': 'abc123'}},
+    }
+
+
+class TestFetchRepos(unittest.TestCase):
+
+    def test_build_repos_query(self):
+        query, variables = github_fetch.build_repos_query(['alice/one', 'bob/two'])
+        self.assertIn(u'r0: repository(owner: $o0, name: $n0)', query)
+        self.assertIn(u'r1: repository(owner: $o1, name: $n1)', query)
+        self.assertEqual(variables, {u'o0': 'alice', u'n0': 'one', u'o1': 'bob', u'n1': 'two'})
+
+    def test_batches_and_missing_repos(self):
+        fake = FakeGraphQL({
+            'alice/one': graphql_repo('alice', 'one', stars=10),
+            'bob/two': graphql_repo('carol', 'two-renamed'),
+        })
+        repos = github_fetch.fetch_repos(fake, ['alice/one', 'bob/two', 'bob/gone'], batch_size=2)
+        self.assertEqual(fake.queries, 2)
+        self.assertEqual(repos['alice/one']['stargazers_count'], 10)
+        self.assertEqual(repos['alice/one']['commit'], 'abc123')
+        self.assertEqual((repos['bob/two']['owner'], repos['bob/two']['name']), ('carol', 'two-renamed'))
+        self.assertIsNone(repos['bob/gone'])
+
+
+class TestFetchContentsErrors(unittest.TestCase):
+
+    META = '/repos/owner/repo/contents/meta/main.yml'
+
+    def fetch(self, documents):
+        documents.setdefault('/repos/owner/repo/readme', {'name': 'README.md', 'content': base64.b64encode(b'hi')})
+        fetcher = FakeFetcher(documents)
+        fetcher.graphql = lambda query, variables: {
+            'repository': {'refs': {'nodes': [], 'pageInfo': {'hasNextPage': False}}}}
+        snapshot = github_fetch.RepoSnapshot(fetcher, 'owner/repo', mode='contents')
+        snapshot.branch = 'master'
+        snapshot.fetch_contents(['meta/main.yml'])
+        return snapshot
+
+    def test_404_is_a_missing_file(self):
+        snapshot = self.fetch({self.META: github_fetch.GithubFetchError('Not Found', status=404)})
+        self.assertEqual(snapshot.files, {'meta/main.yml': None})
+
+    def test_server_error_is_raised(self):
+        with self.assertRaises(github_fetch.GithubFetchError) as context:
+            self.fetch({self.META: github_fetch.GithubFetchError('Server Error', status=502)})
+        self.assertEqual(context.exception.status, 502)
+
+    def test_rate_limit_is_raised(self):
+        with self.assertRaises(RateLimitExhausted):
+            self.fetch({self.META: RateLimitExhausted(60)})
+
+    def test_rate_limit_on_readme_is_raised(self):
+        with self.assertRaises(RateLimitExhausted):
+            self.fetch({self.META: None, '/repos/owner/repo/readme': RateLimitExhausted(60)})
+
+    def test_readme_error_is_recorded(self):
+        snapshot = self.fetch({self.META: None,
+                               '/repos/owner/repo/readme': github_fetch.GithubFetchError('Forbidden', status=403)})
+        self.assertIsNone(snapshot.readme)
+        self.assertEqual(snapshot.readme_error, 'Forbidden')
+
+    def test_missing_readme_is_not_an_error(self):
+        snapshot = self.fetch({self.META: None,
+                               '/repos/owner/repo/readme': github_fetch.GithubFetchError('Not Found', status=404)})
+        self.assertIsNone(snapshot.readme)
+        self.assertIsNone(snapshot.readme_error)
+
+
+class TestTags(unittest.TestCase):
+
+    def setUp(self):
+        self.fetcher = FakeFetcher({
+            '/repos/owner/repo/commits/sha-v2': {'commit': {'author': {'date': '2018-02-01T00:00:00Z'}}},
+            '/repos/owner/repo/commits/sha-v3': github_fetch.GithubFetchError('Server Error', status=502),
+        })
+        self.snapshot = github_fetch.RepoSnapshot(self.fetcher, 'owner/repo', mode='contents')
+
+    def test_tag_refs_peel_annotated_tags_and_skip_non_commits(self):
+        nodes = [
+            {'name': 'v1', 'target': {'__typename': 'Commit', 'oid': 'sha-v1',
+                                      'author': {'date': '2018-01-01T00:00:00Z'}}},
+            {'name': 'v2', 'target': {'__typename': 'Tag', 'oid': 'tag-v2',
+                                      'target': {'__typename': 'Commit', 'oid': 'sha-v2', 'author': None}}},
+            {'name': 'tree', 'target': {'__typename': 'Tag', 'oid': 'tag-tree',
+                                        'target': {'__typename': 'Tree', 'oid': 'sha-tree'}}},
+            {'name': 'blob', 'target': {'__typename': 'Blob', 'oid': 'sha-blob'}},
+        ]
+        self.fetcher.graphql = lambda query, variables: {
+            'repository': {'refs': {'nodes': nodes, 'pageInfo': {'hasNextPage': False}}}}
+        tags = dict((tag['name'], tag) for tag in self.snapshot._get_tag_refs())
+        self.assertEqual(tags['v1']['sha'], 'sha-v1')
+        self.assertEqual(tags['v1']['date'].year, 2018)
+        self.assertEqual((tags['v2']['sha'], tags['v2']['date']), ('sha-v2', None))
+        self.assertEqual((tags['tree']['sha'], tags['tree']['date']), (None, None))
+        self.assertEqual((tags['blob']['sha'], tags['blob']['date']), (None, None))
+
+    def test_fetch_tag_dates_skips_non_commits_and_records_errors(self):
+        self.snapshot.tags = [
+            {'name': 'v2', 'sha': 'sha-v2', 'date': None},
+            {'name': 'v3', 'sha': 'sha-v3', 'date': None},
+            {'name': 'tree', 'sha': None, 'date': None},
+        ]
+        dates = self.snapshot.fetch_tag_dates(['v2', 'v3', 'tree'])
+        self.assertEqual(list(dates), ['v2'])
+        self.assertEqual(self.snapshot.tags_error, 'Server Error')
+        self.assertNotIn('/repos/owner/repo/commits/None', self.fetcher.requested)
+
+    def test_fetch_tag_dates_raises_rate_limit(self):
+        self.fetcher.documents['/repos/owner/repo/commits/sha-v2'] = RateLimitExhausted(60)
+        self.snapshot.tags = [{'name': 'v2', 'sha': 'sha-v2', 'date': None}]
+        with self.assertRaises(RateLimitExhausted):
+            self.snapshot.fetch_tag_dates(['v2'])